@@ -1,25 +1,19 @@
 import asyncio
-import concurrent.futures
 import logging
 import re
 from typing import Optional, Tuple, List, Dict
 from redis_session import (
-    get_session_history,
-    append_message,
-    get_inactivity_seconds
+    async_get_session_history,
+    async_append_message,
+    async_get_inactivity_seconds,
+    TurnContext,
+    SessionUnitOfWork
 )
 import json
-from google.genai import Client
-import os
+import llm_gateway
 
 logger = logging.getLogger(__name__)
 
-# Dedicated thread pool for blocking Gemini SDK calls in Agent 3
-_agent3_executor = concurrent.futures.ThreadPoolExecutor(
-    max_workers=20,
-    thread_name_prefix="agent3-gemini"
-)
-
 # If user has been inactive for 10+ minutes, auto-reset (likely new conversation)
 INACTIVITY_THRESHOLD = 600  # seconds
 # Prevent infinite clarification loops
@@ -27,15 +21,6 @@ MAX_CLARIFICATIONS = 2
 # Timeout for Gemini SDK calls (seconds)
 AGENT3_GEMINI_TIMEOUT = 15
 
-# Module-level Gemini client (avoids re-creation per call)
-_gemini_client: Optional[Client] = None
-
-def _get_client() -> Client:
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _gemini_client
-
 
 # ─── Helper functions (accept pre-fetched history — zero Redis calls) ───
 
@@ -81,17 +66,23 @@ def _user_denied_shift(user_message: str) -> bool:
 
 async def agent3_intent_guard(
     session_id: str,
-    user_message: str
+    user_message: str,
+    turn_ctx: Optional[TurnContext] = None,
+    uow: Optional[SessionUnitOfWork] = None
 ) -> Tuple[str, Optional[str]]:
     """
     Returns:
         ("CONTINUE", None)
         ("ASK_CLARIFICATION", message)
         ("RESET", None)
+
+    When `turn_ctx` is given, history and inactivity come from the turn
+    snapshot and no Redis reads are made. When `uow` is given, the
+    clarification entry is buffered into the turn's unit of work.
     """
 
-    # ★ Single Redis fetch — all helpers reuse this list
-    history = get_session_history(session_id)
+    # ★ Single Redis fetch (or none with a turn snapshot) — all helpers reuse this list
+    history = turn_ctx.history if turn_ctx else await async_get_session_history(session_id)
 
     existing_intent = _get_existing_intent(history)
 
@@ -100,7 +91,10 @@ async def agent3_intent_guard(
         return "RESET", None
 
     # ── 2. TIME GAP CHECK — auto-reset stale sessions ──
-    inactivity = get_inactivity_seconds(session_id)
+    if turn_ctx:
+        inactivity = turn_ctx.inactivity_seconds
+    else:
+        inactivity = await async_get_inactivity_seconds(session_id)
     if inactivity is not None and inactivity >= INACTIVITY_THRESHOLD:
         logger.info(
             f"[AGENT3] Inactivity gap of {inactivity:.0f}s "
@@ -130,14 +124,14 @@ async def agent3_intent_guard(
 
     # ── 6. LLM-based contextual check ──
     # Reuse the already-fetched history (no extra Redis call)
+    # Compacted older turns (bounded history) are passed through as-is
     history_text = "\n".join(
-        f"{m['role']}: {m['content']}"
+        f"{m['role']}: {m['content']}" if m["role"] != "summary"
+        else f"(earlier conversation, summarised)\n{m['content']}"
         for m in history
-        if m["role"] in ("user", "assistant")
+        if m["role"] in ("user", "assistant", "summary")
     )
 
-    client = _get_client()
-
     prompt = f"""
 You are monitoring a professional task-management conversation.
 
@@ -175,15 +169,10 @@ OR
 """
 
     try:
-        loop = asyncio.get_running_loop()
-        response = await asyncio.wait_for(
-            loop.run_in_executor(
-                _agent3_executor,
-                lambda: client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=prompt
-                )
-            ),
+        response = await llm_gateway.generate(
+            prompt,
+            label="AGENT3_INTENT_GUARD",
+            priority=llm_gateway.PRIORITY_GUARD,
             timeout=AGENT3_GEMINI_TIMEOUT
         )
 
@@ -208,15 +197,21 @@ OR
             clarification = parsed.get("message", "").strip()
 
             if clarification:
-                append_message(
-                    session_id,
-                    "assistant",
-                    "[CLARIFY_SHIFT] " + clarification
-                )
+                if uow:
+                    uow.append("assistant", "[CLARIFY_SHIFT] " + clarification)
+                else:
+                    await async_append_message(
+                        session_id,
+                        "assistant",
+                        "[CLARIFY_SHIFT] " + clarification
+                    )
                 return "ASK_CLARIFICATION", clarification
 
     except asyncio.TimeoutError:
         logger.error(f"[AGENT3_TIMEOUT] Gemini call timed out after {AGENT3_GEMINI_TIMEOUT}s")
+    except llm_gateway.LLMOverloaded:
+        # Under load the guard is skipped rather than delaying the turn
+        logger.warning("[AGENT3_SHED] Gateway saturated — skipping topic-shift check")
     except Exception as e:
         logger.warning(f"[AGENT3_ERROR] {str(e)}")
 
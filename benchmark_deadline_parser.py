@@ -0,0 +1,65 @@
+"""
+Benchmark: local deadline extraction vs labelled task messages.
+
+Every message is resolved against a fixed "now" (Sun 18 Oct 2026, 11:00
+IST). Reports how many deadlines were read without Gemini (coverage), how
+many of those were right (precision), every wrong answer and the mean
+parse time.
+
+Run:
+    python benchmark_deadline_parser.py
+Exits non-zero on any wrong deadline.
+"""
+
+import sys
+import time
+import datetime
+
+from deadline_parser import extract_deadline
+
+NOW = datetime.datetime(2026, 10, 18, 11, 0)
+
+# (message, expected deadline) — None means the message should go to Gemini
+CASES = [
+    ("assign report to Rahul by 7pm", "2026-10-18T19:00:00"),
+    ("send report tomorrow by 5pm", "2026-10-19T17:00:00"),
+    ("by friday", "2026-10-23T18:00:00"),
+    ("tomorrow 5pm", "2026-10-19T17:00:00"),
+    ("tomorrow at 5pm", "2026-10-19T17:00:00"),
+    ("EOD", "2026-10-18T18:00:00"),
+    ("in 2 hours", "2026-10-18T13:00:00"),
+    ("rahul ko report kal 5pm tak", "2026-10-19T17:00:00"),
+    ("assign rahul 3 reports by eod", "2026-10-18T18:00:00"),
+    ("assign rahul the report, deadline 20th nov", "2026-11-20T18:00:00"),
+    ("priya should update the sheet before 4pm", "2026-10-18T16:00:00"),
+    # Dates / times that belong to the task, not the deadline
+    ("assign rahul the 5/6 items by 5pm", "2026-10-18T17:00:00"),
+    ("assign rahul the 2pm meeting notes", None),
+    ("prepare the 20th nov board deck", None),
+    ("assign rahul the report", None),
+    # Anchored but not something the rules pin down
+    ("kal subah 10 baje tak", None),
+    ("assign priya slides by tomorrow evening", None),
+    ("finish it by next week", None),
+    ("asap", None),
+]
+
+
+def main():
+    start = time.perf_counter()
+    results = [(text, expected, extract_deadline(text, NOW)) for text, expected in CASES]
+    elapsed = time.perf_counter() - start
+
+    answered = [r for r in results if r[2] is not None]
+    wrong = [r for r in results if r[2] != r[1]]
+    print("TASK_ASSIGNMENT deadline")
+    print(f"  coverage:  {len(answered)}/{len(results)} read without Gemini")
+    print(f"  correct:   {len(results) - len(wrong)}/{len(results)}")
+    print(f"  mean parse time: {elapsed / len(results) * 1e6:.1f} µs")
+    for text, expected, got in wrong:
+        print(f"  WRONG  {text!r}: expected {expected}, got {got}")
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: session history entry formats (legacy "json" vs "compact").
+
+Builds a representative session (task-assignment back-and-forth with
+Hinglish replies and slot snapshots) and reports, per format:
+  - encoded bytes per session
+  - decode time per session (what every turn pays in _parse_history_raw)
+  - Redis MEMORY USAGE of the session list (only with --redis, needs REDIS_HOST)
+
+Run:
+    python benchmark_history_format.py
+    python benchmark_history_format.py --redis
+"""
+
+import sys
+import timeit
+from datetime import datetime
+
+from redis_session import (
+    IST,
+    HISTORY_SERIALIZERS,
+    _parse_history_raw,
+    redis_client,
+)
+
+SAMPLE_TURNS = [
+    ("user", "Rahul ko kal tak monthly sales report bana ke bhejna hai"),
+    ("system", "INTENT_SET: TASK_ASSIGNMENT"),
+    ("slots", {"assignee": "Rahul", "task_name": "monthly sales report"}),
+    ("assistant", "[CLARIFY] What is the deadline?"),
+    ("user", "kal shaam 6 baje"),
+    ("slots", {"assignee": "Rahul", "task_name": "monthly sales report", "deadline": "2026-02-16T18:00:00"}),
+    ("assistant", "[TASK_CONFIRM] Please confirm the task details:\n\n*Task:* monthly sales report\n"
+                  "*Assigned to:* Rahul\n*Deadline:* 2026-02-16T18:00:00\n\nShould I create this task?"),
+    ("user", "haan theek hai"),
+]
+
+
+def build_session(serializer, repeat: int = 3) -> list:
+    now = datetime.now(IST)
+    return [
+        serializer.encode(role, content, now)
+        for _ in range(repeat)
+        for role, content in SAMPLE_TURNS
+    ]
+
+
+def redis_memory(entries: list, key: str) -> int:
+    redis_client.delete(key)
+    redis_client.rpush(key, *entries)
+    try:
+        return redis_client.memory_usage(key) or 0
+    finally:
+        redis_client.delete(key)
+
+
+def main():
+    use_redis = "--redis" in sys.argv
+    print(f"{'format':<10}{'entries':>9}{'bytes/session':>15}{'decode us/session':>20}"
+          f"{'redis bytes':>14}")
+
+    for name, serializer in HISTORY_SERIALIZERS.items():
+        entries = build_session(serializer)
+        size = sum(len(e.encode("utf-8")) for e in entries)
+        runs = 2000
+        seconds = timeit.timeit(lambda: _parse_history_raw(entries), number=runs)
+        decode_us = seconds / runs * 1e6
+        memory = redis_memory(entries, f"bench_history:{name}") if use_redis else "-"
+        print(f"{name:<10}{len(entries):>9}{size:>15}{decode_us:>20.1f}{memory:>14}")
+
+
+if __name__ == "__main__":
+    main()
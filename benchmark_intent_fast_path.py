@@ -0,0 +1,72 @@
+"""
+Benchmark: deterministic intent fast path vs the labelled fixture set.
+
+For every message in intent_fixtures.jsonl, runs fast_path_intent() (no
+Gemini call) and reports:
+  - coverage  — share of messages the rules answered (Gemini calls saved)
+  - precision — share of answered messages that match the label
+  - per-intent breakdown and every wrong answer
+
+Run:
+    python benchmark_intent_fast_path.py
+    python benchmark_intent_fast_path.py --show-fallthrough
+Exits non-zero when precision drops below TARGET_PRECISION.
+"""
+
+import sys
+import json
+from collections import defaultdict
+
+from intent_classifier import fast_path_intent
+
+FIXTURES = "intent_fixtures.jsonl"
+TARGET_PRECISION = 0.98
+
+
+def load_fixtures(path: str = FIXTURES) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    show_fallthrough = "--show-fallthrough" in sys.argv
+    rows = load_fixtures()
+    answered = correct = 0
+    per_intent = defaultdict(lambda: [0, 0, 0])  # total, answered, correct
+    wrong, fallthrough = [], []
+
+    for row in rows:
+        label = row.get("intent")
+        stats = per_intent[label or "null"]
+        stats[0] += 1
+        result = fast_path_intent(row["text"], row.get("has_document", False))
+        if result is None:
+            fallthrough.append(row)
+            continue
+        answered += 1
+        stats[1] += 1
+        if result[0] == label:
+            correct += 1
+            stats[2] += 1
+        else:
+            wrong.append((row, result[0]))
+
+    print(f"{'intent':<32}{'total':>7}{'answered':>10}{'correct':>9}")
+    for intent, (total, ans, ok) in sorted(per_intent.items()):
+        print(f"{intent:<32}{total:>7}{ans:>10}{ok:>9}")
+
+    precision = correct / answered if answered else 1.0
+    print(f"\ncoverage:  {answered}/{len(rows)} ({answered / len(rows):.0%}) answered without Gemini")
+    print(f"precision: {correct}/{answered} ({precision:.1%})")
+
+    for row, got in wrong:
+        print(f"  WRONG  {row['text']!r}: expected {row.get('intent')}, got {got}")
+    if show_fallthrough:
+        for row in fallthrough:
+            print(f"  GEMINI {row['text']!r} ({row.get('intent')})")
+
+    sys.exit(0 if precision >= TARGET_PRECISION else 1)
+
+
+if __name__ == "__main__":
+    main()
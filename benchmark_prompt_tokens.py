@@ -0,0 +1,36 @@
+"""
+Benchmark: real token counts of the registered static prompts.
+
+Counts every prompt registered with llm_gateway.register_static_prompt()
+with the Gemini count_tokens API and compares it to the model's minimum
+for an explicit context cache. The gateway sends these prompts as
+system_instruction; explicit caching only pays off for prompts above the
+minimum, so re-run this before bringing cached_content back.
+
+Run (needs GEMINI_API_KEY and network access):
+    python benchmark_prompt_tokens.py [min_cacheable_tokens]
+"""
+
+import sys
+
+import llm_gateway
+import engine  # noqa: F401 — registers the engine and intent-classifier prompts
+
+# Explicit-cache minimum for gemini-2.0-flash
+MIN_CACHEABLE_TOKENS = 4096
+
+
+def main():
+    minimum = int(sys.argv[1]) if len(sys.argv) > 1 else MIN_CACHEABLE_TOKENS
+    client = llm_gateway.get_client()
+    cacheable = 0
+    print(f"{llm_gateway.DEFAULT_MODEL} — explicit cache minimum {minimum} tokens")
+    for name, text in sorted(llm_gateway._static_prompts.items()):
+        tokens = client.models.count_tokens(model=llm_gateway.DEFAULT_MODEL, contents=text).total_tokens
+        cacheable += tokens >= minimum
+        print(f"  {name:36s} {tokens:6d} tokens  {'cacheable' if tokens >= minimum else 'below minimum'}")
+    print(f"  {cacheable}/{len(llm_gateway._static_prompts)} prompts could use an explicit cache")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: local YES/NO and OWN/TEAM reply parsing vs labelled replies.
+
+Reports, per question, how many replies were answered without Gemini
+(coverage), how many of those were right (precision), every wrong answer
+and the mean parse time.
+
+Run:
+    python benchmark_reply_parser.py
+Exits non-zero when precision drops below TARGET_PRECISION or a reply
+labelled None (questions, qualified answers) is answered locally.
+"""
+
+import sys
+import time
+
+from reply_parser import parse_confirmation, parse_pending_scope
+
+TARGET_PRECISION = 0.98
+
+# (reply, expected label) — None means the reply should go to Gemini
+CONFIRM_CASES = [
+    ("yes", "YES"), ("Yesss", "YES"), ("haan", "YES"), ("ha", "YES"), ("hanji", "YES"),
+    ("ji haan", "YES"), ("ok", "YES"), ("okk 👍", "YES"), ("👍🏽", "YES"), ("✅", "YES"),
+    ("sure", "YES"), ("go ahead", "YES"), ("do it", "YES"), ("correct", "YES"),
+    ("sahi hai", "YES"), ("theek hai bhai", "YES"), ("kar do", "YES"), ("kar do na", "YES"),
+    ("bana do", "YES"), ("assign karo", "YES"), ("confrim", "YES"), ("yes please", "YES"),
+    ("no problem", "YES"), ("koi baat nahi", "YES"), ("perfect", "YES"), ("k", "YES"),
+    ("no", "NO"), ("nope", "NO"), ("nahi", "NO"), ("nhi", "NO"), ("na", "NO"),
+    ("cancel", "NO"), ("cancle", "NO"), ("mat karo", "NO"), ("ruk", "NO"), ("wrong", "NO"),
+    ("galat", "NO"), ("not correct", "NO"), ("don't assign", "NO"), ("❌", "NO"),
+    ("👎", "NO"), ("no, cancel it", "NO"), ("rehne do", "NO"),
+    ("yes but change the deadline to 6pm", None), ("assign mat karo", None),
+    ("wait", None), ("who is rahul?", None), ("not sure", None), ("theek hai but", None),
+    ("not definitely", None), ("ok but tomorrow", None),
+    ("sure?", None), ("right?", None), ("is it correct?", None), ("is it correct", None),
+    ("kya ye sahi hai", None), ("no?", None), ("ok ?", None),
+]
+
+SCOPE_CASES = [
+    ("own", "OWN"), ("my own", "OWN"), ("mine", "OWN"), ("my tasks", "OWN"),
+    ("mere wale", "OWN"), ("apne", "OWN"), ("mujhe", "OWN"), ("first one", "OWN"),
+    ("team", "TEAM"), ("my team", "TEAM"), ("mere team ke", "TEAM"), ("team members", "TEAM"),
+    ("employees", "TEAM"), ("staff ke pending", "TEAM"), ("sabka", "TEAM"),
+    ("their tasks", "TEAM"), ("not mine, team", "TEAM"), ("show me team tasks", "TEAM"),
+    ("both", None), ("whatever", None),
+]
+
+
+def run(name, parse, cases) -> bool:
+    answered = correct = 0
+    wrong = []
+    start = time.perf_counter()
+    results = [(text, expected, parse(text)) for text, expected in cases]
+    elapsed = time.perf_counter() - start
+
+    for text, expected, result in results:
+        if result is None:
+            continue
+        answered += 1
+        if result[0] == expected:
+            correct += 1
+        else:
+            wrong.append((text, expected, result))
+
+    precision = correct / answered if answered else 1.0
+    print(f"{name}")
+    print(f"  coverage:  {answered}/{len(cases)} answered without Gemini")
+    print(f"  precision: {correct}/{answered} ({precision:.1%})")
+    print(f"  mean parse time: {elapsed / len(cases) * 1e6:.1f} µs")
+    for text, expected, result in wrong:
+        print(f"  WRONG  {text!r}: expected {expected}, got {result[0]} ({result[1]:.2f})")
+    must_defer = any(expected is None for _, expected, _ in wrong)
+    return precision >= TARGET_PRECISION and not must_defer
+
+
+def main():
+    ok = run("TASK_CONFIRM (YES/NO)", parse_confirmation, CONFIRM_CASES)
+    ok = run("PENDING_TASKS_AMBIGUOUS (OWN/TEAM)", parse_pending_scope, SCOPE_CASES) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark: rule-based slot pre-pass vs labelled messages.
+
+Every case lists the slots pre_extract_slots() must return for the
+message — a slot it should leave to Agent 2 is simply absent. Reports
+the share of cases extracted exactly, every mismatch and the mean
+extraction time.
+
+Run:
+    python benchmark_slot_extractor.py
+Exits non-zero on any mismatch.
+"""
+
+import sys
+import time
+
+from slot_extractor import pre_extract_slots
+
+# (intent, message, expected slots)
+CASES = [
+    ("ADD_USER", "add user Rahul Sharma 9876543210", {"name": "Rahul Sharma", "mobile": "9876543210"}),
+    ("ADD_USER", "add user rahul as manager 9876543210", {"name": "rahul", "mobile": "9876543210"}),
+    ("ADD_USER", "add priya as hr", {"name": "priya"}),
+    ("ADD_USER", "add rahul to my team, 98765 43210", {"name": "rahul", "mobile": "9876543210"}),
+    ("ADD_USER", "add new employee Neha Gupta for sales", {"name": "Neha Gupta"}),
+    ("ADD_USER", "name: Amit, mobile +91 98765-43210, amit@acme.com",
+     {"name": "Amit", "mobile": "9876543210", "email": "amit@acme.com"}),
+    ("ADD_USER", "add user as manager", {}),
+    ("ADD_USER", "add hr", {}),
+    ("DELETE_USER", "remove rahul from team", {"name": "rahul"}),
+    ("DELETE_USER", "delete user 9876543210", {"mobile": "9876543210"}),
+    ("UPDATE_TASK_STATUS", "task 1042 done", {"task_id": "1042", "status": "Closed"}),
+    ("UPDATE_TASK_STATUS", "task 12 done - client approved",
+     {"task_id": "12", "status": "Closed", "remark": "Client approved"}),
+    ("UPDATE_TASK_STATUS", "task 7 not done yet", {"task_id": "7"}),
+    ("UPDATE_TASK_STATUS", "reopen task 15", {"task_id": "15", "status": "Reopened"}),
+    ("UPDATE_TASK_STATUS", "close task 12, reopen task 13", {}),
+    ("UPDATE_TASK_STATUS", "task 12 and task 13 done", {}),
+    ("UPDATE_TASK_STATUS", "reopen the closed task 9", {"task_id": "9"}),
+]
+
+
+def main():
+    start = time.perf_counter()
+    results = [(intent, text, expected, pre_extract_slots(intent, text)) for intent, text, expected in CASES]
+    elapsed = time.perf_counter() - start
+
+    wrong = [(intent, text, expected, got) for intent, text, expected, got in results if got != expected]
+    print("Slot pre-pass")
+    print(f"  exact:     {len(results) - len(wrong)}/{len(results)}")
+    print(f"  mean extraction time: {elapsed / len(results) * 1e6:.1f} µs")
+    for intent, text, expected, got in wrong:
+        print(f"  WRONG  {intent} {text!r}: expected {expected}, got {got}")
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
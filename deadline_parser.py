@@ -0,0 +1,264 @@
+"""
+Deterministic deadline resolution (IST) for TASK_ASSIGNMENT.
+
+Turning "7pm", "tomorrow 3pm", "EOD" or "by Friday" into ISO 8601 used to
+be left to Gemini through the DEADLINE RULES prompt. The same rules are
+applied here:
+  - a bare time is today, or tomorrow if it has already passed
+  - "EOD" / "end of day" is 18:00 (rolled the same way)
+  - a day without a time ("tomorrow", "by Friday", "20 Feb") is that day at 18:00
+  - "in 2 hours", "3 ghante mein" are relative to now
+  - "ASAP", "when done", "urgently"... are NOT deadlines
+
+Calendar dates ("20th Feb", "Feb 20 2027", "20/02") are handed to
+dateparser (DMY order, future-preferring); ISO dates work without it.
+
+resolve_deadline() returns None whenever the text is ambiguous — two
+different times, a 12-hour time without am/pm, "10 baje" / "evening",
+"next week", a date in the past — and the caller falls back to Gemini.
+
+extract_deadline() picks the deadline out of a whole task message. A date
+or time elsewhere in it can be part of the task ("the 5/6 items", "the
+2pm meeting notes"), so only the phrase tied to a by / before / due /
+deadline / till / until / tak anchor is read — or the message as a whole
+when it is nothing but a deadline ("tomorrow 5pm").
+"""
+
+import re
+import datetime
+import logging
+from datetime import timezone, timedelta
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+EOD_HOUR = 18
+
+_NON_DEADLINE_RE = re.compile(
+    r"\b(asap|as soon as possible|at the earliest|urgent(ly)?|immediately|soon|quickly|jaldi"
+    r"|(once|when|whenever|after) (it'?s |it is |you are |you're )?(done|complete|completed|finished|possible))\b"
+)
+
+_AMPM_RE = re.compile(r"(?<![\d:.])(\d{1,2})(?:[:.]([0-5]\d))?\s*([ap])\.?\s?m\b\.?")
+_24H_RE = re.compile(r"(?<![\d:.])([01]?\d|2[0-3]):([0-5]\d)(?![\d:])(?!\s*[ap]\.?\s?m\b)")
+_NOON_RE = re.compile(r"\b(noon|midday)\b")
+_EOD_RE = re.compile(r"\b(eod|end of (the )?day|close of business|cob)\b")
+
+_DAY_WORDS = [
+    (re.compile(r"\b(day after tomorrow|day after tmrw|parso|parson)\b"), 2),
+    (re.compile(r"\b(tomorrow|tomorow|tommorow|tommorrow|tmrw|tmr|tmrrw|kal)\b"), 1),
+    (re.compile(r"\b(today|aaj)\b"), 0),
+]
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_WEEKDAY_RE = re.compile(r"\b(next\s+)?(" + "|".join(_WEEKDAYS) + r")\b")
+_VAGUE_RE = re.compile(r"\b(next|this|coming) (week|month)\b|\bend of (the )?(week|month)\b|\beow\b")
+# A time of day this parser can't pin down — "10 baje", "at 5", "subah" —
+# must not fall back to the 18:00 default for a bare day
+_UNPARSED_TIME_RE = re.compile(
+    r"\b\d{1,2}\s*(baje|bje|o'?clock|oclock)\b|\bat \d{1,2}\b(?![:.]\d|\s*[ap]\.?\s?m\b)"
+    r"|\b(morning|afternoon|evening|night|tonight|subah|dopahar|shaam|sham|raat)\b"
+)
+
+_NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+_RELATIVE_RE = re.compile(
+    r"\bin (\d+|an?|one|two|three|four|five|six) (minutes?|mins?|hours?|hrs?|days?)\b"
+    r"|\b(\d+) (ghante|ghanta|minute|min|din) (mein|me|main)\b"
+    r"|\bin half an hour\b"
+)
+
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})(?:[t ](\d{2}):(\d{2})(?::(\d{2}))?)?\b")
+_CALENDAR_RE = re.compile(
+    r"\b\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r"(?:,?\s+\d{4})?\b"
+    r"|\b" + _MONTH + r"\s+\d{1,2}(?:st|nd|rd|th)?\b(?:,?\s+\d{4})?"
+    r"|(?<![\d:./-])\d{1,2}/\d{1,2}(?:/\d{2,4})?(?![\d/])"
+)
+
+# Deadline anchors: English ones come before the date ("by friday"),
+# Hindi "tak" after it ("kal 5pm tak")
+_ANCHOR_RE = re.compile(r"\b(by|before|due|deadline|till|until|latest|tak)\b")
+_CLAUSE_END_RE = re.compile(r"[;\n]|\b(and|aur|but|then)\b")
+# Words a bare deadline reply may carry besides the date/time itself
+_DEADLINE_FILLERS = {
+    "by", "before", "due", "deadline", "till", "until", "latest", "tak", "at", "on", "the", "of",
+    "is", "in", "please", "pls", "plz", "sir", "ji", "max", "maximum", "hai",
+}
+
+_DATEPARSER_SETTINGS = {
+    "DATE_ORDER": "DMY",
+    "PREFER_DATES_FROM": "future",
+    "REQUIRE_PARTS": ["day", "month"],
+}
+
+
+def _local_now(now: Optional[datetime.datetime]) -> datetime.datetime:
+    """Naive IST wall-clock time (the format deadlines are stored in)."""
+    now = now or datetime.datetime.now(IST)
+    if now.tzinfo is not None:
+        now = now.astimezone(IST).replace(tzinfo=None)
+    return now.replace(second=0, microsecond=0)
+
+
+def _parse_calendar(span: str, now: datetime.datetime) -> Optional[datetime.date]:
+    try:
+        import dateparser
+    except ImportError:
+        return None
+    parsed = dateparser.parse(span, languages=["en"], settings={**_DATEPARSER_SETTINGS, "RELATIVE_BASE": now})
+    return parsed.date() if parsed else None
+
+
+def is_non_deadline(text: str) -> bool:
+    """True for "ASAP", "when done", "urgently"... — instructions, not deadlines."""
+    return bool(_NON_DEADLINE_RE.search((text or "").lower()))
+
+
+def resolve_deadline(text: str, now: Optional[datetime.datetime] = None) -> Optional[str]:
+    """
+    ISO 8601 deadline ("YYYY-MM-DDTHH:MM:SS", IST wall time) stated in
+    `text`, or None when there is none or it is ambiguous.
+    """
+    text = (text or "").lower()
+    if not text or _VAGUE_RE.search(text) or _UNPARSED_TIME_RE.search(text):
+        return None
+    now = _local_now(now)
+
+    days: List[datetime.date] = []
+    times: List[datetime.time] = []
+
+    # Relative offsets stand alone — mixed with anything else is ambiguous
+    relative = _RELATIVE_RE.search(text)
+    if relative:
+        if relative.group(0) == "in half an hour":
+            delta = timedelta(minutes=30)
+        else:
+            count, unit = (relative.group(1), relative.group(2)) if relative.group(1) else (relative.group(3), relative.group(4))
+            count = int(count) if count.isdigit() else _NUMBER_WORDS[count]
+            if unit.startswith(("min", "minute")):
+                delta = timedelta(minutes=count)
+            elif unit.startswith(("h", "ghant")):
+                delta = timedelta(hours=count)
+            else:
+                delta = timedelta(days=count)
+        rest = text[:relative.start()] + text[relative.end():]
+        if _AMPM_RE.search(rest) or _24H_RE.search(rest) or _EOD_RE.search(rest) or _WEEKDAY_RE.search(rest):
+            return None
+        return (now + delta).isoformat()
+
+    for match in _ISO_RE.finditer(text):
+        year, month, day, hour, minute, second = match.groups()
+        try:
+            days.append(datetime.date(int(year), int(month), int(day)))
+            if hour is not None:
+                times.append(datetime.time(int(hour), int(minute), int(second or 0)))
+        except ValueError:
+            return None
+    text = _ISO_RE.sub(" ", text)
+
+    for match in _CALENDAR_RE.finditer(text):
+        parsed = _parse_calendar(match.group(0), now)
+        if parsed is None:
+            return None
+        days.append(parsed)
+    text = _CALENDAR_RE.sub(" ", text)
+
+    for pattern, offset in _DAY_WORDS:
+        if pattern.search(text):
+            days.append(now.date() + timedelta(days=offset))
+            text = pattern.sub(" ", text)
+
+    for match in _WEEKDAY_RE.finditer(text):
+        if match.group(1):
+            return None  # "next friday" — this week's or next week's?
+        ahead = (_WEEKDAYS.index(match.group(2)) - now.weekday()) % 7
+        days.append(now.date() + timedelta(days=ahead))
+
+    for match in _AMPM_RE.finditer(text):
+        hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "p" else 0)
+        times.append(datetime.time(hour, minute))
+    text = _AMPM_RE.sub(" ", text)
+
+    for match in _24H_RE.finditer(text):
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour <= 12:
+            return None  # "7:30" — morning or evening?
+        times.append(datetime.time(hour, minute))
+
+    if _NOON_RE.search(text):
+        times.append(datetime.time(12, 0))
+    if _EOD_RE.search(text):
+        times.append(datetime.time(EOD_HOUR, 0))
+
+    if len(set(days)) > 1 or len(set(times)) > 1:
+        return None
+    if not days and not times:
+        return None
+
+    if days:
+        deadline = datetime.datetime.combine(days[0], times[0] if times else datetime.time(EOD_HOUR, 0))
+        # An explicit day in the past ("today 9am" at 10am) is a mistake, not a roll-over
+        return deadline.isoformat() if deadline > now else None
+
+    deadline = datetime.datetime.combine(now.date(), times[0])
+    if deadline <= now:
+        deadline += timedelta(days=1)
+    return deadline.isoformat()
+
+
+# Any single date / time expression the resolver reads, matched at the end of a span
+_TRAILING_PART_RE = re.compile(
+    r"(?:" + "|".join(
+        [p.pattern for p, _ in _DAY_WORDS]
+        + [_WEEKDAY_RE.pattern, _CALENDAR_RE.pattern, _ISO_RE.pattern, _AMPM_RE.pattern, _24H_RE.pattern,
+           _NOON_RE.pattern, _EOD_RE.pattern, _RELATIVE_RE.pattern, _UNPARSED_TIME_RE.pattern, _VAGUE_RE.pattern]
+    ) + r")[\s,]*$"
+)
+
+
+def _leading_deadline(text: str) -> int:
+    """Start of the run of date/time expressions that `text` ends with."""
+    start = len(text)
+    while True:
+        part = _TRAILING_PART_RE.search(text[:start])
+        if not part or part.start() == start:
+            return start
+        start = part.start()
+        # "tomorrow at 5pm" — connective words inside the run
+        head = text[:start].rstrip()
+        for word in ("at", "on", "of", "the"):
+            if head.endswith(" " + word) or head == word:
+                start = len(head) - len(word)
+                break
+
+
+def extract_deadline(text: str, now: Optional[datetime.datetime] = None) -> Optional[str]:
+    """
+    The deadline of a task message (ISO 8601, IST), read only from the
+    anchored phrase or a message that is nothing but a deadline, else None.
+    """
+    text = (text or "").lower().strip()
+    if not text:
+        return None
+
+    start = _leading_deadline(text)
+    if start < len(text) and all(w in _DEADLINE_FILLERS for w in re.findall(r"[a-z]+", text[:start])):
+        return resolve_deadline(text, now)  # the whole reply is the deadline
+
+    spans = []
+    for anchor in _ANCHOR_RE.finditer(text):
+        if anchor.group(1) == "tak":
+            head = text[:anchor.start()].rstrip()
+            spans.append(head[_leading_deadline(head):])
+        else:
+            tail = text[anchor.end():]
+            clause_end = _CLAUSE_END_RE.search(tail)
+            # "tomorrow by 5pm" — the day may come just before the anchor
+            head = text[:anchor.start()].rstrip()
+            spans.append(head[_leading_deadline(head):] + " " + (tail[:clause_end.start()] if clause_end else tail))
+    spans = [span.strip() for span in spans if span.strip()]
+    return resolve_deadline(" ".join(spans), now) if spans else None
+
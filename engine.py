@@ -1,40 +1,39 @@
 import os
-from pymongo import MongoClient
-import certifi
 import json
 import datetime
 import base64
-from google.genai import Client
 import httpx
 import time
 import uuid
 import logging
 import re
-import concurrent.futures
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union, Tuple
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from send_message import send_whatsapp_message
 from redis_session import (
-    get_or_create_session,
-    get_or_create_session_with_history,
-    append_message,
-    set_pending_document,
-    get_pending_document,
-    set_pending_document_state,
-    get_pending_document_state,
-    clear_pending_document_state,
-    get_session_history,
-    end_session_complete
+    async_rotate_session,
+    load_turn_context,
+    SessionUnitOfWork
 )
-from intent_classifier import intent_classifier, async_intent_classifier
-from user_resolver import (
-    resolve_user_by_phone,
-    get_all_subordinates,
+from intent_classifier import intent_classifier, async_intent_classifier, async_classify_and_extract, SLOT_FIELDS
+from user_resolver import get_top_manager_phone
+import user_repository
+import llm_gateway
+from google.genai import types
+from user_directory import (
+    load_team,
+    get_team_for_user,
+    resolve_role,
     is_subordinate,
-    get_top_manager_phone,
-    get_hierarchy_chain
+    invalidate_user_caches,
+    get_name_index,
+    get_org_graph
 )
+from name_index import NameIndex
+from reply_parser import parse_confirmation, parse_pending_scope
+from deadline_parser import is_non_deadline
+from slot_extractor import pre_extract_slots, record_agent2, slot_prefill_stats
 from functools import lru_cache
 from agent3 import agent3_intent_guard
 import asyncio 
@@ -54,11 +53,8 @@ SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 
 REDIRECT_URI = os.getenv("REDIRECT_URI", "https://aitask.appsavy.com/")
 
-# Initialize MongoDB Connection
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI, tlsCAFile=certifi.where()) if MONGO_URI else None
-db = client['ai_task_manager'] if client is not None else None
-users_collection = db['users'] if db is not None else None
+# MongoDB access goes through the async repository (user_repository.py)
+users_collection = user_repository.async_users_collection
 
 APPSAVY_BASE_URL = "https://configapps.appsavy.com/api/AppsavyRestService"
 
@@ -68,12 +64,6 @@ _http_client = httpx.AsyncClient(
     limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
 )
 
-# Dedicated thread pool for blocking Gemini SDK calls (default pool is too small)
-_gemini_executor = concurrent.futures.ThreadPoolExecutor(
-    max_workers=20,
-    thread_name_prefix="gemini"
-)
-
 API_CONFIGS = {
     "ADD_DELETE_USER":{
         "url": f"{APPSAVY_BASE_URL}/PushdataJSONClient",
@@ -326,29 +316,32 @@ class AddDeleteUserRequest(BaseModel):
     MOBILE_NUMBER: str
     NAME: str
     
-# Module-level Gemini client — avoids re-creation per call
-_gemini_client: Client | None = None
-
-def _get_gemini_client() -> Client:
-    global _gemini_client
-    if _gemini_client is None:
-        _gemini_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _gemini_client
-
-async def run_gemini_extractor(prompt: str, message: str):
-    gemini_client = _get_gemini_client()
-    loop = asyncio.get_running_loop()
-
-    def _blocking_gemini():
-        return gemini_client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=f"{prompt}\n\nUSER MESSAGE:\n{message}"
+async def run_gemini_extractor(
+    prompt: str,
+    message: str,
+    priority: int = llm_gateway.PRIORITY_SLOT_FILL,
+    static: Optional[str] = None,
+    schema: Optional[types.Schema] = None
+):
+    # Native async call through the shared gateway (cancellable on timeout).
+    # `static` names a registered fixed prompt sent as a cached prefix;
+    # `prompt` is then only the per-call part. With `schema` Gemini is
+    # constrained to JSON of that shape (structured output).
+    config = None
+    if schema is not None:
+        config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=schema
         )
 
     async def _gemini_call():
-        return await asyncio.wait_for(
-            loop.run_in_executor(_gemini_executor, _blocking_gemini),
-            timeout=GEMINI_TIMEOUT
+        return await llm_gateway.generate(
+            f"{prompt}\n\nUSER MESSAGE:\n{message}".lstrip(),
+            label=f"AGENT_2_{static.upper()}" if static else "AGENT_2_EXTRACTOR",
+            priority=priority,
+            timeout=GEMINI_TIMEOUT,
+            config=config,
+            static=static
         )
 
     try:
@@ -364,14 +357,7 @@ async def run_gemini_extractor(prompt: str, message: str):
         raise ValueError("Gemini returned empty response")
 
     # 🔒 Safe extraction
-    text = None
-    if hasattr(response, "text") and response.text:
-        text = response.text.strip()
-    elif hasattr(response, "candidates"):
-        try:
-            text = response.candidates[0].content.parts[0].text.strip()
-        except Exception:
-            pass
+    text = llm_gateway.response_text(response)
 
     if not text:
         raise ValueError(f"Invalid Gemini response format: {response}")
@@ -387,9 +373,9 @@ async def run_gemini_extractor(prompt: str, message: str):
 
     return text
 
-def AGENT_2_POLICY(current_time: datetime.datetime, user_phone: str = "") -> str:
+async def AGENT_2_POLICY(current_time: datetime.datetime, user_phone: str = "") -> str:
     # If user_phone provided, scope team to their direct reports; else global
-    team = get_team_for_user(user_phone) if user_phone else load_team()
+    team = await get_team_for_user(user_phone) if user_phone else await load_team()
     team_description = "\n".join(
         [f"- {u['name']} (Login: {u['login_code']})" for u in team]
     )
@@ -427,90 +413,6 @@ IMPORTANT:
 - Focus only on the actual user message content.
 """
 
-# ─── TTL cache for MongoDB lookups (avoids per-message DB hits) ───
-import threading
-
-_cache_lock = threading.Lock()
-_team_cache: dict = {}       # phone -> (result, expiry_time)
-_all_users_cache: tuple = (None, 0.0)  # (result, expiry_time)
-_role_cache: dict = {}       # phone -> (result, expiry_time)
-_CACHE_TTL = 120  # seconds
-
-def _now_ts() -> float:
-    return time.time()
-
-def _invalidate_user_caches():
-    """Clear all user/team/role caches (call after add/delete user)."""
-    global _all_users_cache
-    with _cache_lock:
-        _team_cache.clear()
-        _role_cache.clear()
-        _all_users_cache = (None, 0.0)
-
-def load_team():
-    """Load ALL users from MongoDB (global list) with 2-minute cache."""
-    global _all_users_cache
-    with _cache_lock:
-        cached, expiry = _all_users_cache
-        if cached is not None and _now_ts() < expiry:
-            return cached
-    if users_collection is None:
-        logger.error("MongoDB connection cant be initialized")
-        return []
-
-    try:
-        db_users = list(users_collection.find({}, {"_id": 0}))
-        logger.info(f"Successfully loaded {len(db_users)} users from MongoDB.")
-        with _cache_lock:
-            _all_users_cache = (db_users, _now_ts() + _CACHE_TTL)
-        return db_users
-        
-    except Exception as e:
-        logger.error(f"Failed to fetch users from MongoDB: {e}")
-        return []
-
-
-def resolve_role(user_phone: str) -> str:
-    """
-    Determine if a user is a 'manager' or 'employee' (cached for 2 min).
-    """
-    phone = normalize_phone(user_phone)
-    with _cache_lock:
-        if phone in _role_cache:
-            cached, expiry = _role_cache[phone]
-            if _now_ts() < expiry:
-                return cached
-
-    if users_collection is None:
-        return "employee"
-    if phone == get_top_manager_phone():
-        role = "manager"
-    else:
-        subordinate = users_collection.find_one({"manager_phone": phone, "phone": {"$ne": phone}})
-        role = "manager" if subordinate else "employee"
-
-    with _cache_lock:
-        _role_cache[phone] = (role, _now_ts() + _CACHE_TTL)
-    return role
-
-
-def get_team_for_user(user_phone: str) -> list:
-    """
-    Return ALL users below this phone in the hierarchy (cached for 2 min).
-    """
-    if users_collection is None:
-        return []
-    phone = normalize_phone(user_phone)
-    with _cache_lock:
-        if phone in _team_cache:
-            cached, expiry = _team_cache[phone]
-            if _now_ts() < expiry:
-                return cached
-    result = get_all_subordinates(users_collection, user_phone)
-    with _cache_lock:
-        _team_cache[phone] = (result, _now_ts() + _CACHE_TTL)
-    return result
-
 async def add_user_tool(
     ctx: UserContext,
     name: str,
@@ -590,17 +492,11 @@ async def add_user_tool(
                 "manager_phone": normalize_phone(ctx.sender_phone)
             }
             
-            if users_collection is not None:
-                await asyncio.to_thread(
-                    users_collection.update_one,
-                    {"phone": new_user["phone"]},
-                    {"$set": new_user},
-                    True  # upsert
-                )
+            await user_repository.upsert_user(new_user)
 
             logger.info(f"Successfully synced {name} to MongoDB with ID {login_code}")
             # Invalidate caches after user change
-            _invalidate_user_caches()
+            invalidate_user_caches()
             return None
     return None
 
@@ -640,12 +536,12 @@ async def delete_user_tool(
     # Only delete from MongoDB if the Appsavy API confirmed successful deletion
     if is_success and "permission denied" not in msg and "error" not in msg:
         if users_collection is not None:
-            await asyncio.to_thread(users_collection.delete_one, {"phone": target_phone})
+            await user_repository.delete_user_by_phone(target_phone)
             logger.info(
                 f"User with mobile {clean_mobile} successfully deleted from Appsavy and removed from MongoDB."
             )
         # Invalidate caches after user change
-        _invalidate_user_caches()
+        invalidate_user_caches()
         return None
 
     # API did not confirm success — do NOT remove from MongoDB
@@ -691,30 +587,38 @@ def log_reasoning(step: str, details: dict | str):
     
 async def get_duplicate_resolution_message(matches: list, assignee_name: str) -> str:
     """
-    Fetches full user details from MongoDB for duplicates and formats the WhatsApp response.
+    Formats the WhatsApp clarification for duplicate names. Candidate details
+    come from the cached org graph; any codes it doesn't know are fetched
+    from MongoDB in a single $in query.
     """
-    options_text = ""
-    
-    for i, candidate in enumerate(matches, 1):
+    graph = await get_org_graph()
+    records = {}
+    missing = []
+    for candidate in matches:
         login_code = candidate.get("login_code")
-        
-        # Search Mongo for the authoritative record
-        user_record = await asyncio.to_thread(
-            users_collection.find_one, {"login_code": login_code}
-        )
-        
+        user_record = graph.get_by_login(login_code) if login_code else None
+        if user_record:
+            records[login_code] = user_record
+        elif login_code:
+            missing.append(login_code)
+    if missing:
+        records.update(await user_repository.find_users_by_login_codes(missing))
+
+    options = []
+    for i, candidate in enumerate(matches, 1):
+        user_record = records.get(candidate.get("login_code"))
         if user_record:
             name = user_record.get("name", candidate.get("name", "Unknown")).upper()
             phone = user_record.get("phone", "N/A")
             email = user_record.get("email", "N/A")
-            options_text += f"{i}. *{name}*\n    {phone}\n    {email}\n\n"
+            options.append(f"{i}. *{name}*\n    {phone}\n    {email}\n\n")
         else:
             # Fallback if Appsavy has a user that isn't in your Mongo yet
-            options_text += f"{i}. *{candidate['name'].upper()}*\n   (Details not found in DB)\n\n"
+            options.append(f"{i}. *{candidate['name'].upper()}*\n   (Details not found in DB)\n\n")
 
     return (
         f"I found multiple employees named '{assignee_name}'. Which one do you mean?\n\n"
-        f"{options_text}"
+        f"{''.join(options)}"
         "Please reply with the correct *Mobile Number* to proceed."
     )
 
@@ -842,7 +746,7 @@ async def send_whatsapp_report_tool(
 ) -> None:
     
     try:
-        team = load_team()
+        team = await load_team()
 
         # Resolve target user
         if assigned_to:
@@ -917,7 +821,7 @@ async def get_performance_report_tool(
 ) -> Optional[str]:
     try:
         # Scope to current user's subordinates (full hierarchy)
-        team = get_team_for_user(ctx.sender_phone)
+        team = await get_team_for_user(ctx.sender_phone)
 
         # Resolve target login_code if a name is provided
         target_login = ""
@@ -927,6 +831,20 @@ async def get_performance_report_tool(
                 (u for u in team if name_l == u["login_code"].lower() or name_l in u["name"].lower()),
                 None
             )
+            if not user:
+                # Typo / alternate spelling — accept only a confident, unambiguous
+                # local match; anything weaker is put to the user as a question
+                sender = normalize_phone(ctx.sender_phone)
+                index = await get_name_index(ctx.sender_phone)
+                fuzzy = [u for u in index.fuzzy_match(name) if normalize_phone(u.get("phone", "")) != sender]
+                user = fuzzy[0] if len(fuzzy) == 1 else None
+                if not user:
+                    suggestions = fuzzy or [
+                        u for u in index.fuzzy_suggest(name) if normalize_phone(u.get("phone", "")) != sender
+                    ]
+                    if suggestions:
+                        names = " or ".join(f"*{u.get('name')}*" for u in suggestions[:3])
+                        return f"I couldn't find '{name}' in your team. Did you mean {names}? Please reply with the full name."
             if not user:
                 logger.warning(f"[HIERARCHY] {ctx.sender_phone} requested report for '{name}' — not a subordinate.")
                 return None
@@ -974,17 +892,10 @@ async def get_task_list_tool(
     await call_appsavy_api("GET_TASKS", req)
     return None
 
-def extract_multiple_assignees(text: str, team: list) -> list[str]:
-    text = text.lower()
-    found = []
-
-    for member in team:
-        name = member["name"].lower()
-        # enforce word boundary match
-        if re.search(rf"\b{name}\b", text):
-            found.append(member["name"])
-
-    return list(set(found))
+def extract_multiple_assignees(text: str, team: Union[list, NameIndex]) -> list[str]:
+    """Names of team members mentioned (whole words) in `text` — one pass over the text."""
+    index = team if isinstance(team, NameIndex) else NameIndex(team)
+    return list({member["name"] for member in index.find_in_text(text)})
 
 async def get_task_description(task_id: str) -> str:
 
@@ -1017,57 +928,40 @@ async def get_task_description(task_id: str) -> str:
 
     return "N/A"
 
-def extract_task_id(text: str):
-    match = re.search(r"\btask\s*(\d+)\b", text.lower())
-    return match.group(1) if match else None
-
-def resolve_status(text: str, role: str):
-    t = text.lower()
-
-    if any(x in t for x in [
-        "pending",
-        "in progress",
-        "working",
-        "will be completed",
-        "by "
-    ]):
-        return "Work In Progress"
-
-    # Done / completed → Close or Closed
-    if any(x in t for x in [
-        "done",
-        "completed",
-        "finished"
-    ]):
-        return "Closed" if role == "manager" else "Close"
-
-    # Reopen
-    if "reopen" in t:
-        return "Reopened"
-
-    return None
-
-def extract_remark(text: str, task_id: str):
-    t = text.lower()
-
-    # task id hatao
-    t = re.sub(rf"task\s*{task_id}", "", t)
-
-    # status words hatao
-    for w in [
-        "is pending",
-        "pending",
-        "in progress",
-        "will be completed",
-        "completed",
-        "done",
-        "finished"
-    ]:
-        t = t.replace(w, "")
-
-    t = re.sub(r"\s+", " ", t).strip(" .,")
+async def match_assignee(
+    ctx: UserContext,
+    assignee_raw: str,
+    allow_fuzzy: bool = True
+) -> Tuple[List[Dict], str]:
+    """
+    Team members (subordinates + self) `assignee_raw` can refer to, and how
+    they were found: "exact" (phone / whole-word name), "fuzzy" (confident
+    typo match) or "suggest" (only a "did you mean ...?" candidate).
+    """
+    team_index = await get_name_index(ctx.sender_phone)
+    digits = re.sub(r"\D", "", assignee_raw)
+    if len(digits) in (10, 12):
+        user = team_index.get_by_phone(normalize_phone(digits))
+        return ([user] if user else []), "exact"
+
+    # Whole-word name match — one index lookup, no Appsavy API call
+    matches = team_index.match_name(assignee_raw)
+    if matches or not allow_fuzzy:
+        return matches, "exact"
+
+    # Misspelt / alternate spelling — shown to the user before anything is created
+    matches = team_index.fuzzy_match(assignee_raw)
+    how = "fuzzy"
+    if not matches:
+        matches, how = team_index.fuzzy_suggest(assignee_raw), "suggest"
+    if matches:
+        log_reasoning("ASSIGNEE_FUZZY_MATCH", {
+            "query": assignee_raw,
+            "how": how,
+            "candidates": [u.get("name") for u in matches]
+        })
+    return matches, how
 
-    return t.capitalize() if t else ""
 
 async def assign_new_task_tool(
     ctx: UserContext,
@@ -1076,16 +970,6 @@ async def assign_new_task_tool(
     deadline: str
 ) -> Optional[str]:
     try:
-        # Scope to current user's direct reports + include self for self-assignment
-        team = get_team_for_user(ctx.sender_phone)
-        sender_user = await asyncio.to_thread(
-            resolve_user_by_phone, users_collection, ctx.sender_phone
-        )
-        if sender_user and not any(
-            normalize_phone(u.get("phone", "")) == normalize_phone(ctx.sender_phone)
-            for u in team
-        ):
-            team = team + [sender_user]
         assignee_raw = assignee.strip()
 
         log_reasoning("ASSIGN_TASK_START", {
@@ -1095,28 +979,9 @@ async def assign_new_task_tool(
             "sender": ctx.sender_phone
         })
 
-        digits = re.sub(r"\D", "", assignee_raw)
-        is_phone = len(digits) in (10, 12)
-
-        matches: list[dict] = []
-
-        if is_phone:
-            normalized_phone = normalize_phone(digits)
-            resolved_user = next(
-                (u for u in team if normalize_phone(u.get("phone", "")) == normalized_phone),
-                None
-            )
-            if not resolved_user:
-                logger.warning(f"[HIERARCHY] {ctx.sender_phone} tried to assign task to {normalized_phone} — not a subordinate.")
-                return None
-            matches = [resolved_user]
-        else:
-            # DIRECT MONGO SEARCH: No Appsavy API call here
-            name_l = assignee_raw.lower()
-            matches = [
-                u for u in team 
-                if re.search(rf"\b{re.escape(name_l)}\b", u["name"].lower())
-            ]
+        # handle_message pins the confirmed member's phone before this runs;
+        # no fuzzy guessing after the user has said YES
+        matches, _ = await match_assignee(ctx, assignee_raw, allow_fuzzy=False)
 
         log_reasoning("ASSIGNEE_MATCHES_FOUND", {
             "count": len(matches),
@@ -1228,12 +1093,9 @@ async def update_task_status_tool(
                 assignee_code = tasks[0].get("REPORTER") or tasks[0].get("ASSIGNEE") or ""
                 # Resolve assignee phone from login_code
                 if assignee_code and users_collection is not None:
-                    assignee_user = await asyncio.to_thread(
-                        users_collection.find_one,
-                        {"login_code": assignee_code}, {"_id": 0}
-                    )
+                    assignee_user = await user_repository.find_user_by_login_code(assignee_code)
                     if assignee_user:
-                        if not is_subordinate(users_collection, ctx.sender_phone, assignee_user["phone"]):
+                        if not await is_subordinate(ctx.sender_phone, assignee_user["phone"]):
                             logger.warning(
                                 f"[HIERARCHY] {ctx.sender_phone} tried to reopen task {task_id} "
                                 f"but assignee {assignee_user['phone']} is not a subordinate."
@@ -1302,18 +1164,6 @@ def normalize_phone(phone: str) -> str:
         return digits
     return digits
 
-def merge_slots(session_id: str, new_slots: dict):
-    history = get_session_history(session_id)
-
-    # find the MOST RECENT slots entry (not the first)
-    existing = next(
-        (msg["content"] for msg in reversed(history) if msg["role"] == "slots"),
-        {}
-    )
-    merged = {**existing, **new_slots}
-    append_message(session_id, "slots", merged)
-    return merged
-
 def _extract_clarification_question(text: str) -> str:
     """
     Gemini sometimes returns reasoning/analysis before the actual question.
@@ -1355,6 +1205,283 @@ def _extract_clarification_question(text: str) -> str:
     return text
 
 
+# ─── Static LLM prompts ──────────────────────────────────────────────
+# Fixed instructions, registered once at import so llm_gateway can send
+# them as a cached prefix. Everything per-call (date, time, saved slots,
+# the user's words, history) is appended by the caller instead.
+
+PENDING_SCOPE_PROMPT = llm_gateway.register_static_prompt("pending_scope", """The user was asked: "Would you like to see your own pending tasks or the pending tasks of your team members?"
+
+Based on their reply, decide if they want:
+- OWN: to see their own personal pending tasks
+- TEAM: to see the pending tasks of their team members / employees / subordinates
+
+Rules:
+- Understand meaning, not just keywords. The user may reply in English, Hindi, or informal language.
+- If the user's reply clearly indicates they want their own tasks → return OWN
+- If the user's reply clearly indicates they want team/employee/subordinate tasks → return TEAM
+- If unclear, default to OWN.
+
+Return ONLY one word: OWN or TEAM""")
+
+TASK_CONFIRM_PROMPT = llm_gateway.register_static_prompt("task_confirm", """The user was asked to confirm a task creation. Based on their reply, decide if they are saying YES (confirm/proceed) or NO (cancel/reject).
+
+Rules:
+- Understand meaning, not just keywords. The user may reply in English, Hindi, or informal language.
+- "yes", "ha", "haan", "ji", "ok", "sure", "go ahead", "do it", "correct", "sahi hai", "theek hai", "kar do", "bana do", "assign karo" etc. → YES
+- "no", "nahi", "nah", "cancel", "mat karo", "ruk", "wrong", "galat" etc. → NO
+- If unclear, default to NO.
+
+Return ONLY one word: YES or NO""")
+
+AGENT2_TASK_ASSIGNMENT_PROMPT = """You are helping assign a task by extracting 3 required fields from a conversation.
+
+The request gives you KNOWN INFORMATION (previously extracted & saved — these are confirmed, do NOT ask for them again), the Current Date / Time, and the conversation.
+
+STEP 1 — READ THE CONVERSATION:
+The full conversation between user and assistant is provided as "USER MESSAGE".
+Scan ALL messages to find values for: assignee, task_name, deadline.
+Information is spread across multiple messages. Examples:
+- "Ariya has to complete report" → assignee = "Ariya", task_name = "complete report"
+- "7pm" (in reply to "What is the deadline?") → deadline = today at 7pm
+- "tomorrow 3pm" → deadline = tomorrow at 3pm
+
+STEP 2 — COMBINE with the known information.
+If a field exists in EITHER the conversation OR the known information, it is PRESENT.
+
+STEP 3 — DECIDE:
+- ALL 3 fields present → return JSON
+- ANY field missing → ask ONE question
+
+DEADLINE RULES:
+- A deadline is ONLY present if the user explicitly states a specific date, time, or relative time expression.
+- VALID deadline expressions (ONLY these count): "7pm", "3pm", "tomorrow", "in 2 hours", "EOD", "end of day", "by Friday", "next week", "Feb 20", "2026-02-15", etc.
+- INVALID / NOT a deadline (these are NOT deadline expressions — do NOT convert them): "once completed", "when done", "ASAP", "as soon as possible", "urgently", "immediately", "at the earliest", "soon", "quickly". These are instructions, NOT deadlines.
+- If the user has NOT provided a VALID deadline expression anywhere in the conversation → deadline is MISSING → you MUST ask: "What is the deadline?"
+- Do NOT assume EOD or any default. Do NOT invent a deadline. If in doubt, the deadline is MISSING.
+- When the user HAS provided a valid time (e.g., "7pm", "3pm", "tomorrow", "in 2 hours", "EOD") → convert to ISO 8601.
+- "EOD" or "end of day" → Current Date at T18:00:00
+- A bare time like "7pm" → TODAY at that time, e.g. <Current Date>T19:00:00
+- If the user says a time that has ALREADY PASSED today (compare with Current Time), it means that time TOMORROW, e.g. "12:30 pm" after 12:30 PM → <Tomorrow's Date>T12:30:00
+
+REQUIRED FIELDS:
+1. assignee — name or phone of the person
+2. task_name — what needs to be done (use user's words as-is, do not elaborate)
+3. deadline — ISO 8601 datetime (only from user's explicit input)
+
+RULES:
+- If the user already provided a value, do NOT ask about it again.
+- If task_name was given as "complete report", use "complete report" exactly. Do NOT ask for elaboration.
+- The ONLY valid questions are: "Who should this task be assigned to?", "What is the task?", "What is the deadline?"
+- Return ONLY a JSON object OR ONLY a plain text question. Never both.
+- Never wrap JSON in code fences.
+- Do NOT include any reasoning, analysis, explanation, or thought process. Output ONLY the final JSON or ONLY the question. Nothing else.
+
+JSON format:
+{
+  "assignee": string,
+  "task_name": string,
+  "deadline": string
+}
+"""
+
+AGENT2_UPDATE_TASK_STATUS_PROMPT = """You are helping update a task status.
+
+The request gives you KNOWN INFORMATION (do NOT ask again), the USER QUERY verbatim and the Current Date / Time.
+
+STATUS MAPPING RULES (Return EXACTLY one of these 4 values for the 'status' field):
+- If the user wants to start, is working on it, or it's pending -> "Work In Progress"
+- If the user has finished, completed, or fixed it -> "Closed"
+- If the user wants to restart or redo a closed task -> "Reopened"
+- If the user says it is still open or should stay open -> "Open"
+
+CRITICAL: The status field is REQUIRED and must come from the user's explicit words.
+- If the user has NOT mentioned or implied any status (e.g., they only said "update a task" or only provided a task ID), the status is MISSING.
+- Do NOT guess or default to any status. If status is missing, ask: "What status would you like to set? (Open / Work In Progress / Closed / Reopened)"
+- Only return JSON when BOTH task_id AND status are present.
+
+Required fields:
+- task_id: string
+- status: "Open" | "Work In Progress" | "Closed" | "Reopened"
+Optional:
+- remark: string | null
+
+If returning JSON, use EXACTLY this format:
+{
+  "task_id": string,
+  "status": string,
+  "remark": string | null
+}
+
+Rules:
+- Either return JSON OR a follow-up question
+- No explanations
+"""
+
+AGENT2_ADD_USER_PROMPT = """You are helping add a new user.
+
+The request gives you KNOWN INFORMATION (do NOT ask again) and the USER QUERY verbatim.
+
+Your job:
+- Extract name and mobile number from the user's message
+- Accept whatever name the user provides as-is (first name only is fine)
+- Do NOT ask to confirm or clarify the name — use it exactly as given
+- A 10-digit number (or 12-digit starting with 91) is a valid mobile number
+- Only ask a follow-up if name OR mobile is completely missing
+- Do NOT invent values
+- email is optional — set to null if not provided
+
+Required:
+- name (accept as-is, do NOT ask for full name)
+- mobile (10 digits)
+Optional:
+- email
+
+If BOTH name and mobile are present, return JSON immediately:
+{
+  "name": string,
+  "mobile": string,
+  "email": string | null
+}
+
+Rules:
+- Either return JSON OR a follow-up question
+- No explanations
+- NEVER ask to confirm the name
+"""
+
+AGENT2_VIEW_PERFORMANCE_PROMPT = """
+                REPORT TYPE RULES:
+                1. If the user mentions a specific person (e.g., "Abhilasha", "Rahul") -> report_type = "Count", name = "extracted name"
+                2. If the user asks for a general/overall report or no name is found -> report_type = "Detail", name = null
+                Return ONLY JSON:
+                {
+                    "report_type": "Detail" | "Count",
+                    "name": string | null
+                }
+                """
+
+AGENT2_DELETE_USER_PROMPT = """You are helping delete a user.
+
+The request gives you KNOWN INFORMATION (do NOT ask again) and the USER QUERY verbatim.
+
+Your job:
+- Reuse information already present
+- Ask ONE follow-up question if missing
+- Do NOT invent values
+
+Required:
+- name
+- mobile
+
+If returning JSON, use EXACTLY:
+{
+  "name": string,
+  "mobile": string
+}
+
+Rules:
+- Either return JSON OR a follow-up question
+- No explanations
+"""
+
+AGENT2_STATIC_PROMPTS = {
+    intent: llm_gateway.register_static_prompt(f"agent2_{intent.lower()}", text)
+    for intent, text in (
+        ("TASK_ASSIGNMENT", AGENT2_TASK_ASSIGNMENT_PROMPT),
+        ("UPDATE_TASK_STATUS", AGENT2_UPDATE_TASK_STATUS_PROMPT),
+        ("ADD_USER", AGENT2_ADD_USER_PROMPT),
+        ("VIEW_EMPLOYEE_PERFORMANCE", AGENT2_VIEW_PERFORMANCE_PROMPT),
+        ("DELETE_USER", AGENT2_DELETE_USER_PROMPT),
+    )
+}
+
+# Fields Agent 2 must have before a tool can run (optional fields may be null)
+AGENT2_REQUIRED_FIELDS = {
+    "TASK_ASSIGNMENT": {"assignee", "task_name", "deadline"},
+    "UPDATE_TASK_STATUS": {"task_id", "status"},
+    "ADD_USER": {"name", "mobile"},
+    "DELETE_USER": {"name", "mobile"},
+    "VIEW_EMPLOYEE_PERFORMANCE": {"report_type"},
+}
+
+# ─── Agent-2 structured output ───
+# Every Agent-2 reply is {"slots": {...}, "question": str | null}: the
+# values found so far plus, when a required field is still missing, the
+# one follow-up question. Gemini is constrained to this shape with a
+# response_schema, so the reply parses in one step.
+AGENT2_STRUCTURED_OUTPUT = os.getenv("AGENT2_STRUCTURED_OUTPUT", "1") != "0"
+
+
+def _nullable(type_: types.Type = types.Type.STRING, **kwargs) -> types.Schema:
+    return types.Schema(type=type_, nullable=True, **kwargs)
+
+
+_SLOT_DESCRIPTIONS = {"deadline": "ISO 8601 datetime, e.g. 2026-02-15T19:00:00"}
+
+# Same field map the combined classify+extract call is cleaned against
+AGENT2_SLOT_FIELDS: Dict[str, Dict[str, types.Schema]] = {
+    intent: {
+        field: _nullable(
+            **({"enum": allowed} if allowed else {}),
+            **({"description": _SLOT_DESCRIPTIONS[field]} if field in _SLOT_DESCRIPTIONS else {})
+        )
+        for field, allowed in fields.items()
+    }
+    for intent, fields in SLOT_FIELDS.items()
+}
+
+AGENT2_RESPONSE_SCHEMAS: Dict[str, types.Schema] = {
+    intent: types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "slots": types.Schema(
+                type=types.Type.OBJECT,
+                properties=fields,
+                required=list(fields),
+                property_ordering=list(fields),
+            ),
+            "question": _nullable(),
+        },
+        required=["slots", "question"],
+        property_ordering=["slots", "question"],
+    )
+    for intent, fields in AGENT2_SLOT_FIELDS.items()
+}
+
+AGENT2_RESPONSE_FORMAT = (
+    "RESPONSE FORMAT (overrides the format above): put every field value you "
+    "know in \"slots\" (null when unknown) and, if a required field is still "
+    "missing, the ONE follow-up question in \"question\"; otherwise question is null."
+)
+
+
+def parse_agent2_reply(intent: str, reply: Any, known: Dict) -> Optional[tuple]:
+    """
+    (slots, question) from a structured Agent-2 reply — question is None when
+    every required field is known. None if `reply` is not structured.
+    """
+    if not isinstance(reply, dict) or not isinstance(reply.get("slots"), dict):
+        return None
+    fields = AGENT2_SLOT_FIELDS[intent]
+    slots = {k: v for k, v in reply["slots"].items() if k in fields and v not in (None, "")}
+    if "deadline" in slots:
+        try:
+            datetime.datetime.fromisoformat(str(slots["deadline"]))
+        except ValueError:
+            slots.pop("deadline")
+    required = AGENT2_REQUIRED_FIELDS[intent]
+    missing = [f for f in fields if f in required and f not in slots and f not in known]
+    if not missing:
+        return slots, None
+    question = (reply.get("question") or "").strip() or f"Could you please provide the {missing[0]}?"
+    return slots, question
+
+# First-message mode: classify and extract slots in one Gemini call
+COMBINED_CLASSIFY_EXTRACT = os.getenv("COMBINED_CLASSIFY_EXTRACT", "1") != "0"
+# Below this classifier confidence, prefilled slots are kept but Agent 2 still runs
+COMBINED_MIN_CONFIDENCE = float(os.getenv("COMBINED_MIN_CONFIDENCE", 0.8))
+
 # Hard conversation reset phrases
 RESET_PHRASES = {
     "start over",
@@ -1366,6 +1493,9 @@ RESET_PHRASES = {
 
 async def handle_message(command, sender, pid, message=None, full_message=None):
     
+    uow: Optional[SessionUnitOfWork] = None
+    prefilled_slots: Dict = {}
+    confidence = 0.0  # classifier confidence — only set when Agent 1 runs this turn
     try:
         sender = normalize_phone(sender)
         trace_id = f"{sender}-{int(datetime.datetime.now().timestamp())}"
@@ -1375,8 +1505,8 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
             return
 
         # ──── AUTH: Resolve user from MongoDB (multi-user) ────
-        # Fix 3: Offload blocking MongoDB call to thread pool
-        user = await asyncio.to_thread(resolve_user_by_phone, users_collection, sender)
+        # Native async MongoDB lookup (no thread-pool hop)
+        user = await user_repository.find_user_by_phone(sender)
         if not user:
             top_mgr = get_top_manager_phone()
             logger.info(f"[AUTH_DEBUG] sender={sender} | top_manager_env={top_mgr} | match={normalize_phone(sender) == top_mgr}")
@@ -1390,13 +1520,7 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
                     "login_code": "TOP-MGR-001",
                     "manager_phone": normalize_phone(sender)
                 }
-                if users_collection is not None:
-                    await asyncio.to_thread(
-                        users_collection.update_one,
-                        {"phone": top_user["phone"]},
-                        {"$set": top_user},
-                        True  # upsert
-                    )
+                await user_repository.upsert_user(top_user)
                 user = top_user
             else:
                 await send_whatsapp_message(sender, "Access Denied: Your number is not registered.", pid)
@@ -1404,19 +1528,24 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
 
         login_code = user["login_code"]
 
-        # Fix 5: Parallelize session creation + role resolution (independent operations)
+        # Fix 5: Parallelize turn-context load + role resolution (independent operations)
+        # load_turn_context fetches session pointer, history, agent2 state and
+        # pending document/state in two Redis round-trips; the rest of the turn
+        # reads from this snapshot.
         session_key = sender
-        session_id_result, role = await asyncio.gather(
-            asyncio.to_thread(get_or_create_session, session_key),
-            asyncio.to_thread(resolve_role, sender)
+        turn_ctx, role = await asyncio.gather(
+            load_turn_context(session_key),
+            resolve_role(sender)
         )
-        session_id = session_id_result
+        session_id = turn_ctx.session_id
+        # All session writes for this turn are buffered here and flushed in
+        # one MULTI/EXEC when the turn finishes (see the outer finally).
+        uow = SessionUnitOfWork(turn_ctx)
 
         # ──── HARD RESET CHECK ────
         if command and command.strip().lower() in RESET_PHRASES:
             log_reasoning("HARD_RESET_TRIGGERED", {"by": sender})
-            clear_pending_document_state(session_id)
-            end_session_complete(session_key, session_id)
+            uow.end_session()
             await send_whatsapp_message(
                 sender,
                 "Conversation has been reset. How can I assist you?",
@@ -1426,7 +1555,7 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
 
         # ──── AGENT 3: INTENT SHIFT GUARD ────
         # Must run BEFORE appending the new user message to history
-        action, clarification_msg = await agent3_intent_guard(session_id, command)
+        action, clarification_msg = await agent3_intent_guard(session_id, command, turn_ctx, uow)
 
         if action == "ASK_CLARIFICATION":
             # Intent shift detected — reset session and reprocess message through Agent 1
@@ -1435,24 +1564,20 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
 
         if action == "RESET":
             log_reasoning("AGENT_3_RESET", {"reason": "Intent shift or inactivity"})
-            # Preserve pending document across session reset
-            saved_pending_doc = get_pending_document(session_id)
-            saved_pending_doc_state = get_pending_document_state(session_id)
-            end_session_complete(session_key, session_id)
-            session_id = get_or_create_session(session_key)
-            # Migrate pending document to new session if it existed
-            if saved_pending_doc:
-                set_pending_document(session_id, saved_pending_doc)
-                if saved_pending_doc_state:
-                    set_pending_document_state(session_id, saved_pending_doc_state.get("is_first_message", True))
+            # Atomic rotate: wipe old session, open a new one and carry the
+            # pending document (and its state) across in a single Lua call
+            session_id = await async_rotate_session(session_key, session_id)
+            turn_ctx = turn_ctx.for_new_session(session_id)
+            uow.rebind(turn_ctx)
+            if turn_ctx.pending_document:
                 log_reasoning("DOCUMENT_MIGRATED", {"new_session": session_id})
 
         # Save user input to history (after agent3 check)
         if command and command.strip():
-            append_message(session_id, "user", command)
+            uow.append("user", command)
 
         log_reasoning("USER_INPUT_RECEIVED", {"sender": sender, "command": command})
-        history = get_session_history(session_id)
+        history = turn_ctx.history
         log_reasoning("SESSION_HISTORY_LOG", {
             "session_id": session_id,
             "full_history": [f"{m['role']}: {m['content']}" for m in history]
@@ -1463,12 +1588,7 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
         is_cross_questioning = last_assistant_msg and ("[CLARIFY]" in last_assistant_msg["content"] or "[TASK_CONFIRM]" in last_assistant_msg["content"])
 
         # Find the most recent intent saved in the system history
-        existing_intent = next(
-            (m["content"].replace("INTENT_SET: ", "") 
-            for m in reversed(history) 
-            if m["role"] == "system" and "INTENT_SET:" in m["content"]), 
-            None
-        )
+        existing_intent = turn_ctx.existing_intent
 
         # Logging        
         log_reasoning("DEBUG_STATE", {"is_cross_questioning": is_cross_questioning, "existing_intent": existing_intent, "last_assistant_msg": last_assistant_msg})
@@ -1483,19 +1603,19 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
             })
             
             # Always store the document in the session so it persists across turns
-            set_pending_document(session_id, message)
+            uow.set_pending_document(message)
             
             if not command:
                 # Document sent WITHOUT text caption
                 # Track if this is first message (intent = null) or after (intent already set)
                 is_first_msg = not existing_intent
-                set_pending_document_state(session_id, is_first_msg)
+                uow.set_pending_document_state(is_first_msg)
                 
                 # If document sent as FIRST message, intent must be null (Agent 1 → null)
                 if is_first_msg:
                     log_reasoning("DOCUMENT_FIRST_MESSAGE", {"intent": None})
                     clarify_doc_msg = "I've received your document. Would you like to 'Assign a new task' with this or 'Update status of a task'?"
-                    append_message(session_id, "assistant", f"[CLARIFY] {clarify_doc_msg}")
+                    uow.append("assistant", f"[CLARIFY] {clarify_doc_msg}")
                     await send_whatsapp_message(
                         sender, 
                         clarify_doc_msg, 
@@ -1512,7 +1632,7 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
             else:
                 # Document sent WITH text caption — store document state and let text
                 # drive intent classification / parameter extraction normally
-                set_pending_document_state(session_id, not existing_intent)
+                uow.set_pending_document_state(not existing_intent)
                 log_reasoning("DOCUMENT_WITH_TEXT", {
                     "caption": command,
                     "type": message.get("type"),
@@ -1534,8 +1654,7 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
                 # CONDITION : Cross question and intent is null -> Error
                 log_reasoning("ERROR", {"reason": "Cross-question state detected but no existing_intent found."})
                 await send_whatsapp_message(sender, "System error: Lost context of previous request. Please start over.", pid)
-                clear_pending_document_state(session_id)
-                end_session_complete(session_key, session_id)
+                uow.end_session()
                 return
         else:
             if existing_intent:
@@ -1545,8 +1664,8 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
                 log_reasoning("AGENT_2_CONTINUE", {"intent": intent})
                 
                 # ============= DOCUMENT VALIDATION (if not first message) =============
-                doc_state = get_pending_document_state(session_id)
-                has_pending_doc = get_pending_document(session_id) is not None
+                doc_state = turn_ctx.pending_document_state
+                has_pending_doc = turn_ctx.pending_document is not None
                 
                 if has_pending_doc and doc_state and not doc_state.get("is_first_message"):
                     # Document sent AFTER intent was already set
@@ -1568,24 +1687,29 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
                             "Error: Documents can only be used with 'Assign a new task' or 'Update status of a task'.",
                             pid
                         )
-                        clear_pending_document_state(session_id)
-                        end_session_complete(session_key, session_id)
+                        uow.end_session()
                         return
                 # ============= END DOCUMENT VALIDATION =============
             else:
                 # CONDITION: Intent is null -> Agent 1 call
-                # Fix 2: Use dedicated thread pool instead of default (avoids pool starvation)
-                is_supported, intent, confidence, reasoning = await async_intent_classifier(command)
+                if COMBINED_CLASSIFY_EXTRACT:
+                    # One call returns the intent plus any slots already in the message
+                    is_supported, intent, confidence, reasoning, prefilled_slots = await async_classify_and_extract(
+                        command, datetime.datetime.now(IST)
+                    )
+                else:
+                    is_supported, intent, confidence, reasoning = await async_intent_classifier(command)
         
                 log_reasoning("INTENT_CLASSIFIED", {
                     "intent": intent,
                     "confidence": confidence,
                     "reasoning": reasoning,
-                    "is_supported": is_supported
+                    "is_supported": is_supported,
+                    "prefilled_slots": prefilled_slots
                 })
 
                 if is_supported and intent:
-                    append_message(session_id, "system", f"INTENT_SET: {intent}")
+                    uow.append("system", f"INTENT_SET: {intent}")
                 else:
                     await send_whatsapp_message(
                         sender,
@@ -1593,15 +1717,14 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
                         "updates, performance reports, and user management. What would you like to do?",
                         pid
                     )
-                    clear_pending_document_state(session_id)
-                    end_session_complete(session_key, session_id)
+                    uow.end_session()
                     return
                 
         # Context Setup 
         AGENT2_INTENTS = {"TASK_ASSIGNMENT", "UPDATE_TASK_STATUS", "ADD_USER", "DELETE_USER", "VIEW_EMPLOYEE_PERFORMANCE"}
         agent2_required = intent in AGENT2_INTENTS
         
-        pending_doc = get_pending_document(session_id)
+        pending_doc = turn_ctx.pending_document
         ctx_document = pending_doc if pending_doc else message
         ctx = UserContext(
             sender_phone=sender,
@@ -1618,7 +1741,7 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
             # (session must stay open when asking clarification)
             if intent == "PENDING_TASKS_AMBIGUOUS" and not is_cross_questioning:
                 clarify_msg = "Would you like to see your own pending tasks or the pending tasks of your team members?"
-                append_message(session_id, "assistant", f"[CLARIFY] {clarify_msg}")
+                uow.append("assistant", f"[CLARIFY] {clarify_msg}")
                 await send_whatsapp_message(sender, clarify_msg, pid)
                 return
 
@@ -1626,26 +1749,21 @@ async def handle_message(command, sender, pid, message=None, full_message=None):
                 if intent == "VIEW_EMPLOYEES_UNDER_MANAGER":
                     await get_task_list_tool(ctx, view="users")
                 elif intent == "PENDING_TASKS_AMBIGUOUS":
-                    # Cross-questioning: user is responding to our clarification
-                    # Use Gemini to understand whether user wants own tasks or team tasks
-                    disambig_result = await run_gemini_extractor(
-                        prompt="""The user was asked: "Would you like to see your own pending tasks or the pending tasks of your team members?"
-
-Based on their reply, decide if they want:
-- OWN: to see their own personal pending tasks
-- TEAM: to see the pending tasks of their team members / employees / subordinates
-
-Rules:
-- Understand meaning, not just keywords. The user may reply in English, Hindi, or informal language.
-- If the user's reply clearly indicates they want their own tasks → return OWN
-- If the user's reply clearly indicates they want team/employee/subordinate tasks → return TEAM
-- If unclear, default to OWN.
-
-Return ONLY one word: OWN or TEAM""",
-                        message=command
-                    )
-
-                    choice = disambig_result.strip().upper() if isinstance(disambig_result, str) else "OWN"
+                    # Cross-questioning: user is responding to our clarification.
+                    # Common replies ("my", "team", "mere wale") are parsed locally;
+                    # Gemini only decides the ones the lexicon is unsure about
+                    parsed_scope = parse_pending_scope(command)
+                    if parsed_scope:
+                        choice = parsed_scope[0]
+                        logger.info(f"[REPLY_PARSER] Scope {choice} ({parsed_scope[1]:.2f}) — Gemini skipped")
+                    else:
+                        disambig_result = await run_gemini_extractor(
+                            prompt="",
+                            static=PENDING_SCOPE_PROMPT,
+                            message=command,
+                            priority=llm_gateway.PRIORITY_CONFIRM
+                        )
+                        choice = disambig_result.strip().upper() if isinstance(disambig_result, str) else "OWN"
 
                     if choice == "TEAM":
                         log_reasoning("PENDING_DISAMBIGUATED", {"choice": "team_tasks"})
@@ -1661,12 +1779,13 @@ Return ONLY one word: OWN or TEAM""",
                         await send_whatsapp_message(sender, "\n".join(pending), pid)
                 elif intent == "VIEW_EMPLOYEE_PERFORMANCE":
                     await get_performance_report_tool(ctx)
+            except llm_gateway.LLMOverloaded:
+                raise
             except Exception as e:
                 logger.error(f"Error executing direct tool {intent}: {e}")
             finally:
                 # Requirement: Clear cache on every successful or failed call
-                clear_pending_document_state(session_id)
-                end_session_complete(session_key, session_id)
+                uow.end_session()
             
             return
 
@@ -1674,66 +1793,92 @@ Return ONLY one word: OWN or TEAM""",
         if intent == "TASK_ASSIGNMENT" and is_cross_questioning:
             last_asst = next((m for m in reversed(history) if m["role"] == "assistant"), None)
             if last_asst and "[TASK_CONFIRM]" in last_asst.get("content", ""):
-                # Use Gemini to decide if user confirmed or denied
-                confirm_result = await run_gemini_extractor(
-                    prompt="""The user was asked to confirm a task creation. Based on their reply, decide if they are saying YES (confirm/proceed) or NO (cancel/reject).
-
-Rules:
-- Understand meaning, not just keywords. The user may reply in English, Hindi, or informal language.
-- "yes", "ha", "haan", "ji", "ok", "sure", "go ahead", "do it", "correct", "sahi hai", "theek hai", "kar do", "bana do", "assign karo" etc. → YES
-- "no", "nahi", "nah", "cancel", "mat karo", "ruk", "wrong", "galat" etc. → NO
-- If unclear, default to NO.
-
-Return ONLY one word: YES or NO""",
-                    message=command
-                )
-
-                is_confirmed = isinstance(confirm_result, str) and confirm_result.strip().upper() == "YES"
+                # Decide if user confirmed or denied — locally when the reply is
+                # unambiguous ("haan", "ok 👍", "mat karo"), else via Gemini
+                parsed_confirm = parse_confirmation(command)
+                if parsed_confirm:
+                    is_confirmed = parsed_confirm[0] == "YES"
+                    logger.info(f"[REPLY_PARSER] Confirm {parsed_confirm[0]} ({parsed_confirm[1]:.2f}) — Gemini skipped")
+                else:
+                    confirm_result = await run_gemini_extractor(
+                        prompt="",
+                        static=TASK_CONFIRM_PROMPT,
+                        message=command,
+                        priority=llm_gateway.PRIORITY_CONFIRM
+                    )
+                    is_confirmed = isinstance(confirm_result, str) and confirm_result.strip().upper() == "YES"
 
                 if not is_confirmed:
                     log_reasoning("TASK_CONFIRM_DENIED", {"user_reply": command})
                     await send_whatsapp_message(sender, "Task creation cancelled.", pid)
-                    clear_pending_document_state(session_id)
-                    end_session_complete(session_key, session_id)
+                    uow.end_session()
                     return
 
                 # Confirmed — retrieve saved slots and create the task
                 log_reasoning("TASK_CONFIRM_APPROVED", {"user_reply": command})
-                merged_data = next((m["content"] for m in reversed(history) if m.get("role") == "slots"), {})
-                if isinstance(merged_data, str):
-                    try:
-                        merged_data = json.loads(merged_data)
-                    except Exception:
-                        merged_data = {}
+                merged_data = turn_ctx.slots
 
                 if all(k in merged_data for k in ("assignee", "task_name", "deadline")):
                     try:
                         log_reasoning("TOOL_EXECUTION_START", {"intent": intent, "data": merged_data})
                         tool_output = await assign_new_task_tool(ctx, **merged_data)
                         if isinstance(tool_output, str):
-                            append_message(session_id, "assistant", f"[CLARIFY] {tool_output}")
+                            uow.append("assistant", f"[CLARIFY] {tool_output}")
                             await send_whatsapp_message(sender, tool_output, pid)
                             return
                     except Exception as e:
                         logger.error(f"API Tool Execution Failed for TASK_ASSIGNMENT: {e}")
                     finally:
-                        clear_pending_document_state(session_id)
-                        end_session_complete(session_key, session_id)
+                        uow.end_session()
                     return
                 else:
                     log_reasoning("TASK_CONFIRM_SLOTS_MISSING", {"merged_data": merged_data})
                     await send_whatsapp_message(sender, "Something went wrong. Please start over.", pid)
-                    clear_pending_document_state(session_id)
-                    end_session_complete(session_key, session_id)
+                    uow.end_session()
                     return
 
         # Agent-2 : Parameter Extraction
+        # Rule-based pre-pass first: task id, status, mobile, email, name and
+        # deadline are read off the message when unambiguous, so Gemini is
+        # only asked for the fields still missing
+        slots_before = set(turn_ctx.slots)
+        local_slots = pre_extract_slots(intent, command, ctx.current_time)
+        # A name read by the rules is a best guess — it only counts towards
+        # skipping Agent 2 next to a mobile number from the same message
+        name_guessed = "name" in local_slots and "mobile" not in local_slots
+        if intent == "DELETE_USER" and local_slots.get("mobile") and "name" not in local_slots:
+            # The number identifies the member — take the name from the directory
+            member = (await get_name_index(ctx.sender_phone)).get_by_phone(local_slots["mobile"])
+            if member and member.get("name"):
+                local_slots["name"] = member["name"]
+        if local_slots:
+            log_reasoning("SLOTS_PRE_EXTRACTED", {"intent": intent, "slots": local_slots})
+        elif intent == "TASK_ASSIGNMENT" and prefilled_slots.get("deadline") and is_non_deadline(command):
+            # "ASAP" / "when done" is an instruction, not a deadline
+            prefilled_slots.pop("deadline")
+
+        if prefilled_slots:
+            uow.merge_slots(prefilled_slots)
+        if local_slots:
+            # Merged last: deterministic values win over the combined call's
+            uow.merge_slots(local_slots)
+
+        required = AGENT2_REQUIRED_FIELDS.get(intent, set())
+        trusted = slots_before | (set(local_slots) - {"name"} if name_guessed else set(local_slots))
+        if prefilled_slots and confidence >= COMBINED_MIN_CONFIDENCE:
+            trusted |= set(prefilled_slots)
+        skip_reason = None
+        if required and required.issubset(trusted) and not required.issubset(slots_before):
+            skip_reason = "pre_extract" if required & set(local_slots) else "combined"
         # Retrieve latest slots and format history for Agent 2
-        slots = next((m["content"] for m in reversed(history) if m.get("role") == "slots"), {})
+        slots = turn_ctx.slots
         # Build clean conversation context — only user and assistant messages for clarity
         convo_for_agent2 = []
         for m in history:
-            if m["role"] == "user":
+            if m["role"] == "summary":
+                # Older turns compacted by the bounded-history window
+                convo_for_agent2.append(f"(earlier conversation, summarised)\n{m['content']}")
+            elif m["role"] == "user":
                 convo_for_agent2.append(f"user: {m['content']}")
             elif m["role"] == "assistant":
                 # Strip internal tags like [CLARIFY], [TASK_CONFIRM] for cleaner context
@@ -1748,202 +1893,52 @@ Return ONLY one word: YES or NO""",
 
         slots_info = json.dumps(slots, indent=2) if slots else "None yet — extract ALL fields from the conversation history below."
 
-        if intent == "TASK_ASSIGNMENT":
-            result = await run_gemini_extractor(
-                prompt=f"""You are helping assign a task by extracting 3 required fields from a conversation.
-
-PREVIOUSLY EXTRACTED & SAVED INFORMATION (these are confirmed — do NOT ask for them again):
-{slots_info}
-
-Current Date: {ctx.current_time.strftime("%Y-%m-%d")}
-Current Time: {ctx.current_time.strftime("%I:%M %p")}
-
-STEP 1 — READ THE CONVERSATION:
-The full conversation between user and assistant is provided below as "USER MESSAGE".
-Scan ALL messages to find values for: assignee, task_name, deadline.
-Information is spread across multiple messages. Examples:
-- "Ariya has to complete report" → assignee = "Ariya", task_name = "complete report"
-- "7pm" (in reply to "What is the deadline?") → deadline = today at 7pm
-- "tomorrow 3pm" → deadline = tomorrow at 3pm
-
-STEP 2 — COMBINE with saved information above.
-If a field exists in EITHER the conversation OR the saved info, it is PRESENT.
-
-STEP 3 — DECIDE:
-- ALL 3 fields present → return JSON
-- ANY field missing → ask ONE question
-
-DEADLINE RULES:
-- A deadline is ONLY present if the user explicitly states a specific date, time, or relative time expression.
-- VALID deadline expressions (ONLY these count): "7pm", "3pm", "tomorrow", "in 2 hours", "EOD", "end of day", "by Friday", "next week", "Feb 20", "2026-02-15", etc.
-- INVALID / NOT a deadline (these are NOT deadline expressions — do NOT convert them): "once completed", "when done", "ASAP", "as soon as possible", "urgently", "immediately", "at the earliest", "soon", "quickly". These are instructions, NOT deadlines.
-- If the user has NOT provided a VALID deadline expression anywhere in the conversation → deadline is MISSING → you MUST ask: "What is the deadline?"
-- Do NOT assume EOD or any default. Do NOT invent a deadline. If in doubt, the deadline is MISSING.
-- When the user HAS provided a valid time (e.g., "7pm", "3pm", "tomorrow", "in 2 hours", "EOD") → convert to ISO 8601.
-- "EOD" or "end of day" → {ctx.current_time.strftime("%Y-%m-%d")}T18:00:00
-- A bare time like "7pm" → TODAY at that time: {ctx.current_time.strftime("%Y-%m-%d")}T19:00:00
-- If the user says a time that has ALREADY PASSED today, it means that time TOMORROW. Example: current time is {ctx.current_time.strftime("%I:%M %p")}, user says "12:30 pm" but 12:30 PM today has passed → use TOMORROW: {(ctx.current_time + datetime.timedelta(days=1)).strftime("%Y-%m-%d")}T12:30:00
-
-REQUIRED FIELDS:
-1. assignee — name or phone of the person
-2. task_name — what needs to be done (use user's words as-is, do not elaborate)
-3. deadline — ISO 8601 datetime (only from user's explicit input)
-
-RULES:
-- If the user already provided a value, do NOT ask about it again.
-- If task_name was given as "complete report", use "complete report" exactly. Do NOT ask for elaboration.
-- The ONLY valid questions are: "Who should this task be assigned to?", "What is the task?", "What is the deadline?"
-- Return ONLY a JSON object OR ONLY a plain text question. Never both.
-- Never wrap JSON in code fences.
-- Do NOT include any reasoning, analysis, explanation, or thought process. Output ONLY the final JSON or ONLY the question. Nothing else.
-
-JSON format:
-{{
-  "assignee": string,
-  "task_name": string,
-  "deadline": string
-}}
-""",
-                message=full_convo_context
-            )
-
-        elif intent == "UPDATE_TASK_STATUS":
-            result = await run_gemini_extractor(
-                prompt=f"""You are helping update a task status.
-
-KNOWN INFORMATION (do NOT ask again):
-{json.dumps(slots, indent=2)}
-
-USER QUERY (verbatim):
-"{command}"
-
-Current Date: {ctx.current_time.strftime("%Y-%m-%d")}
-Current Time: {ctx.current_time.strftime("%I:%M %p")}
-
-RULES:
-- Convert relative deadlines (e.g., "in 4 hours", "tomorrow", "by EOD") into absolute ISO 8601 format.
-- "EOD" should be treated as 18:00 (6:00 PM) of the current day.
-- Ensure the 'deadline' string is strictly a valid ISO format.
-
-STATUS MAPPING RULES (Return EXACTLY one of these 4 values for the 'status' field):
-- If the user wants to start, is working on it, or it's pending -> "Work In Progress"
-- If the user has finished, completed, or fixed it -> "Closed"
-- If the user wants to restart or redo a closed task -> "Reopened"
-- If the user says it is still open or should stay open -> "Open"
-
-CRITICAL: The status field is REQUIRED and must come from the user's explicit words.
-- If the user has NOT mentioned or implied any status (e.g., they only said "update a task" or only provided a task ID), the status is MISSING.
-- Do NOT guess or default to any status. If status is missing, ask: "What status would you like to set? (Open / Work In Progress / Closed / Reopened)"
-- Only return JSON when BOTH task_id AND status are present.
-
-Required fields:
-- task_id: string
-- status: "Open" | "Work In Progress" | "Closed" | "Reopened"
-Optional:
-- remark: string | null
-
-If returning JSON, use EXACTLY this format:
-{{
-  "task_id": string,
-  "status": string,
-  "remark": string | null
-}}
-
-Rules:
-- Either return JSON OR a follow-up question
-- No explanations
-""",
-                message=full_convo_context
-            )
-
-        elif intent == "ADD_USER":
-            result = await run_gemini_extractor(
-                prompt=f"""You are helping add a new user.
-
-KNOWN INFORMATION (do NOT ask again):
-{json.dumps(slots, indent=2)}
-
-USER QUERY (verbatim):
-"{command}"
-
-Your job:
-- Extract name and mobile number from the user's message
-- Accept whatever name the user provides as-is (first name only is fine)
-- Do NOT ask to confirm or clarify the name — use it exactly as given
-- A 10-digit number (or 12-digit starting with 91) is a valid mobile number
-- Only ask a follow-up if name OR mobile is completely missing
-- Do NOT invent values
-- email is optional — set to null if not provided
-
-Required:
-- name (accept as-is, do NOT ask for full name)
-- mobile (10 digits)
-Optional:
-- email
-
-If BOTH name and mobile are present, return JSON immediately:
-{{
-  "name": string,
-  "mobile": string,
-  "email": string | null
-}}
+        if skip_reason:
+            # Every required field is already known — no Agent-2 call needed
+            result = dict(slots)
+            record_agent2(intent, skip_reason)
+            log_reasoning("AGENT_2_SKIPPED", {
+                "reason": skip_reason,
+                "slots": result,
+                "agent2_calls": slot_prefill_stats()[intent]
+            })
 
-Rules:
-- Either return JSON OR a follow-up question
-- No explanations
-- NEVER ask to confirm the name
-""",
-                message=full_convo_context
+        elif intent in AGENT2_STATIC_PROMPTS:
+            record_agent2(intent, "llm")
+            # Static instructions go as a cached prefix; only this part varies per call
+            tomorrow = ctx.current_time + datetime.timedelta(days=1)
+            dynamic_prompt = (
+                f"KNOWN INFORMATION (previously extracted & saved — do NOT ask again):\n"
+                f"{slots_info if intent == 'TASK_ASSIGNMENT' else json.dumps(slots, indent=2)}\n\n"
+                f"USER QUERY (verbatim):\n\"{command}\"\n\n"
+                f"Current Date: {ctx.current_time.strftime('%Y-%m-%d')}\n"
+                f"Current Time: {ctx.current_time.strftime('%I:%M %p')}\n"
+                f"Tomorrow's Date: {tomorrow.strftime('%Y-%m-%d')}"
             )
-            
-        elif intent == "VIEW_EMPLOYEE_PERFORMANCE":
+            if AGENT2_STRUCTURED_OUTPUT:
+                dynamic_prompt += f"\n\n{AGENT2_RESPONSE_FORMAT}"
             result = await run_gemini_extractor(
-                prompt=f"""
-                REPORT TYPE RULES:
-                1. If the user mentions a specific person (e.g., "Abhilasha", "Rahul") -> report_type = "Count", name = "extracted name"
-                2. If the user asks for a general/overall report or no name is found -> report_type = "Detail", name = null
-                Return ONLY JSON:
-                {{
-                    "report_type": "Detail" | "Count",
-                    "name": string | null
-                }}
-                """,
-                message=full_convo_context
+                prompt=dynamic_prompt,
+                message=full_convo_context,
+                static=AGENT2_STATIC_PROMPTS[intent],
+                schema=AGENT2_RESPONSE_SCHEMAS[intent] if AGENT2_STRUCTURED_OUTPUT else None
             )
 
-        elif intent == "DELETE_USER":
-            result = await run_gemini_extractor(
-                prompt=f"""You are helping delete a user.
-
-KNOWN INFORMATION (do NOT ask again):
-{json.dumps(slots, indent=2)}
-
-USER QUERY (verbatim):
-"{command}"
-
-Your job:
-- Reuse information already present
-- Ask ONE follow-up question if missing
-- Do NOT invent values
-
-Required:
-- name
-- mobile
-
-If returning JSON, use EXACTLY:
-{{
-  "name": string,
-  "mobile": string
-}}
-
-Rules:
-- Either return JSON OR a follow-up question
-- No explanations
-""",
-                message=full_convo_context
-            )
+            structured = parse_agent2_reply(intent, result, slots)
+            if structured:
+                new_slots, question = structured
+                if question:
+                    if new_slots:
+                        uow.merge_slots(new_slots)
+                    log_reasoning("AGENT_2_CLARIFICATION_SENT", {"agent_msg": question, "source": "structured"})
+                    uow.append("assistant", f"[CLARIFY] {question}")
+                    await send_whatsapp_message(sender, question, pid)
+                    return
+                result = new_slots
+                log_reasoning("AGENT_2_JSON_PARSED", {"source": "structured"})
 
-        # Logic: If it's a string, check if it's actually JSON in a string wrapper
+        # Free-text reply (structured output disabled, or Gemini ignored the
+        # schema): check if it's actually JSON in a string wrapper
         if isinstance(result, str):
             cleaned_result = result.strip().replace("```json", "").replace("```", "").strip()
             
@@ -1954,15 +1949,8 @@ Rules:
                 try:
                     parsed_json = json.loads(json_match.group(1))
                     if isinstance(parsed_json, dict):
-                        # Define required fields per intent — optional fields with null are OK
-                        REQUIRED_FIELDS = {
-                            "TASK_ASSIGNMENT": {"assignee", "task_name", "deadline"},
-                            "UPDATE_TASK_STATUS": {"task_id", "status"},
-                            "ADD_USER": {"name", "mobile"},
-                            "DELETE_USER": {"name", "mobile"},
-                            "VIEW_EMPLOYEE_PERFORMANCE": {"report_type"},
-                        }
-                        required = REQUIRED_FIELDS.get(intent, set(parsed_json.keys()))
+                        # Required fields per intent — optional fields with null are OK
+                        required = AGENT2_REQUIRED_FIELDS.get(intent, set(parsed_json.keys()))
                         # Only check nulls on required fields
                         has_nulls = any(
                             (v is None or v == "") for k, v in parsed_json.items() if k in required
@@ -1975,9 +1963,9 @@ Rules:
                                 # Save the partial data as slots, send only the question
                                 partial_slots = {k: v for k, v in parsed_json.items() if v is not None and v != ""}
                                 if partial_slots:
-                                    merge_slots(session_id, partial_slots)
+                                    uow.merge_slots(partial_slots)
                                 log_reasoning("AGENT_2_CLARIFICATION_SENT", {"agent_msg": remaining_text})
-                                append_message(session_id, "assistant", f"[CLARIFY] {remaining_text}")
+                                uow.append("assistant", f"[CLARIFY] {remaining_text}")
                                 await send_whatsapp_message(sender, remaining_text, pid)
                                 return
                             else:
@@ -1986,9 +1974,9 @@ Rules:
                                 question = f"Could you please provide the {missing[0]}?"
                                 partial_slots = {k: v for k, v in parsed_json.items() if v is not None and v != ""}
                                 if partial_slots:
-                                    merge_slots(session_id, partial_slots)
+                                    uow.merge_slots(partial_slots)
                                 log_reasoning("AGENT_2_CLARIFICATION_SENT", {"agent_msg": question})
-                                append_message(session_id, "assistant", f"[CLARIFY] {question}")
+                                uow.append("assistant", f"[CLARIFY] {question}")
                                 await send_whatsapp_message(sender, question, pid)
                                 return
                         else:
@@ -2009,70 +1997,106 @@ Rules:
                         clarification_text = parsed if isinstance(parsed, str) else cleaned_result
                         clarification_text = _extract_clarification_question(str(clarification_text))
                         log_reasoning("AGENT_2_CLARIFICATION_SENT", {"agent_msg": clarification_text})
-                        append_message(session_id, "assistant", f"[CLARIFY] {clarification_text}")
+                        uow.append("assistant", f"[CLARIFY] {clarification_text}")
                         await send_whatsapp_message(sender, clarification_text, pid)
                         return
                 except json.JSONDecodeError:
                     # Plain text — strip any reasoning, extract only the question
                     clarification = _extract_clarification_question(result)
                     log_reasoning("AGENT_2_CLARIFICATION_SENT", {"agent_msg": clarification, "raw": result})
-                    append_message(session_id, "assistant", f"[CLARIFY] {clarification}")
+                    uow.append("assistant", f"[CLARIFY] {clarification}")
                     await send_whatsapp_message(sender, clarification, pid)
                     return
 
         # Agent 2 produced JSON (the "Flag" is now set to true)
-        merged_data = merge_slots(session_id, result)
+        merged_data = uow.merge_slots(result)
         log_reasoning("AGENT_2_FLAG_TRUE", {"parameters_extracted": merged_data})
 
         # Execute Tool Calls
         try:
             if intent == "TASK_ASSIGNMENT" and all(k in merged_data for k in ("assignee", "task_name", "deadline")):
+                # Resolve the assignee BEFORE confirming, so the user approves the
+                # actual team member rather than whatever they typed
+                assignee_raw = str(merged_data["assignee"]).strip()
+                matches, how = await match_assignee(ctx, assignee_raw)
+                if len(matches) != 1:
+                    if matches:
+                        question = await get_duplicate_resolution_message(matches, assignee_raw)
+                    else:
+                        question = f"I couldn't find '{assignee_raw}' in your team. Who should this task be assigned to?"
+                    log_reasoning("ASSIGNEE_UNRESOLVED", {"assignee": assignee_raw, "candidates": len(matches)})
+                    # Not known yet — Agent 2 must take the assignee from the answer
+                    uow.delete_slots("assignee")
+                    uow.append("assistant", f"[CLARIFY] {question}")
+                    await send_whatsapp_message(sender, question, pid)
+                    return
+
+                member = matches[0]
+                member_name = member.get("name") or assignee_raw
+                if member.get("phone"):
+                    # Pin the confirmed member — the tool resolves a phone exactly
+                    merged_data = uow.merge_slots({"assignee": member["phone"]})
+                assignee_line = f"*Assigned to:* {member_name}"
+                if member.get("phone"):
+                    assignee_line += f" ({member['phone'][-10:]})"
+                if how != "exact":
+                    assignee_line += f"\n_You wrote '{assignee_raw}' — did you mean {member_name}?_"
+
                 # Send confirmation before creating
                 confirm_msg = (
                     f"Please confirm the task details:\n\n"
                     f"*Task:* {merged_data['task_name']}\n"
-                    f"*Assigned to:* {merged_data['assignee']}\n"
+                    f"{assignee_line}\n"
                     f"*Deadline:* {merged_data['deadline']}\n\n"
                     f"Should I create this task?"
                 )
                 log_reasoning("TASK_CONFIRM_SENT", {"details": merged_data})
-                append_message(session_id, "assistant", f"[TASK_CONFIRM] {confirm_msg}")
+                uow.append("assistant", f"[TASK_CONFIRM] {confirm_msg}")
                 await send_whatsapp_message(sender, confirm_msg, pid)
                 return
             elif intent == "UPDATE_TASK_STATUS" and all(k in merged_data for k in ("task_id", "status")):
                 log_reasoning("TOOL_EXECUTION_START", {"intent": intent, "data": merged_data})
                 await update_task_status_tool(ctx, **merged_data)
-                clear_pending_document_state(session_id)
-                end_session_complete(session_key, session_id)
+                uow.end_session()
 
             elif intent == "ADD_USER" and all(k in merged_data for k in ("name", "mobile")):
                 log_reasoning("TOOL_EXECUTION_START", {"intent": intent, "data": merged_data})
                 await add_user_tool(ctx, **merged_data)
-                clear_pending_document_state(session_id)
-                end_session_complete(session_key, session_id)
+                uow.end_session()
 
             elif intent == "DELETE_USER" and all(k in merged_data for k in ("name", "mobile")):
                 log_reasoning("TOOL_EXECUTION_START", {"intent": intent, "data": merged_data})
                 await delete_user_tool(ctx, **merged_data)
-                clear_pending_document_state(session_id)
-                end_session_complete(session_key, session_id)
+                uow.end_session()
             
             elif intent == "VIEW_EMPLOYEE_PERFORMANCE" and "report_type" in merged_data:
                 log_reasoning("TOOL_EXECUTION_START", {"intent": intent, "data": merged_data})
-                await get_performance_report_tool(
+                tool_output = await get_performance_report_tool(
                     ctx,
                     report_type=merged_data["report_type"], 
                     name=merged_data.get("name")
                 )
-                clear_pending_document_state(session_id)
-                end_session_complete(session_key, session_id)
+                if isinstance(tool_output, str):
+                    # "Did you mean ...?" — keep the session open for the answer
+                    uow.append("assistant", f"[CLARIFY] {tool_output}")
+                    await send_whatsapp_message(sender, tool_output, pid)
+                    return
+                uow.end_session()
             
         except Exception as e:
             logger.error(f"API Tool Execution Failed for {intent}: {e}")
             # Requirement: Clear cache even on failed API calls
-            clear_pending_document_state(session_id)
-            end_session_complete(session_key, session_id)
+            uow.end_session()
 
+    except llm_gateway.LLMOverloaded as e:
+        # Shed by the LLM gateway — keep the session as it was so the user can resend
+        logger.warning(f"[LOAD_SHED] {sender} | {e}")
+        if uow is not None:
+            uow.discard()
+        try:
+            await send_whatsapp_message(sender, llm_gateway.BUSY_MESSAGE, pid)
+        except Exception:
+            pass
     except Exception:
         logger.error("handle_message failed", exc_info=True)
         try:
@@ -2083,9 +2107,13 @@ Rules:
             )
         except Exception:
             pass
-        try:
-            if 'session_id' in locals() and 'session_key' in locals():
-                clear_pending_document_state(session_id)
-                end_session_complete(session_key, session_id)
-        except Exception:
-            pass
\ No newline at end of file
+        if uow is not None:
+            # Drop the half-finished turn and reset the session atomically
+            uow.discard()
+            uow.end_session()
+    finally:
+        if uow is not None:
+            try:
+                await uow.commit()
+            except Exception:
+                logger.error("Failed to commit session writes", exc_info=True)
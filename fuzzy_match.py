@@ -0,0 +1,218 @@
+"""
+Local fuzzy / phonetic matching of assignee names.
+
+Used when a whole-word lookup in NameIndex finds nobody, so typos and
+alternate spellings of Indian names ("Ariya"/"Aria", "Shreya"/"Sreya",
+"Vikas"/"Wikas") resolve without another Gemini clarification round.
+
+Per team, each distinct name token is indexed by:
+  - padded character trigrams (candidate generation)
+  - phonetic_key(): a Metaphone-style key with transliteration folds
+    common in romanised Indian names (aspirates, sh/s, w/v, doubled vowels)
+  - Soundex (coarse fallback)
+Candidates are then scored with a bounded Levenshtein distance. Only a
+match on folded_spelling() (vowels kept) counts as "sounds the same": the
+vowel-less key alone puts different names such as Ankita / Ankit
+together, so it just makes a weak candidate. A one-letter edit in a short
+name stays below MATCH_THRESHOLD — callers ask "did you mean ...?"
+(suggest()) instead of resolving it silently.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from name_index import tokenize
+
+MATCH_THRESHOLD = 0.88   # minimum user score to auto-resolve (one edit in a 5-letter name is 0.8)
+CLEAR_MARGIN = 0.15      # best must beat the runner-up by this much to auto-resolve
+SUGGEST_THRESHOLD = 0.7  # below MATCH_THRESHOLD but worth a "did you mean ...?"
+PHONETIC_SCORE = 0.85    # same spelling once transliteration variants are folded
+CONSONANT_SCORE = 0.6    # only the vowel-less key agrees ("ankita" / "ankit")
+SOUNDEX_SCORE = 0.6
+AGREEMENT_BONUS = 0.1    # spelling and folded sound both close — likely the same name
+
+_VOWELS = set("aeiouy")
+
+# Applied in order — longest / most specific first
+_PHONETIC_FOLDS = [
+    ("tch", "c"), ("sch", "s"), ("ck", "k"),
+    ("kh", "k"), ("gh", "g"), ("ch", "c"), ("jh", "j"), ("th", "t"),
+    ("dh", "d"), ("ph", "f"), ("bh", "b"), ("sh", "s"),
+    ("w", "v"), ("z", "j"), ("q", "k"), ("x", "ks"),
+]
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"), "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+
+
+def soundex(token: str) -> str:
+    token = "".join(c for c in token.lower() if c.isalpha())
+    if not token:
+        return ""
+    out = token[0].upper()
+    last = _SOUNDEX_CODES.get(token[0], "")
+    for c in token[1:]:
+        code = _SOUNDEX_CODES.get(c, "")
+        if code and code != last:
+            out += code
+            if len(out) == 4:
+                break
+        if c not in "hw":
+            last = code
+    return out.ljust(4, "0")
+
+
+def phonetic_key(token: str) -> str:
+    """Consonant skeleton after transliteration folds; keeps a leading vowel."""
+    token = "".join(c for c in token.lower() if c.isalpha())
+    if not token:
+        return ""
+    for src, dst in _PHONETIC_FOLDS:
+        token = token.replace(src, dst)
+    key = token[0]
+    for c in token[1:]:
+        if c in _VOWELS or c == "h":
+            continue
+        if key[-1] != c:
+            key += c
+    return key
+
+
+def folded_spelling(token: str) -> str:
+    """
+    Spelling with transliteration variants folded but vowels kept, so
+    "shreya" / "sreya" and "ariya" / "aria" agree while "ankita" / "ankit"
+    do not.
+    """
+    token = "".join(c for c in token.lower() if c.isalpha())
+    for src, dst in _PHONETIC_FOLDS + [("ee", "i"), ("oo", "u"), ("y", ""), ("h", "")]:
+        token = token.replace(src, dst)
+    out = ""
+    for c in token:
+        if not out or out[-1] != c:
+            out += c
+    return out
+
+
+def bounded_levenshtein(a: str, b: str, max_dist: int) -> Optional[int]:
+    """Edit distance if it is <= max_dist, else None (stops early)."""
+    if abs(len(a) - len(b)) > max_dist:
+        return None
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            row_min = min(row_min, cur[j])
+        if row_min > max_dist:
+            return None
+        prev = cur
+    return prev[-1] if prev[-1] <= max_dist else None
+
+
+def _max_edits(token: str) -> int:
+    return 1 if len(token) <= 4 else 2 if len(token) <= 8 else 3
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyNameMatcher:
+    def __init__(self, users: List[Dict]):
+        self.users = users
+        self._user_tokens: List[Tuple[Dict, Tuple[str, ...]]] = []
+        self._by_trigram: Dict[str, Set[str]] = {}
+        self._by_phonetic: Dict[str, Set[str]] = {}
+        self._by_soundex: Dict[str, Set[str]] = {}
+        self._phonetic: Dict[str, str] = {}
+        self._folded: Dict[str, str] = {}
+        self._soundex: Dict[str, str] = {}
+
+        for user in users:
+            tokens = tokenize(user.get("name", ""))
+            if not tokens:
+                continue
+            self._user_tokens.append((user, tokens))
+            for tok in tokens:
+                if tok in self._phonetic:
+                    continue
+                self._phonetic[tok] = phonetic_key(tok)
+                self._folded[tok] = folded_spelling(tok)
+                self._soundex[tok] = soundex(tok)
+                self._by_phonetic.setdefault(self._phonetic[tok], set()).add(tok)
+                self._by_soundex.setdefault(self._soundex[tok], set()).add(tok)
+                for tri in _trigrams(tok):
+                    self._by_trigram.setdefault(tri, set()).add(tok)
+
+    def _token_scores(self, query_token: str) -> Dict[str, float]:
+        """Similarity of one query token to every plausibly-close name token."""
+        key = phonetic_key(query_token)
+        folded = folded_spelling(query_token)
+        sdx = soundex(query_token)
+        candidates: Set[str] = set()
+        for tri in _trigrams(query_token):
+            candidates |= self._by_trigram.get(tri, set())
+        candidates |= self._by_phonetic.get(key, set())
+        candidates |= self._by_soundex.get(sdx, set())
+
+        scores: Dict[str, float] = {}
+        max_dist = _max_edits(query_token)
+        for tok in candidates:
+            score = 0.0
+            dist = bounded_levenshtein(query_token, tok, max_dist)
+            if dist is not None:
+                score = 1.0 - dist / max(len(query_token), len(tok))
+            if self._folded[tok] == folded:
+                # Differs only by transliteration — the bonus is earned here and
+                # never by the vowel-less key alone
+                bonus = AGREEMENT_BONUS if dist is not None else 0.0
+                score = max(score, min(max(score, PHONETIC_SCORE) + bonus, 0.99))
+            elif self._phonetic[tok] == key:
+                score = max(score, CONSONANT_SCORE)
+            elif self._soundex[tok] == sdx:
+                score = max(score, SOUNDEX_SCORE)
+            if score:
+                scores[tok] = score
+        return scores
+
+    def rank(self, query: str, limit: int = 5) -> List[Tuple[float, Dict]]:
+        """Users ranked by how well every query token matches one of their name tokens."""
+        q_tokens = tokenize(query)
+        if not q_tokens:
+            return []
+        per_token = [self._token_scores(q) for q in q_tokens]
+
+        ranked: List[Tuple[float, Dict]] = []
+        for user, tokens in self._user_tokens:
+            total = 0.0
+            for scores in per_token:
+                best = max((scores.get(t, 0.0) for t in tokens), default=0.0)
+                if best == 0.0:
+                    break
+                total += best
+            else:
+                ranked.append((total / len(per_token), user))
+        ranked.sort(key=lambda pair: pair[0], reverse=True)
+        return ranked[:limit]
+
+    def match(self, query: str) -> List[Dict]:
+        """
+        [user] when one candidate clearly wins; every candidate within the
+        margin of the best when it is ambiguous; [] when nothing is close.
+        """
+        return self._within_margin(query, MATCH_THRESHOLD)
+
+    def suggest(self, query: str) -> List[Dict]:
+        """Like match() at SUGGEST_THRESHOLD — candidates to ask "did you mean ...?" about, never to auto-accept."""
+        return self._within_margin(query, SUGGEST_THRESHOLD)
+
+    def _within_margin(self, query: str, threshold: float) -> List[Dict]:
+        ranked = [(s, u) for s, u in self.rank(query) if s >= threshold]
+        if not ranked:
+            return []
+        best = ranked[0][0]
+        return [u for s, u in ranked if best - s < CLEAR_MARGIN]
@@ -0,0 +1,194 @@
+"""
+Redis cache for intent classification results.
+
+Opening messages repeat a lot across users ("pending tasks", "Pending
+tasks?", "employee list"), and each one used to cost a full
+INTENT_CLASSIFIER_PROMPT call. Results are cached per normalised message
+and has_document flag:
+
+    intent_cache:<doc>:<sha1(text)>  →  {"i", "c", "r", "sig"}   (TTL)
+
+Optional near-duplicate tier (INTENT_CACHE_NEAR_DUP=1): each entry also
+stores a MinHash signature of its character 3-shingles and is indexed in
+LSH band buckets, so "list of pending task" can reuse the entry for
+"list of pending tasks". Each bucket is a ZSET scored by store time,
+pruned of members older than the entry TTL and capped at
+INTENT_CACHE_BAND_MAX, so a popular bucket can't grow without bound.
+A near hit needs estimated Jaccard >=
+INTENT_CACHE_NEAR_DUP_THRESHOLD and the same scope words (my/me/team...),
+because those are exactly what separates VIEW_PENDING_TASKS from
+PENDING_TASKS_AMBIGUOUS.
+
+Hit / miss counters live in the intent_cache:stats hash so the hit rate
+covers every worker.
+"""
+
+import os
+import re
+import time
+import json
+import random
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from redis_session import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+INTENT_CACHE_ENABLED = os.getenv("INTENT_CACHE", "1") != "0"
+INTENT_CACHE_TTL = int(os.getenv("INTENT_CACHE_TTL", 86400))
+NEAR_DUP_ENABLED = os.getenv("INTENT_CACHE_NEAR_DUP", "0") == "1"
+NEAR_DUP_THRESHOLD = float(os.getenv("INTENT_CACHE_NEAR_DUP_THRESHOLD", 0.85))
+BAND_MAX = int(os.getenv("INTENT_CACHE_BAND_MAX", 50))  # newest entries kept per LSH bucket
+
+_STATS_KEY = "intent_cache:stats"
+
+# MinHash / LSH shape: 32 hashes in 8 bands of 4 rows
+_NUM_HASHES = 32
+_BAND_ROWS = 4
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(1729)  # fixed seed — signatures must agree across workers
+_HASH_PARAMS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(_NUM_HASHES)]
+
+_SCOPE_WORDS = {"my", "me", "mine", "i", "our", "team", "mera", "mere", "meri"}
+
+
+def normalize_message(text: str) -> str:
+    text = (text or "").lower().replace("’", "'")
+    text = re.sub(r"[^\w\s']", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _exact_key(norm: str, has_document: bool) -> str:
+    digest = hashlib.sha1(norm.encode("utf-8")).hexdigest()
+    return f"intent_cache:{int(has_document)}:{digest}"
+
+
+def _band_key(has_document: bool, band: int, values: List[int]) -> str:
+    digest = hashlib.sha1(",".join(map(str, values)).encode()).hexdigest()[:16]
+    return f"intent_cache:lshz:{int(has_document)}:{band}:{digest}"
+
+
+# ─── MinHash ─────────────────────────────────────────────────────────
+
+def minhash_signature(norm: str) -> List[int]:
+    padded = f" {norm} "
+    shingles = {padded[i:i + 3] for i in range(max(len(padded) - 2, 1))}
+    hashed = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in shingles
+    ]
+    return [min((a * h + b) % _MERSENNE for h in hashed) for a, b in _HASH_PARAMS]
+
+
+def _estimated_jaccard(sig_a: List[int], sig_b: List[int]) -> float:
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def _band_keys(sig: List[int], has_document: bool) -> List[str]:
+    return [
+        _band_key(has_document, band, sig[start:start + _BAND_ROWS])
+        for band, start in enumerate(range(0, _NUM_HASHES, _BAND_ROWS))
+    ]
+
+
+def _scope(norm: str) -> frozenset:
+    return frozenset(set(norm.split()) & _SCOPE_WORDS)
+
+
+# ─── Public API ──────────────────────────────────────────────────────
+
+async def get_cached_intent(user_message: str, has_document: bool = False) -> Optional[Tuple[str, float, str]]:
+    """(intent, confidence, reasoning) for this message if cached, else None."""
+    if not INTENT_CACHE_ENABLED:
+        return None
+    norm = normalize_message(user_message)
+    if not norm:
+        return None
+
+    try:
+        raw = await async_redis_client.get(_exact_key(norm, has_document))
+        if raw:
+            await async_redis_client.hincrby(_STATS_KEY, "hits", 1)
+            entry = json.loads(raw)
+            return entry["i"], entry["c"], entry["r"]
+
+        if NEAR_DUP_ENABLED:
+            near = await _near_duplicate(norm, has_document)
+            if near is not None:
+                await async_redis_client.hincrby(_STATS_KEY, "near_hits", 1)
+                return near
+
+        await async_redis_client.hincrby(_STATS_KEY, "misses", 1)
+    except Exception as e:
+        logger.warning(f"[INTENT_CACHE] Lookup failed: {e}")
+    return None
+
+
+async def _near_duplicate(norm: str, has_document: bool) -> Optional[Tuple[str, float, str]]:
+    sig = minhash_signature(norm)
+    async with async_redis_client.pipeline(transaction=False) as pipe:
+        for key in _band_keys(sig, has_document):
+            pipe.zrange(key, 0, -1)
+        buckets = await pipe.execute()
+
+    candidates = set().union(*buckets) if buckets else set()
+    if not candidates:
+        return None
+    keys = list(candidates)
+    entries = await async_redis_client.mget(keys)
+
+    scope = _scope(norm)
+    best, best_score = None, 0.0
+    for raw in entries:
+        if not raw:
+            continue  # expired; pruned from the bucket on a later store
+        entry = json.loads(raw)
+        if "sig" not in entry or frozenset(entry.get("scope", [])) != scope:
+            continue
+        score = _estimated_jaccard(sig, entry["sig"])
+        if score >= NEAR_DUP_THRESHOLD and score > best_score:
+            best, best_score = entry, score
+    if best is None:
+        return None
+    logger.info(f"[INTENT_CACHE] Near-duplicate hit (jaccard≈{best_score:.2f}) → {best['i']}")
+    return best["i"], best["c"], best["r"]
+
+
+async def cache_intent(user_message: str, has_document: bool, intent: str, confidence: float, reasoning: str):
+    """Store a supported classification (failures and timeouts are never cached)."""
+    if not INTENT_CACHE_ENABLED or not intent:
+        return
+    norm = normalize_message(user_message)
+    if not norm:
+        return
+
+    key = _exact_key(norm, has_document)
+    entry: Dict = {"i": intent, "c": confidence, "r": reasoning}
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            if NEAR_DUP_ENABLED:
+                sig = minhash_signature(norm)
+                entry["sig"] = sig
+                entry["scope"] = sorted(_scope(norm))
+                now = time.time()
+                for band_key in _band_keys(sig, has_document):
+                    pipe.zadd(band_key, {key: now})
+                    # Drop members whose entries have expired, then keep the newest BAND_MAX
+                    pipe.zremrangebyscore(band_key, "-inf", now - INTENT_CACHE_TTL)
+                    pipe.zremrangebyrank(band_key, 0, -BAND_MAX - 1)
+                    pipe.expire(band_key, INTENT_CACHE_TTL)
+            pipe.set(key, json.dumps(entry), ex=INTENT_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"[INTENT_CACHE] Store failed: {e}")
+
+
+async def get_intent_cache_stats() -> Dict[str, float]:
+    """Cluster-wide hits / near_hits / misses and the resulting hit rate."""
+    raw = await async_redis_client.hgetall(_STATS_KEY)
+    stats = {k: int(raw.get(k, 0)) for k in ("hits", "near_hits", "misses")}
+    total = sum(stats.values())
+    stats["hit_rate"] = (stats["hits"] + stats["near_hits"]) / total if total else 0.0
+    return stats
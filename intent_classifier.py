@@ -3,20 +3,18 @@ import json
 import re
 import asyncio
 import logging
-import concurrent.futures
+import datetime
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-from google.genai import Client
+
+import llm_gateway
+from intent_cache import get_cached_intent, cache_intent
 
 # Load environment variables
 load_dotenv()
 
 MODEL_NAME = "gemini-2.0-flash"
-
-# Dedicated thread pool for blocking Gemini SDK calls (avoids starving default pool)
-_classifier_executor = concurrent.futures.ThreadPoolExecutor(
-    max_workers=20,
-    thread_name_prefix="intent-classifier"
-)
+CLASSIFIER_TIMEOUT = 20  # seconds
 
 SUPPORTED_INTENTS = {
     "TASK_ASSIGNMENT",
@@ -202,17 +200,93 @@ Format:
 }
 """
 
-# Module-level Gemini client singleton
-_gemini_client: Client | None = None
-
-def init_gemini() -> Client:
-    global _gemini_client
-    if _gemini_client is None:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise EnvironmentError("GEMINI_API_KEY missing")
-        _gemini_client = Client(api_key=api_key)
-    return _gemini_client
+# ─── Deterministic fast path ─────────────────────────────────────────
+# Keyword rules for phrasings that need no language understanding
+# ("employee list", "show my pending tasks", "mark task 12 as done").
+# A rule answers only when it is confident and no rule for a different
+# intent also fires; everything else falls through to Gemini.
+# Precision is tracked against intent_fixtures.jsonl by
+# benchmark_intent_fast_path.py — re-run it after editing a rule.
+
+FAST_PATH_ENABLED = os.getenv("INTENT_FAST_PATH", "1") != "0"
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("INTENT_FAST_PATH_MIN_CONFIDENCE", 0.9))
+
+_ACTION_VERBS = r"\b(assign|add|create|delete|remove|deactivate|register|mark|update|close|complete|completed|done|finish|finished)\b"
+
+# (intent, confidence, pattern, exclude-pattern)
+_FAST_PATH_RULES = [
+    ("VIEW_EMPLOYEES_UNDER_MANAGER", 0.95,
+     r"^(show |list |get |give me )?(me )?(the )?(list of )?(my |all )?(employees?|users?|team members?|team|reportees|subordinates)( list)?( under me)?$"
+     r"|\bwho (are my team members|reports? to me|works? under me)\b"
+     r"|\b(employees?|people|users?) (under|reporting to) me\b",
+     r"\b(pending|tasks?|performance|report)\b|" + _ACTION_VERBS),
+    ("VIEW_PENDING_TASKS", 0.93,
+     r"\b(my|mine) (pending |open |unfinished )?tasks\b|\btasks? (are )?(still )?pending for me\b"
+     r"|\bpending tasks? for me\b|\bshow me my tasks\b",
+     r"\b(team|performance|employees?)\b|\btask\s*\d+|" + _ACTION_VERBS),
+    ("PENDING_TASKS_AMBIGUOUS", 0.92,
+     r"^(show |list |get |view )?(me )?(the )?(list of )?(all )?pending tasks$"
+     r"|^(what are|are there any|any) (the )?pending tasks$|^tasks that are pending$",
+     None),
+    ("VIEW_EMPLOYEE_PERFORMANCE", 0.93,
+     r"\bperformance\b|\bpending tasks (of|for) (my )?team\b|\bteam'?s? pending tasks\b",
+     r"\b(add|delete|remove|assign|deactivate|register)\b"),
+    ("UPDATE_TASK_STATUS", 0.94,
+     r"\b(mark|update|close|set)\b.*\btask\s*(id\s*)?#?\d+|\btask\s*(id\s*)?#?\d+\b.*\b(done|completed?|closed|finished|in progress)\b"
+     r"|\bmark\b.*(\btask\b|\bkaam\b|#\d+).*\b(done|completed?|closed|in progress)\b|\bupdate (the )?task status\b",
+     r"\b(assign|add|create|delete|remove)\b"),
+    ("ADD_USER", 0.92,
+     r"^(please )?(add|register|onboard|create)\b.*\b(user|employee|account|member|manager)\b",
+     r"\btasks?\b|\bperformance\b"),
+    ("DELETE_USER", 0.92,
+     r"^(please )?(delete|remove|deactivate)\b.*\b(user|employee|account|member|from the system)\b",
+     r"\btasks?\b"),
+    ("TASK_ASSIGNMENT", 0.9,
+     r"^(please )?(assign\b|(create|give|add) (a |an )?(new )?task\b|give \w+ (a |an )?(new )?task\b)",
+     r"\btask\s*(id\s*)?#?\d+|\bstatus\b|\bmark\b"),
+]
+_COMPILED_FAST_PATH_RULES = [
+    (intent, confidence, re.compile(pattern), re.compile(exclude) if exclude else None)
+    for intent, confidence, pattern, exclude in _FAST_PATH_RULES
+]
+_DOCUMENT_INTENTS = {"TASK_ASSIGNMENT", "UPDATE_TASK_STATUS"}
+
+
+def _normalize_for_rules(text: str) -> str:
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^\w\s'#]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def fast_path_intent(user_message: str, has_document: bool = False):
+    """
+    Return (intent, confidence, reasoning) when the keyword rules are sure,
+    else None (caller falls through to Gemini).
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    text = _normalize_for_rules(user_message)
+    if not text:
+        return None
+
+    hits = {}
+    for intent, confidence, pattern, exclude in _COMPILED_FAST_PATH_RULES:
+        if pattern.search(text) and not (exclude and exclude.search(text)):
+            hits[intent] = max(confidence, hits.get(intent, 0.0))
+
+    if len(hits) != 1:
+        return None  # nothing matched, or rules disagree
+    intent, confidence = hits.popitem()
+    if has_document and intent not in _DOCUMENT_INTENTS:
+        return None
+    if confidence < FAST_PATH_MIN_CONFIDENCE:
+        return None
+    return intent, confidence, f"fast-path rule matched ({intent})"
+
+
+def init_gemini():
+    """Shared Gemini client (owned by llm_gateway)."""
+    return llm_gateway.get_client()
 
 def clean_json(text: str) -> str:
     text = text.strip()
@@ -221,19 +295,25 @@ def clean_json(text: str) -> str:
     text = re.sub(r"```$", "", text)
     return text.strip()
 
-def intent_classifier(user_message: str, has_document: bool = False):
-    client = init_gemini()
+DOCUMENT_CONTEXT = "CONTEXT: The user has uploaded a document and is replying to a prompt about it. The intent MUST be either 'TASK_ASSIGNMENT' or 'UPDATE_TASK_STATUS'. Do NOT choose other intents."
 
-    prompt = INTENT_CLASSIFIER_PROMPT
-    if has_document:
-        prompt += "\n\nCONTEXT: The user has uploaded a document and is replying to a prompt about it. The intent MUST be either 'TASK_ASSIGNMENT' or 'UPDATE_TASK_STATUS'. Do NOT choose other intents."
+# Fixed instructions are sent once per cache lifetime by llm_gateway;
+# only the per-call part below travels with each request.
+CLASSIFIER_STATIC = llm_gateway.register_static_prompt("intent_classifier", INTENT_CLASSIFIER_PROMPT)
+
+
+def _dynamic_part(user_message: str, has_document: bool) -> str:
+    context = f"{DOCUMENT_CONTEXT}\n\n" if has_document else ""
+    return f"{context}User message:\n{user_message}"
 
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=f"{prompt}\n\nUser message:\n{user_message}"
-    )
 
-    cleaned = clean_json(response.text)
+def _build_prompt(user_message: str, has_document: bool) -> str:
+    """Full single-string prompt (blocking CLI path)."""
+    return f"{INTENT_CLASSIFIER_PROMPT}\n\n{_dynamic_part(user_message, has_document)}"
+
+
+def _parse_classifier_response(text: str):
+    cleaned = clean_json(text or "")
 
     try:
         result = json.loads(cleaned)
@@ -252,18 +332,168 @@ def intent_classifier(user_message: str, has_document: bool = False):
     return False, None, confidence, reasoning
 
 
+# ─── Combined classify + extract ─────────────────────────────────────
+# One Gemini call that returns the intent AND whatever slots the first
+# message already contains, so a complete one-shot command ("Assign report
+# to Rahul by 7pm") skips the separate Agent-2 round-trip.
+
+COMBINED_EXTRACTION_PROMPT = """
+### SLOT EXTRACTION (in the same response)
+Besides the intent, extract the fields below for the chosen intent — ONLY
+values the user explicitly stated. Omit a field that is not present; never
+guess, never ask questions here.
+
+TASK_ASSIGNMENT: assignee (name or phone as written), task_name (user's
+  words as-is), deadline (ISO 8601). A deadline exists ONLY for explicit
+  times/dates ("7pm", "tomorrow 3pm", "EOD", "by Friday"); "ASAP", "when
+  done", "urgently" are NOT deadlines. "EOD" = 18:00 today. A bare time is
+  today, or tomorrow if it has already passed.
+UPDATE_TASK_STATUS: task_id, status (exactly one of "Open",
+  "Work In Progress", "Closed", "Reopened" — finished/done/completed →
+  "Closed"), remark (optional).
+ADD_USER: name (as given), mobile (digits), email (optional).
+DELETE_USER: name, mobile.
+VIEW_EMPLOYEE_PERFORMANCE: report_type ("Count" when a specific person is
+  named, else "Detail"), name (the person, or null).
+Other intents: slots = {}.
+
+Format (STRICT JSON only — this replaces the format above):
+{
+  "intent": "<ONE_INTENT_OR_NULL>",
+  "confidence": 0.0,
+  "reasoning": "short explanation",
+  "slots": { }
+}
+"""
+
+COMBINED_STATIC = llm_gateway.register_static_prompt(
+    "intent_classify_extract",
+    f"{INTENT_CLASSIFIER_PROMPT}\n{COMBINED_EXTRACTION_PROMPT}"
+)
+
+# Slots each intent's tool accepts — field → allowed values (None = free text).
+# engine.AGENT2_SLOT_FIELDS builds the Agent-2 response schema from this map.
+SLOT_FIELDS: Dict[str, Dict[str, Optional[List[str]]]] = {
+    "TASK_ASSIGNMENT": {"assignee": None, "task_name": None, "deadline": None},
+    "UPDATE_TASK_STATUS": {
+        "task_id": None,
+        "status": ["Open", "Work In Progress", "Closed", "Reopened"],
+        "remark": None,
+    },
+    "ADD_USER": {"name": None, "mobile": None, "email": None},
+    "DELETE_USER": {"name": None, "mobile": None},
+    "VIEW_EMPLOYEE_PERFORMANCE": {"report_type": ["Detail", "Count"], "name": None},
+}
+
+
+def _combined_dynamic_part(user_message: str, current_time: datetime.datetime) -> str:
+    return (
+        f"Current Date: {current_time.strftime('%Y-%m-%d')}\n"
+        f"Current Time: {current_time.strftime('%I:%M %p')}\n\n"
+        f"User message:\n{user_message}"
+    )
+
+
+def _clean_slots(intent: Optional[str], slots) -> Dict:
+    """
+    Keep only the intent's own fields (extra keys would break the tool's
+    keyword arguments), non-empty and within their allowed values.
+    """
+    fields = SLOT_FIELDS.get(intent)
+    if not fields or not isinstance(slots, dict):
+        return {}
+    cleaned = {
+        k: v for k, v in slots.items()
+        if k in fields and v not in (None, "") and (fields[k] is None or v in fields[k])
+    }
+    if intent == "TASK_ASSIGNMENT" and "deadline" in cleaned:
+        try:
+            datetime.datetime.fromisoformat(str(cleaned["deadline"]))
+        except ValueError:
+            cleaned.pop("deadline")
+    return cleaned
+
+
+async def async_classify_and_extract(user_message: str, current_time: datetime.datetime):
+    """
+    (is_supported, intent, confidence, reasoning, slots).
+    Rule fast path and cache hits carry no slots — Agent 2 extracts them as before.
+    """
+    fast = fast_path_intent(user_message)
+    if fast:
+        intent, confidence, reasoning = fast
+        logging.getLogger(__name__).info(f"[INTENT_FAST_PATH] {intent} ({confidence:.2f}) — Gemini skipped")
+        return True, intent, confidence, reasoning, {}
+
+    cached = await get_cached_intent(user_message)
+    if cached:
+        intent, confidence, reasoning = cached
+        logging.getLogger(__name__).info(f"[INTENT_CACHE] hit → {intent} — Gemini skipped")
+        return True, intent, confidence, reasoning, {}
+
+    try:
+        response = await llm_gateway.generate(
+            _combined_dynamic_part(user_message, current_time),
+            static=COMBINED_STATIC,
+            label="INTENT_CLASSIFY_EXTRACT",
+            priority=llm_gateway.PRIORITY_CLASSIFY,
+            model=MODEL_NAME,
+            timeout=CLASSIFIER_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logging.getLogger(__name__).error(
+            f"[INTENT_CLASSIFIER_TIMEOUT] Timed out classifying: {user_message[:80]}"
+        )
+        return False, None, 0.0, "Classification timed out", {}
+
+    text = llm_gateway.response_text(response)
+    is_supported, intent, confidence, reasoning = _parse_classifier_response(text)
+    slots = {}
+    if is_supported:
+        try:
+            slots = _clean_slots(intent, json.loads(clean_json(text)).get("slots"))
+        except Exception:
+            slots = {}
+        await cache_intent(user_message, False, intent, confidence, reasoning)
+    return is_supported, intent, confidence, reasoning, slots
+
+
+def intent_classifier(user_message: str, has_document: bool = False):
+    """Blocking variant for the interactive CLI below; the webhook uses async_intent_classifier."""
+    fast = fast_path_intent(user_message, has_document)
+    if fast:
+        intent, confidence, reasoning = fast
+        return True, intent, confidence, reasoning
+
+    response = init_gemini().models.generate_content(
+        model=MODEL_NAME,
+        contents=_build_prompt(user_message, has_document)
+    )
+    return _parse_classifier_response(response.text)
+
+
 async def async_intent_classifier(user_message: str, has_document: bool = False):
-    """Async wrapper with timeout protection — prevents thread pool starvation."""
-    loop = asyncio.get_running_loop()
+    """Fast path → Redis cache → Gemini via the shared async gateway (cancelled on timeout)."""
+    fast = fast_path_intent(user_message, has_document)
+    if fast:
+        intent, confidence, reasoning = fast
+        logging.getLogger(__name__).info(f"[INTENT_FAST_PATH] {intent} ({confidence:.2f}) — Gemini skipped")
+        return True, intent, confidence, reasoning
+
+    cached = await get_cached_intent(user_message, has_document)
+    if cached:
+        intent, confidence, reasoning = cached
+        logging.getLogger(__name__).info(f"[INTENT_CACHE] hit → {intent} — Gemini skipped")
+        return True, intent, confidence, reasoning
+
     try:
-        return await asyncio.wait_for(
-            loop.run_in_executor(
-                _classifier_executor,
-                intent_classifier,
-                user_message,
-                has_document
-            ),
-            timeout=20
+        response = await llm_gateway.generate(
+            _dynamic_part(user_message, has_document),
+            static=CLASSIFIER_STATIC,
+            label="INTENT_CLASSIFIER",
+            priority=llm_gateway.PRIORITY_CLASSIFY,
+            model=MODEL_NAME,
+            timeout=CLASSIFIER_TIMEOUT
         )
     except asyncio.TimeoutError:
         logging.getLogger(__name__).error(
@@ -271,6 +501,12 @@ async def async_intent_classifier(user_message: str, has_document: bool = False)
         )
         return False, None, 0.0, "Classification timed out"
 
+    result = _parse_classifier_response(llm_gateway.response_text(response))
+    is_supported, intent, confidence, reasoning = result
+    if is_supported:
+        await cache_intent(user_message, has_document, intent, confidence, reasoning)
+    return result
+
 
 # -----------------------------
 # REAL USER INPUT (INTERACTIVE)
@@ -0,0 +1,310 @@
+"""
+Shared async gateway for every Gemini call.
+
+Replaces the per-module ThreadPoolExecutors (intent classifier, Agent 3,
+engine extractor — 60 threads between them) with the SDK's native async
+API (client.aio). A timed-out call is cancelled on the event loop, so it
+stops holding a connection instead of leaving a blocked thread behind.
+
+Admission control, shared by all callers:
+  - a concurrency limit (LLM_MAX_CONCURRENCY)
+  - token buckets for the provider's requests/min and tokens/min quotas
+    (LLM_RPM / LLM_TPM); token cost is estimated up front and corrected
+    from usage_metadata afterwards
+  - a priority queue: confirmations and slot-fills of conversations
+    already in progress are admitted before new classifications
+  - load shedding: when the queue is too deep, or a call cannot be
+    admitted within LLM_MAX_QUEUE_WAIT, LLMOverloaded is raised at once
+    so the user gets a "busy, try again" reply instead of a long timeout
+
+Static prompt prefixes: large fixed instructions are registered once at
+import (register_static_prompt) and passed by name; the gateway sends
+them as system_instruction, so only the small dynamic part travels in
+`contents`. Explicit context caching (cached_content) was tried and
+removed: the largest registered prompt is ~1.8k tokens, below the
+model's minimum cacheable size, so a cache was never created. Run
+benchmark_prompt_tokens.py to re-measure before reconsidering. Per-label
+prompt / cached token counts (cached = implicit caching by the model)
+and latency are kept in gateway_stats().
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from google.genai import Client, types
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_DEFAULT_TIMEOUT = float(os.getenv("LLM_DEFAULT_TIMEOUT", 30))
+LLM_RPM = int(os.getenv("LLM_RPM", 1000))
+LLM_TPM = int(os.getenv("LLM_TPM", 1000000))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 100))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", 10))
+LLM_EXPECTED_OUTPUT_TOKENS = 200
+
+# Lower value = admitted first
+PRIORITY_CONFIRM = 0      # yes/no and own/team replies to our own question
+PRIORITY_SLOT_FILL = 1    # Agent-2 extraction for a conversation in progress
+PRIORITY_GUARD = 2        # Agent-3 topic-shift check
+PRIORITY_CLASSIFY = 3     # first message of a new conversation
+
+BUSY_MESSAGE = "I'm handling a lot of requests right now. Please send that again in a minute."
+
+
+class LLMOverloaded(Exception):
+    """Raised instead of queueing when the gateway is saturated."""
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute; may go negative after a usage correction."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class _Admission:
+    """Priority-ordered admission under the concurrency limit and rate buckets."""
+
+    def __init__(self):
+        self.cond = asyncio.Condition()
+        self.waiting: list = []  # heap of (priority, seq)
+        self.seq = itertools.count()
+        self.active = 0
+        self.requests = TokenBucket(LLM_RPM)
+        self.tokens = TokenBucket(LLM_TPM)
+        self.admitted = 0
+        self.shed = 0
+
+    def depth(self, max_priority: Optional[int] = None) -> int:
+        if max_priority is None:
+            return len(self.waiting)
+        return sum(1 for p, _ in self.waiting if p <= max_priority)
+
+    async def acquire(self, priority: int, est_tokens: int, max_wait: float, label: str):
+        entry = (priority, next(self.seq))
+        async with self.cond:
+            # Shed before queueing: new conversations go first; in-progress
+            # ones are only refused when twice the queue limit is reached.
+            limit = LLM_MAX_QUEUE if priority >= PRIORITY_CLASSIFY else LLM_MAX_QUEUE * 2
+            if self.depth(priority) >= limit:
+                self.shed += 1
+                logger.warning(f"[LLM_GATEWAY] Shedding {label} (p{priority}) — queue depth {len(self.waiting)}")
+                raise LLMOverloaded(label)
+
+            heapq.heappush(self.waiting, entry)
+            deadline = time.monotonic() + max_wait
+            try:
+                while True:
+                    timeout = None
+                    if self.waiting[0] == entry and self.active < LLM_MAX_CONCURRENCY:
+                        wait = max(self.requests.wait_time(1), self.tokens.wait_time(est_tokens))
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(est_tokens)
+                            heapq.heappop(self.waiting)
+                            self.active += 1
+                            self.admitted += 1
+                            self.cond.notify_all()  # the next head may also fit
+                            return
+                        timeout = wait
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        logger.warning(f"[LLM_GATEWAY] Shedding {label} (p{priority}) — not admitted within {max_wait:.1f}s")
+                        raise LLMOverloaded(label)
+                    try:
+                        await asyncio.wait_for(self.cond.wait(), min(timeout or remaining, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self.cond.notify_all()
+                raise
+
+    async def release(self, token_correction: float = 0.0):
+        async with self.cond:
+            self.active -= 1
+            if token_correction:
+                self.tokens.adjust(token_correction)
+            self.cond.notify_all()
+
+
+_client: Optional[Client] = None
+_admission = _Admission()
+_label_stats: Dict[str, Dict[str, float]] = {}
+
+
+def get_client() -> Client:
+    """Module-level Gemini client singleton."""
+    global _client
+    if _client is None:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise EnvironmentError("GEMINI_API_KEY missing")
+        _client = Client(api_key=api_key)
+    return _client
+
+
+# ─── Static prompt prefixes ──────────────────────────────────────────
+
+_static_prompts: Dict[str, str] = {}
+def register_static_prompt(name: str, text: str) -> str:
+    """Register fixed instructions once (at import); pass `name` as generate(static=...)."""
+    _static_prompts[name] = text
+    return name
+
+
+def _static_config(name: str, config: Any):
+    """GenerateContentConfig carrying the static prefix as system_instruction."""
+    if config is None:
+        return types.GenerateContentConfig(system_instruction=_static_prompts[name])
+    return config.model_copy(update={"system_instruction": _static_prompts[name]})
+
+
+def _record(label: str, response, latency_ms: float):
+    stats = _label_stats.setdefault(
+        label, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "latency_ms": 0.0}
+    )
+    usage = getattr(response, "usage_metadata", None)
+    stats["calls"] += 1
+    stats["prompt_tokens"] += getattr(usage, "prompt_token_count", None) or 0
+    stats["cached_tokens"] += getattr(usage, "cached_content_token_count", None) or 0
+    stats["latency_ms"] += latency_ms
+
+
+def in_flight() -> int:
+    """Gemini requests currently admitted."""
+    return _admission.active
+
+
+def gateway_stats() -> Dict[str, Any]:
+    """Queue depth per priority, in-flight calls and admission counters."""
+    by_priority: Dict[int, int] = {}
+    for priority, _ in _admission.waiting:
+        by_priority[priority] = by_priority.get(priority, 0) + 1
+    return {
+        "in_flight": _admission.active,
+        "queue_depth": len(_admission.waiting),
+        "queue_by_priority": by_priority,
+        "admitted": _admission.admitted,
+        "shed": _admission.shed,
+        "rpm_available": round(_admission.requests.tokens, 1),
+        "tpm_available": round(_admission.tokens.tokens),
+        "labels": {
+            label: {
+                "calls": int(st["calls"]),
+                "avg_prompt_tokens": round(st["prompt_tokens"] / st["calls"]),
+                "avg_cached_tokens": round(st["cached_tokens"] / st["calls"]),
+                "avg_latency_ms": round(st["latency_ms"] / st["calls"], 1),
+            }
+            for label, st in _label_stats.items() if st["calls"]
+        },
+    }
+
+
+def _estimate_tokens(contents: Any) -> int:
+    # ~4 characters per token is close enough for admission purposes
+    return len(str(contents)) // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+
+async def generate(
+    contents: Any,
+    *,
+    label: str,
+    priority: int = PRIORITY_SLOT_FILL,
+    model: str = DEFAULT_MODEL,
+    timeout: float = LLM_DEFAULT_TIMEOUT,
+    config: Any = None,
+    static: Optional[str] = None
+):
+    """
+    generate_content through the shared gateway.
+    `static` names a prompt registered with register_static_prompt(); it is
+    sent as the system-instruction prefix ahead of `contents`.
+    Raises LLMOverloaded when the call is shed, asyncio.TimeoutError after
+    `timeout` seconds (queueing included); a timed-out request is
+    cancelled, not abandoned.
+    """
+    start = time.perf_counter()
+    if static is not None:
+        config = _static_config(static, config)
+    est_tokens = _estimate_tokens(contents) + (len(_static_prompts[static]) // 4 if static else 0)
+    await _admission.acquire(priority, est_tokens, min(LLM_MAX_QUEUE_WAIT, timeout), label)
+    queued_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    correction = 0.0
+    try:
+        call_timeout = max(timeout - queued_ms / 1000, 0.1)
+        response = await asyncio.wait_for(
+            get_client().aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config
+            ),
+            timeout=call_timeout
+        )
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None) if usage else None
+        if actual:
+            correction = actual - est_tokens
+    except asyncio.TimeoutError:
+        logger.error(f"[LLM_GATEWAY] {label} timed out after {timeout}s (cancelled)")
+        raise
+    finally:
+        await _admission.release(correction)
+
+    duration = round((time.perf_counter() - start) * 1000, 2)
+    _record(label, response, duration)
+    usage = getattr(response, "usage_metadata", None)
+    logger.info(
+        f"[LLM_GATEWAY] {label} | model={model} | p{priority} | queued={queued_ms}ms | "
+        f"duration={duration}ms | prompt_tokens={getattr(usage, 'prompt_token_count', None)} | "
+        f"cached_tokens={getattr(usage, 'cached_content_token_count', None)} | "
+        f"in_flight={_admission.active} | queue={len(_admission.waiting)}"
+    )
+    return response
+
+
+def response_text(response) -> Optional[str]:
+    """Stripped text of a generate_content response, or None."""
+    if response is None:
+        return None
+    if getattr(response, "text", None):
+        return response.text.strip()
+    try:
+        return response.candidates[0].content.parts[0].text.strip()
+    except Exception:
+        return None
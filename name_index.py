@@ -0,0 +1,100 @@
+"""
+Per-team name index for assignee resolution.
+
+Built once per (org graph, manager) instead of compiling a word-boundary
+regex per member per message:
+  - names are split into normalised word tokens
+  - every contiguous token run of every name maps to its users, so
+    "which members have `rahul kumar` as whole words" is one dict lookup
+  - full names are loaded into a token trie, so finding every member
+    named anywhere in a message is a single left-to-right pass over the
+    message tokens (Aho-Corasick at word granularity)
+  - phone and login-code lookups are plain dicts
+  - a FuzzyNameMatcher (fuzzy_match.py) is built on first use for
+    misspelt names
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from user_resolver import normalize_phone
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Lower-cased word tokens — the same notion of word as regex \\b."""
+    return tuple(_TOKEN_RE.findall((text or "").lower()))
+
+
+class NameIndex:
+    def __init__(self, users: List[Dict]):
+        self.users: List[Dict] = users
+        self.by_phone: Dict[str, Dict] = {}
+        self.by_login: Dict[str, Dict] = {}
+        self._by_span: Dict[Tuple[str, ...], List[Dict]] = {}
+        self._trie: Dict = {}
+        self._fuzzy = None
+
+        for user in users:
+            phone = normalize_phone(user.get("phone", ""))
+            if phone:
+                self.by_phone.setdefault(phone, user)
+            if user.get("login_code"):
+                self.by_login.setdefault(user["login_code"].lower(), user)
+
+            tokens = tokenize(user.get("name", ""))
+            if not tokens:
+                continue
+            for i in range(len(tokens)):
+                for j in range(i + 1, len(tokens) + 1):
+                    bucket = self._by_span.setdefault(tokens[i:j], [])
+                    if user not in bucket:
+                        bucket.append(user)
+
+            node = self._trie
+            for tok in tokens:
+                node = node.setdefault(tok, {})
+            node.setdefault(None, []).append(user)  # None marks end-of-name
+
+    # ─── Lookups ───
+
+    def get_by_phone(self, phone: str) -> Optional[Dict]:
+        return self.by_phone.get(normalize_phone(phone))
+
+    def get_by_login(self, login_code: str) -> Optional[Dict]:
+        return self.by_login.get((login_code or "").lower())
+
+    def match_name(self, query: str) -> List[Dict]:
+        """Members whose name contains `query` as whole words (e.g. first name only)."""
+        tokens = tokenize(query)
+        return list(self._by_span.get(tokens, [])) if tokens else []
+
+    def _fuzzy_matcher(self):
+        if self._fuzzy is None:
+            from fuzzy_match import FuzzyNameMatcher  # fuzzy_match imports tokenize from here
+            self._fuzzy = FuzzyNameMatcher(self.users)
+        return self._fuzzy
+
+    def fuzzy_match(self, query: str) -> List[Dict]:
+        """Typo / phonetic fallback for match_name (see FuzzyNameMatcher.match)."""
+        return self._fuzzy_matcher().match(query)
+
+    def fuzzy_suggest(self, query: str) -> List[Dict]:
+        """Looser candidates for a "did you mean ...?" question (FuzzyNameMatcher.suggest)."""
+        return self._fuzzy_matcher().suggest(query)
+
+    def find_in_text(self, text: str) -> List[Dict]:
+        """Members whose full name appears (as whole words) anywhere in `text`."""
+        tokens = tokenize(text)
+        found: List[Dict] = []
+        for start in range(len(tokens)):
+            node = self._trie
+            for tok in tokens[start:]:
+                node = node.get(tok)
+                if node is None:
+                    break
+                for user in node.get(None, ()):
+                    if user not in found:
+                        found.append(user)
+        return found
@@ -0,0 +1,106 @@
+"""
+In-memory index of the manager → report hierarchy.
+
+Built once from a single scan of the users collection. Each user gets
+Euler-tour entry/exit numbers (pre-order DFS), so:
+  - is_subordinate(a, b) is an O(1) interval check
+  - a user's whole subtree is a contiguous slice of the tour
+  - ancestor chains are pointer walks over manager links
+"""
+
+from typing import Dict, List, Optional
+
+from user_resolver import normalize_phone
+
+
+class OrgGraph:
+    def __init__(self, users: List[Dict]):
+        self.users: List[Dict] = users
+        self.by_phone: Dict[str, Dict] = {}
+        self.by_login: Dict[str, Dict] = {}
+        self.manager_of: Dict[str, str] = {}
+        self.children: Dict[str, List[str]] = {}
+
+        for user in users:
+            phone = normalize_phone(user.get("phone", ""))
+            if not phone:
+                continue
+            self.by_phone[phone] = user
+            if user.get("login_code"):
+                self.by_login[user["login_code"]] = user
+
+        for phone, user in self.by_phone.items():
+            mgr = normalize_phone(user.get("manager_phone", ""))
+            # Self-managed or dangling managers are roots
+            if mgr and mgr != phone and mgr in self.by_phone:
+                self.manager_of[phone] = mgr
+                self.children.setdefault(mgr, []).append(phone)
+
+        self.order: List[str] = []
+        self.tin: Dict[str, int] = {}
+        self.tout: Dict[str, int] = {}
+        self._build_tour()
+
+    def _build_tour(self):
+        roots = [p for p in self.by_phone if p not in self.manager_of]
+        # Nodes on a manager cycle are unreachable from any root; each
+        # unvisited node after the first pass starts its own tour, which
+        # breaks the cycle at that node.
+        for start in roots + list(self.by_phone):
+            if start in self.tin:
+                continue
+            stack = [(start, False)]
+            while stack:
+                phone, exiting = stack.pop()
+                if exiting:
+                    self.tout[phone] = len(self.order)
+                    continue
+                if phone in self.tin:
+                    continue
+                self.tin[phone] = len(self.order)
+                self.order.append(phone)
+                stack.append((phone, True))
+                for child in reversed(self.children.get(phone, [])):
+                    if child not in self.tin:
+                        stack.append((child, False))
+
+    # ─── Queries ───
+
+    def get(self, phone: str) -> Optional[Dict]:
+        return self.by_phone.get(normalize_phone(phone))
+
+    def get_by_login(self, login_code: str) -> Optional[Dict]:
+        return self.by_login.get(login_code)
+
+    def has_reports(self, phone: str) -> bool:
+        return bool(self.children.get(normalize_phone(phone)))
+
+    def is_subordinate(self, superior_phone: str, target_phone: str) -> bool:
+        """O(1): target's tour entry falls strictly inside superior's interval."""
+        sup = normalize_phone(superior_phone)
+        tgt = normalize_phone(target_phone)
+        if sup == tgt or sup not in self.tin or tgt not in self.tin:
+            return False
+        return self.tin[sup] < self.tin[tgt] < self.tout[sup]
+
+    def subordinates(self, phone: str) -> List[Dict]:
+        """Every user below `phone` (excludes the user) — a slice of the tour."""
+        p = normalize_phone(phone)
+        if p not in self.tin:
+            return []
+        return [self.by_phone[x] for x in self.order[self.tin[p] + 1:self.tout[p]]]
+
+    def ancestors(self, phone: str) -> List[str]:
+        """Phones from the user up to the root (inclusive)."""
+        current = normalize_phone(phone)
+        if current not in self.by_phone:
+            return [current] if current else []
+        chain = [current]
+        seen = {current}
+        while current in self.manager_of:
+            current = self.manager_of[current]
+            if current in seen:
+                break
+            seen.add(current)
+            chain.append(current)
+        return chain
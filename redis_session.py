@@ -1,9 +1,11 @@
 import os
 import json
 import redis
+import redis.asyncio as aioredis
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 import logging
+from dataclasses import dataclass, field
 
 IST = timezone(timedelta(hours=5, minutes=30))
 
@@ -14,33 +16,374 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
+# ─── Async client: one shared connection pool per process ───
+# BlockingConnectionPool makes a burst of coroutines wait for a free
+# connection instead of failing once max_connections is reached.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = 5  # seconds to wait for a free pooled connection
+
+async_redis_pool = aioredis.BlockingConnectionPool(
+    host=os.getenv("REDIS_HOST"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    password=os.getenv("REDIS_PASSWORD"),
+    decode_responses=True,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT
+)
+async_redis_client = aioredis.Redis(connection_pool=async_redis_pool)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ─── Session TTL: auto-expire idle sessions after 30 minutes ───
 SESSION_TTL = 1800  # seconds
 
+# ─── Bounded history: keep the last N entries verbatim, fold older ones ───
+# into a compact summary entry so prompt size stays constant. 0 = unbounded.
+HISTORY_WINDOW = int(os.getenv("SESSION_HISTORY_WINDOW", 20))
+HISTORY_SUMMARY_MAX_CHARS = int(os.getenv("SESSION_HISTORY_SUMMARY_CHARS", 1500))
+HISTORY_SUMMARY_LINE_CHARS = 200  # per evicted turn
+
+# ─── History entry encoding: "compact" (default) or legacy "json" ───
+# Readers accept both, so switching formats needs no migration step.
+HISTORY_FORMAT = os.getenv("SESSION_HISTORY_FORMAT", "compact")
+
+
+# ─── Key layout (shared by the sync and async APIs) ───
+
+def _counter_key(session_key: str) -> str:
+    return f"user_session_counter:{session_key}"
+
+def _active_key(session_key: str) -> str:
+    return f"user_active_session:{session_key}"
+
+def _history_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+def _agent2_key(session_id: str) -> str:
+    return f"agent2_state:{session_id}"
+
+def _summary_key(session_id: str) -> str:
+    return f"session_summary:{session_id}"
+
+def _slots_key(session_id: str) -> str:
+    return f"session_slots:{session_id}"
+
+def _pending_doc_key(session_id: str) -> str:
+    return f"pending_document:{session_id}"
+
+def _pending_doc_state_key(session_id: str) -> str:
+    return f"pending_doc_state:{session_id}"
+
+def _pending_task_key(session_id: str) -> str:
+    return f"pending_task:{session_id}"
+
+def _format_session_id(session_key: str, counter: int) -> str:
+    return f"sess{counter:03d}_{session_key}"
+
+
+# ─── Pipeline builders (queue commands; caller executes sync or async) ───
+
+# RPUSH + EXPIRE, then (if the list exceeds the window) LTRIM it back and
+# fold the evicted entries into the summary key: the latest evicted
+# INTENT_SET is kept, user/assistant turns become clipped "role: text"
+# lines, and the summary text keeps only its most recent characters.
+_APPEND_HISTORY_LUA = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+local window = tonumber(ARGV[3])
+if window <= 0 then
+    return 0
+end
+local overflow = redis.call('LLEN', KEYS[1]) - window
+if overflow <= 0 then
+    return 0
+end
+local evicted = redis.call('LRANGE', KEYS[1], 0, overflow - 1)
+redis.call('LTRIM', KEYS[1], overflow, -1)
+
+local summary = {intent = '', turns = 0, text = ''}
+local raw = redis.call('GET', KEYS[2])
+if raw then
+    summary = cjson.decode(raw)
+end
+-- Mirrors _decode_history_entry: compact entries start with byte 0x01
+local roles = {[0] = 'user', [1] = 'assistant', [2] = 'system', [3] = 'slots'}
+local function decode_entry(entry)
+    if string.byte(entry, 1) == 1 then
+        local ok, t = pcall(cjson.decode, string.sub(entry, 2))
+        if ok and type(t) == 'table' then
+            return {role = roles[t[1]] or t[1], content = t[2]}
+        end
+        return nil
+    end
+    local ok, msg = pcall(cjson.decode, entry)
+    if ok and type(msg) == 'table' then
+        return msg
+    end
+    return nil
+end
+
+-- Lua strings are bytes: cut on UTF-8 character boundaries so a Hindi or
+-- emoji message never leaves a broken sequence in the summary
+local function is_char_start(b)
+    return b < 0x80 or b >= 0xC0
+end
+local function head_chars(s, n)
+    local count = 0
+    for i = 1, #s do
+        if is_char_start(string.byte(s, i)) then
+            count = count + 1
+            if count > n then
+                return string.sub(s, 1, i - 1)
+            end
+        end
+    end
+    return s
+end
+local function tail_chars(s, n)
+    local count = 0
+    for i = #s, 1, -1 do
+        if is_char_start(string.byte(s, i)) then
+            count = count + 1
+            if count == n then
+                return string.sub(s, i)
+            end
+        end
+    end
+    return s
+end
+
+for _, entry in ipairs(evicted) do
+    local msg = decode_entry(entry)
+    if msg and type(msg.content) == 'string' then
+        summary.turns = summary.turns + 1
+        if msg.role == 'system' and string.find(msg.content, 'INTENT_SET:', 1, true) then
+            summary.intent = msg.content
+        elseif msg.role == 'user' or msg.role == 'assistant' then
+            summary.text = summary.text .. msg.role .. ': '
+                .. head_chars(msg.content, tonumber(ARGV[5])) .. '\\n'
+        end
+    end
+end
+summary.text = tail_chars(summary.text, tonumber(ARGV[4]))
+summary.ts = ARGV[6]
+redis.call('SET', KEYS[2], cjson.encode(summary), 'EX', ARGV[2])
+return overflow
+"""
+
+def _queue_refresh_ttl(pipe, session_key: str, session_id: str):
+    """Sliding window: refresh TTL on every interaction."""
+    pipe.expire(_active_key(session_key), SESSION_TTL)
+    pipe.expire(_history_key(session_id), SESSION_TTL)
+    pipe.expire(_agent2_key(session_id), SESSION_TTL)
+    pipe.expire(_slots_key(session_id), SESSION_TTL)
+    pipe.expire(_summary_key(session_id), SESSION_TTL)
+
+# Sent by SHA; a pipeline (sync or async) SCRIPT LOADs it on execute when missing
+_append_history_script = redis_client.register_script(_APPEND_HISTORY_LUA)
+
+def _queue_script(pipe, script, keys: list, args: list):
+    """EVALSHA `script` inside a pipeline instead of resending its source."""
+    pipe.scripts.add(script)
+    pipe.evalsha(script.sha, len(keys), *keys, *args)
+
+def _queue_append(pipe, session_id: str, role: str, content: str | dict):
+    """RPUSH + EXPIRE for one history entry. Content can be string or dict (for slots)"""
+    now = datetime.now(IST)
+    ts = now.isoformat()
+    entry = _history_serializer.encode(role, content, now)
+    if HISTORY_WINDOW <= 0:
+        pipe.rpush(_history_key(session_id), entry)
+        pipe.expire(_history_key(session_id), SESSION_TTL)
+        return
+    _queue_script(
+        pipe, _append_history_script,
+        [_history_key(session_id), _summary_key(session_id)],
+        [entry, SESSION_TTL, HISTORY_WINDOW, HISTORY_SUMMARY_MAX_CHARS, HISTORY_SUMMARY_LINE_CHARS, ts]
+    )
+
+def _queue_set_slots(pipe, session_id: str, changed: dict):
+    """HSET only the changed slot fields (values JSON-encoded) + EXPIRE."""
+    if not changed:
+        return
+    pipe.hset(_slots_key(session_id), mapping={k: json.dumps(v) for k, v in changed.items()})
+    pipe.expire(_slots_key(session_id), SESSION_TTL)
+
+def _queue_end_session(pipe, session_key: str, session_id: str):
+    """Delete every key owned by a session plus the user's active pointer."""
+    pipe.delete(_history_key(session_id))
+    pipe.delete(_summary_key(session_id))
+    pipe.delete(_pending_task_key(session_id))
+    pipe.delete(_pending_doc_key(session_id))
+    pipe.delete(_pending_doc_state_key(session_id))
+    pipe.delete(_agent2_key(session_id))
+    pipe.delete(_slots_key(session_id))
+    pipe.delete(_active_key(session_key))
+
+
+# ─── History entry serializers ───
+
+class JsonHistorySerializer:
+    """
+    Original layout: {"role", "content", "ts"} JSON envelope with ISO
+    timestamps; dict content (slots) is JSON-encoded a second time.
+    """
+    name = "json"
+
+    def encode(self, role: str, content: str | dict, ts: datetime) -> str:
+        return json.dumps({
+            "role": role,
+            "content": content if isinstance(content, str) else json.dumps(content),
+            "ts": ts.isoformat()
+        })
+
+    def decode(self, raw: str) -> Dict:
+        msg = json.loads(raw)
+        if msg["role"] == "slots" and isinstance(msg["content"], str):
+            try:
+                msg["content"] = json.loads(msg["content"])
+            except json.JSONDecodeError:
+                pass
+        return msg
+
+
+class CompactHistorySerializer:
+    """
+    Version byte 0x01 followed by a positional JSON array
+    [role_code, content, epoch_ms]. Content is stored natively (no double
+    encoding), roles are small ints and non-ASCII text is not escaped.
+    Decoded entries keep "ts" as epoch milliseconds (see _entry_time);
+    formatting an ISO string per entry would double the parse cost.
+    """
+    name = "compact"
+    VERSION = "\x01"
+    ROLE_CODES = {"user": 0, "assistant": 1, "system": 2, "slots": 3}
+    ROLE_NAMES = {v: k for k, v in ROLE_CODES.items()}
+
+    def encode(self, role: str, content: str | dict, ts: datetime) -> str:
+        return self.VERSION + json.dumps(
+            [self.ROLE_CODES.get(role, role), content, int(ts.timestamp() * 1000)],
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+
+    def decode(self, raw: str) -> Dict:
+        role, content, ts_ms = json.loads(raw[1:])
+        return {
+            "role": self.ROLE_NAMES.get(role, role),
+            "content": content,
+            "ts": ts_ms
+        }
+
+
+HISTORY_SERIALIZERS = {
+    JsonHistorySerializer.name: JsonHistorySerializer(),
+    CompactHistorySerializer.name: CompactHistorySerializer(),
+}
+_history_serializer = HISTORY_SERIALIZERS.get(HISTORY_FORMAT, HISTORY_SERIALIZERS["compact"])
+
+
+def _entry_time(msg: Dict) -> datetime:
+    """Timestamp of a decoded history entry (ISO string or epoch ms)."""
+    ts = msg["ts"]
+    if isinstance(ts, (int, float)):
+        return datetime.fromtimestamp(ts / 1000, IST)
+    return datetime.fromisoformat(ts)
+
+
+def _decode_history_entry(raw: str) -> Dict:
+    """Decode one list entry in whichever format it was written."""
+    if raw.startswith(CompactHistorySerializer.VERSION):
+        return HISTORY_SERIALIZERS["compact"].decode(raw)
+    return HISTORY_SERIALIZERS["json"].decode(raw)
+
+
+# ─── Value encoders / decoders ───
+
+def _encode_doc_state(is_first_message: bool) -> str:
+    return json.dumps({
+        "is_first_message": is_first_message,
+        "timestamp": datetime.now(IST).isoformat()
+    })
+
+def _decode_json(raw: Optional[str]) -> Optional[dict]:
+    return json.loads(raw) if raw else None
+
+def _empty_agent2_state() -> dict:
+    return {
+        "intent": None,
+        "parameters": {},
+        "ready": False
+    }
+
+def _apply_agent2_update(
+    state: dict,
+    intent: Optional[str],
+    parameters: Optional[dict],
+    ready: Optional[bool]
+) -> dict:
+    if intent is not None:
+        state["intent"] = intent
+    if parameters is not None:
+        state["parameters"].update(parameters)
+    if ready is not None:
+        state["ready"] = ready
+    return state
+
+def _last_entry_timestamp(raw: list) -> Optional[datetime]:
+    if raw:
+        try:
+            msg = _decode_history_entry(raw[0])
+            return _entry_time(msg)
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError, IndexError):
+            pass
+    return None
+
+def _decode_slots(raw: dict) -> dict:
+    slots = {}
+    for field_name, value in raw.items():
+        try:
+            slots[field_name] = json.loads(value)
+        except json.JSONDecodeError:
+            slots[field_name] = value
+    return slots
+
+def _changed_slots(current: dict, new_slots: dict) -> dict:
+    return {k: v for k, v in new_slots.items() if k not in current or current[k] != v}
+
+def _legacy_history_slots(history: List[Dict]) -> dict:
+    """Slots from the last history snapshot (sessions written before the slots hash)."""
+    return next(
+        (m["content"] for m in reversed(history) if m["role"] == "slots" and isinstance(m["content"], dict)),
+        {}
+    )
+
+def _seconds_since(last_ts: Optional[datetime]) -> Optional[float]:
+    if last_ts is None:
+        return None
+    return (datetime.now(IST) - last_ts).total_seconds()
+
+
+# ─── Sync API (compatibility layer for scripts and non-async callers) ───
 
 def create_session(session_key: str) -> str:
-    counter_key = f"user_session_counter:{session_key}"
-    counter = redis_client.incr(counter_key)
-    session_id = f"sess{counter:03d}_{session_key}"
+    counter = redis_client.incr(_counter_key(session_key))
+    session_id = _format_session_id(session_key, counter)
 
     redis_client.setex(
-        f"user_active_session:{session_key}",
+        _active_key(session_key),
         SESSION_TTL,
         session_id
     )
     return session_id
 
 def get_or_create_session(session_key: str) -> str:
-    session_id = redis_client.get(f"user_active_session:{session_key}")
+    session_id = redis_client.get(_active_key(session_key))
     if session_id:
         # Sliding window: refresh TTL on every interaction (single pipeline round-trip)
         pipe = redis_client.pipeline()
-        pipe.expire(f"user_active_session:{session_key}", SESSION_TTL)
-        pipe.expire(f"session:{session_id}", SESSION_TTL)
-        pipe.expire(f"agent2_state:{session_id}", SESSION_TTL)
+        _queue_refresh_ttl(pipe, session_key, session_id)
         pipe.execute()
         return session_id
     return create_session(session_key)
@@ -49,36 +392,24 @@ def get_or_create_session(session_key: str) -> str:
 def get_or_create_session_with_history(session_key: str) -> tuple:
     """Combined session + history fetch in fewer Redis round-trips.
     Returns (session_id, history_list) — saves 1 RT vs separate calls."""
-    session_id = redis_client.get(f"user_active_session:{session_key}")
+    session_id = redis_client.get(_active_key(session_key))
     if session_id:
         # Batch: TTL refresh + history fetch in ONE pipeline round-trip
         pipe = redis_client.pipeline()
-        pipe.expire(f"user_active_session:{session_key}", SESSION_TTL)
-        pipe.expire(f"session:{session_id}", SESSION_TTL)
-        pipe.expire(f"agent2_state:{session_id}", SESSION_TTL)
-        pipe.lrange(f"session:{session_id}", 0, -1)
+        _queue_refresh_ttl(pipe, session_key, session_id)
+        pipe.lrange(_history_key(session_id), 0, -1)
+        pipe.get(_summary_key(session_id))
         results = pipe.execute()
-        raw_history = results[3]  # 4th command result
-        history = _parse_history_raw(raw_history)
+        history = _compose_history(results[-2], results[-1])
         return session_id, history
     session_id = create_session(session_key)
     return session_id, []
 
 def append_message(session_id: str, role: str, content: str | dict):
     """Append message to session history. Content can be string or dict (for slots)"""
-    content_to_store = content if isinstance(content, str) else json.dumps(content)
-    
     # Pipeline: RPUSH + EXPIRE in one round-trip (was 2 separate calls)
     pipe = redis_client.pipeline()
-    pipe.rpush(
-        f"session:{session_id}",
-        json.dumps({
-            "role": role,
-            "content": content_to_store,
-            "ts": datetime.now(IST).isoformat()
-        })
-    )
-    pipe.expire(f"session:{session_id}", SESSION_TTL)
+    _queue_append(pipe, session_id, role, content)
     pipe.execute()
 
 def set_pending_document(session_id: str, document_data: dict, ttl: int = 600):
@@ -87,7 +418,7 @@ def set_pending_document(session_id: str, document_data: dict, ttl: int = 600):
     TTL: 10 minutes by default
     """
     redis_client.setex(
-        f"pending_document:{session_id}",
+        _pending_doc_key(session_id),
         ttl,
         json.dumps(document_data)
     )
@@ -97,44 +428,60 @@ def get_pending_document(session_id: str) -> Optional[dict]:
     Retrieve pending document data if it exists.
     Returns None if document has expired or doesn't exist.
     """
-    raw = redis_client.get(f"pending_document:{session_id}")
-    if raw:
-        return json.loads(raw)
-    return None
+    return _decode_json(redis_client.get(_pending_doc_key(session_id)))
 
 def clear_pending_document(session_id: str):
     """Clear pending document from Redis"""
-    redis_client.delete(f"pending_document:{session_id}")
+    redis_client.delete(_pending_doc_key(session_id))
 
 def set_pending_document_state(session_id: str, is_first_message: bool, ttl: int = 600):
     """
     Tracks if document was sent as FIRST message (intent = null) or after (intent already set)
     """
     redis_client.setex(
-        f"pending_doc_state:{session_id}",
+        _pending_doc_state_key(session_id),
         ttl,
-        json.dumps({
-            "is_first_message": is_first_message,
-            "timestamp": datetime.now(IST).isoformat()
-        })
+        _encode_doc_state(is_first_message)
     )
 
 def get_pending_document_state(session_id: str) -> Optional[dict]:
     """Retrieves document state info"""
-    key = f"pending_doc_state:{session_id}"
-    raw = redis_client.get(key)
-    if raw:
-        return json.loads(raw)
-    return None
+    return _decode_json(redis_client.get(_pending_doc_state_key(session_id)))
 
 def clear_pending_document_state(session_id: str):
     """Clears document state after processing"""
-    redis_client.delete(f"pending_doc_state:{session_id}")
+    redis_client.delete(_pending_doc_state_key(session_id))
 
 def get_session_history(session_id: str) -> List[Dict]:
     """Retrieve full conversation history for a session"""
-    raw = redis_client.lrange(f"session:{session_id}", 0, -1)
-    return _parse_history_raw(raw)
+    pipe = redis_client.pipeline()
+    pipe.lrange(_history_key(session_id), 0, -1)
+    pipe.get(_summary_key(session_id))
+    raw, raw_summary = pipe.execute()
+    return _compose_history(raw, raw_summary)
+
+
+def _compose_history(raw: list, raw_summary: Optional[str]) -> List[Dict]:
+    """
+    Parse the recent-entries window and, if older turns were compacted,
+    prepend their summary: the last evicted INTENT_SET (as a system entry)
+    followed by one "summary" entry holding the clipped earlier turns.
+    """
+    history = _parse_history_raw(raw)
+    summary = _decode_json(raw_summary)
+    if not summary:
+        return history
+    prefix = []
+    if summary.get("intent"):
+        prefix.append({"role": "system", "content": summary["intent"], "ts": summary.get("ts")})
+    if summary.get("text"):
+        prefix.append({
+            "role": "summary",
+            "content": summary["text"].strip(),
+            "turns": summary.get("turns", 0),
+            "ts": summary.get("ts")
+        })
+    return prefix + history
 
 
 def _parse_history_raw(raw: list) -> List[Dict]:
@@ -142,33 +489,38 @@ def _parse_history_raw(raw: list) -> List[Dict]:
     history = []
     for x in raw:
         try:
-            msg = json.loads(x)
-            if msg["role"] == "slots" and isinstance(msg["content"], str):
-                try:
-                    msg["content"] = json.loads(msg["content"])
-                except json.JSONDecodeError:
-                    pass
-            history.append(msg)
-        except json.JSONDecodeError:
+            history.append(_decode_history_entry(x))
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError, IndexError):
             continue
     return history
 
+def get_session_slots(session_id: str) -> dict:
+    """Read all extracted slots for a session (HGETALL)."""
+    return _decode_slots(redis_client.hgetall(_slots_key(session_id)))
+
+def merge_session_slots(session_id: str, new_slots: dict) -> dict:
+    """Merge new slot values, writing only the fields that changed."""
+    current = get_session_slots(session_id)
+    pipe = redis_client.pipeline()
+    _queue_set_slots(pipe, session_id, _changed_slots(current, new_slots))
+    pipe.execute()
+    return {**current, **new_slots}
+
 def set_pending_task(session_id: str, data: dict, ttl: int = 300):
     """Store pending task data temporarily"""
     redis_client.setex(
-        f"pending_task:{session_id}",
+        _pending_task_key(session_id),
         ttl,
         json.dumps(data)
     )
 
 def get_pending_task(session_id: str) -> Optional[dict]:
     """Retrieve pending task data"""
-    raw = redis_client.get(f"pending_task:{session_id}")
-    return json.loads(raw) if raw else None
+    return _decode_json(redis_client.get(_pending_task_key(session_id)))
 
 def clear_pending_task(session_id: str):
     """Clear pending task from Redis"""
-    redis_client.delete(f"pending_task:{session_id}")
+    redis_client.delete(_pending_task_key(session_id))
 
 def is_performance_locked(key: str) -> bool:
     """Check if performance report generation is locked"""
@@ -180,14 +532,7 @@ def lock_performance(key: str, ttl: int = 120):
 
 def get_agent2_state(session_id: str) -> dict:
     """Get current Agent 2 parameter extraction state"""
-    raw = redis_client.get(f"agent2_state:{session_id}")
-    if raw:
-        return json.loads(raw)
-    return {
-        "intent": None,
-        "parameters": {},
-        "ready": False
-    }
+    return _decode_json(redis_client.get(_agent2_key(session_id))) or _empty_agent2_state()
 
 def update_agent2_state(
     session_id: str,
@@ -196,90 +541,456 @@ def update_agent2_state(
     ready: Optional[bool] = None
 ) -> dict:
     """Update Agent 2 state incrementally"""
-    state = get_agent2_state(session_id)
-
-    if intent is not None:
-        state["intent"] = intent
-
-    if parameters is not None:
-        state["parameters"].update(parameters)
-
-    if ready is not None:
-        state["ready"] = ready
-
+    state = _apply_agent2_update(get_agent2_state(session_id), intent, parameters, ready)
     redis_client.set(
-        f"agent2_state:{session_id}",
+        _agent2_key(session_id),
         json.dumps(state)
     )
     return state
 
 def get_last_message_timestamp(session_id: str) -> Optional[datetime]:
     """Get the timestamp of the most recent message in the session."""
-    raw = redis_client.lrange(f"session:{session_id}", -1, -1)
-    if raw:
-        try:
-            msg = json.loads(raw[0])
-            return datetime.fromisoformat(msg["ts"])
-        except (json.JSONDecodeError, KeyError, ValueError):
-            pass
-    return None
+    return _last_entry_timestamp(redis_client.lrange(_history_key(session_id), -1, -1))
 
 
 def get_inactivity_seconds(session_id: str) -> Optional[float]:
     """Returns seconds since the last message, or None if no history."""
-    last_ts = get_last_message_timestamp(session_id)
-    if last_ts is None:
-        return None
-    now = datetime.now(IST)
-    return (now - last_ts).total_seconds()
+    return _seconds_since(get_last_message_timestamp(session_id))
 
 
 def reset_session_after_api(session_key: str, session_id: str):
     """Reset session after successful API call"""
     pipe = redis_client.pipeline()
-    # 1. Clear conversation history
-    pipe.delete(f"session:{session_id}")
-    # 2. Clear pending task (if any)
-    pipe.delete(f"pending_task:{session_id}")
-    # 3. Clear performance lock (if any)
+    _queue_end_session(pipe, session_key, session_id)
+    # Also clear the performance lock (if any)
     pipe.delete(f"performance_lock:{session_id}")
-    # 4. Clear pending document
-    pipe.delete(f"pending_document:{session_id}")
-    # 5. Clear document state
-    pipe.delete(f"pending_doc_state:{session_id}")
-    # 6. Clear Agent 2 parameter state
-    pipe.delete(f"agent2_state:{session_id}")
-    # 7. Remove active session pointer
-    pipe.delete(f"user_active_session:{session_key}")
     pipe.execute()
 
 def end_session_complete(login_code: str, session_id: str):
     """Complete cleanup: wipe all session data from Redis"""
     try:
         pipe = redis_client.pipeline()
-        
-        # Clear conversation history
-        pipe.delete(f"session:{session_id}")
-        
-        # Clear pending task data (if any)
-        pipe.delete(f"pending_task:{session_id}")
-        
-        # Clear pending document
-        pipe.delete(f"pending_document:{session_id}")
-        
-        # Clear document state
-        pipe.delete(f"pending_doc_state:{session_id}")
-        
-        # Clear Agent 2 parameter state
-        pipe.delete(f"agent2_state:{session_id}")
-        
-        # Remove the active session pointer for this user
-        pipe.delete(f"user_active_session:{login_code}")
-        
+        _queue_end_session(pipe, login_code, session_id)
         pipe.execute()
-        
         logger.info(f"Redis cache cleared for user {login_code} (Session: {session_id})")
         return True
     except Exception as e:
         logger.error(f"Failed to clear Redis cache for {login_code}: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+# ─── Turn context: everything handle_message reads, in two round-trips ───
+
+# Two EVALSHAs, each touching only the keys passed in KEYS (required by
+# Redis Cluster and key-prefixing proxies). The first resolves (or creates)
+# the active session pointer; the second refreshes the sliding TTLs and
+# returns history, agent2_state, slots, summary and the pending document.
+# It re-checks the pointer and returns nil if a concurrent rotation moved
+# it in between, so the caller retries instead of reading a dead session.
+_RESOLVE_SESSION_LUA = """
+local sid = redis.call('GET', KEYS[1])
+if not sid then
+    local counter = redis.call('INCR', KEYS[2])
+    sid = string.format('sess%03d_%s', counter, ARGV[1])
+    redis.call('SETEX', KEYS[1], ARGV[2], sid)
+    return {sid, 1}
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {sid, 0}
+"""
+_resolve_session_script = async_redis_client.register_script(_RESOLVE_SESSION_LUA)
+
+# KEYS: active pointer, history, agent2_state, slots, summary,
+# pending document, pending document state. ARGV: session id, TTL.
+_LOAD_TURN_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return nil
+end
+for i = 2, 5 do
+    redis.call('EXPIRE', KEYS[i], ARGV[2])
+end
+return {
+    redis.call('LRANGE', KEYS[2], 0, -1),
+    redis.call('GET', KEYS[3]),
+    redis.call('HGETALL', KEYS[4]),
+    redis.call('GET', KEYS[5]),
+    redis.call('GET', KEYS[6]),
+    redis.call('GET', KEYS[7])
+}
+"""
+_load_turn_script = async_redis_client.register_script(_LOAD_TURN_LUA)
+
+
+@dataclass
+class TurnContext:
+    """Snapshot of a user's session state taken at the start of a turn."""
+    session_key: str
+    session_id: str
+    is_new_session: bool = False
+    history: List[Dict] = field(default_factory=list)
+    agent2_state: dict = field(default_factory=_empty_agent2_state)
+    slots: dict = field(default_factory=dict)
+    # True while `slots` came from a legacy history snapshot, not the slots hash
+    slots_from_legacy: bool = False
+    pending_document: Optional[dict] = None
+    pending_document_state: Optional[dict] = None
+
+    @property
+    def existing_intent(self) -> Optional[str]:
+        """Most recent INTENT_SET recorded in history."""
+        for msg in reversed(self.history):
+            if msg["role"] == "system" and "INTENT_SET:" in msg["content"]:
+                return msg["content"].replace("INTENT_SET: ", "").strip()
+        return None
+
+    @property
+    def inactivity_seconds(self) -> Optional[float]:
+        """Seconds since the last history entry, or None if no history."""
+        if not self.history:
+            return None
+        try:
+            return _seconds_since(_entry_time(self.history[-1]))
+        except (KeyError, ValueError):
+            return None
+
+    def record(self, role: str, content: str | dict):
+        """Mirror an entry appended to Redis so later reads in this turn see it."""
+        self.history.append({
+            "role": role,
+            "content": content,
+            "ts": datetime.now(IST).isoformat()
+        })
+
+    def for_new_session(self, session_id: str) -> "TurnContext":
+        """Context for a freshly rotated session (pending document carries over)."""
+        return TurnContext(
+            session_key=self.session_key,
+            session_id=session_id,
+            is_new_session=True,
+            pending_document=self.pending_document,
+            pending_document_state=self.pending_document_state if self.pending_document else None
+        )
+
+
+async def load_turn_context(session_key: str) -> TurnContext:
+    """Fetch (or create) the active session and all per-turn state in two RTTs."""
+    while True:
+        session_id, created = await _resolve_session_script(
+            keys=[_active_key(session_key), _counter_key(session_key)],
+            args=[session_key, SESSION_TTL]
+        )
+        if int(created):
+            return TurnContext(session_key=session_key, session_id=session_id, is_new_session=True)
+
+        result = await _load_turn_script(
+            keys=[
+                _active_key(session_key), _history_key(session_id), _agent2_key(session_id),
+                _slots_key(session_id), _summary_key(session_id),
+                _pending_doc_key(session_id), _pending_doc_state_key(session_id)
+            ],
+            args=[session_id, SESSION_TTL]
+        )
+        if result is not None:
+            break
+        logger.info(f"[SESSION] Active session for {session_key} moved during load — retrying")
+
+    raw_history, raw_agent2, raw_slots, raw_summary, raw_doc, raw_doc_state = result
+    history = _compose_history(raw_history, raw_summary)
+    slots = _decode_slots(dict(zip(raw_slots[::2], raw_slots[1::2])))
+    legacy_slots = {} if slots else _legacy_history_slots(history)
+    return TurnContext(
+        session_key=session_key,
+        session_id=session_id,
+        history=history,
+        agent2_state=_decode_json(raw_agent2) or _empty_agent2_state(),
+        slots=slots or legacy_slots,
+        slots_from_legacy=bool(legacy_slots),
+        pending_document=_decode_json(raw_doc),
+        pending_document_state=_decode_json(raw_doc_state)
+    )
+
+
+# ─── Atomic session rotation (reset that keeps the pending document) ───
+
+# Wipes the old session, points the user at the new one and moves the
+# pending document (and its state) across with their remaining TTLs in one
+# atomic call. The new session id comes from an INCR beforehand, so every
+# key the script touches is passed in KEYS. The deleted key set mirrors
+# _queue_end_session.
+# KEYS: active pointer, old history, summary, pending task, pending
+# document, pending document state, agent2_state, slots, then the new
+# pending document and pending document state. ARGV: new session id, TTL.
+_ROTATE_SESSION_LUA = """
+local doc = redis.call('GET', KEYS[5])
+local doc_ttl = redis.call('PTTL', KEYS[5])
+local state = redis.call('GET', KEYS[6])
+local state_ttl = redis.call('PTTL', KEYS[6])
+
+redis.call('DEL', KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6], KEYS[7], KEYS[8])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+
+if doc then
+    if doc_ttl > 0 then
+        redis.call('SET', KEYS[9], doc, 'PX', doc_ttl)
+    else
+        redis.call('SET', KEYS[9], doc)
+    end
+    if state then
+        if state_ttl > 0 then
+            redis.call('SET', KEYS[10], state, 'PX', state_ttl)
+        else
+            redis.call('SET', KEYS[10], state)
+        end
+    end
+end
+return ARGV[1]
+"""
+_rotate_session_script = async_redis_client.register_script(_ROTATE_SESSION_LUA)
+_sync_rotate_session_script = redis_client.register_script(_ROTATE_SESSION_LUA)
+
+
+def _rotate_keys(session_key: str, old_session_id: str, new_session_id: str) -> list:
+    return [
+        _active_key(session_key),
+        _history_key(old_session_id), _summary_key(old_session_id), _pending_task_key(old_session_id),
+        _pending_doc_key(old_session_id), _pending_doc_state_key(old_session_id),
+        _agent2_key(old_session_id), _slots_key(old_session_id),
+        _pending_doc_key(new_session_id), _pending_doc_state_key(new_session_id)
+    ]
+
+
+def rotate_session(session_key: str, old_session_id: str) -> str:
+    """Atomically replace a user's session, carrying the pending document over."""
+    session_id = _format_session_id(session_key, redis_client.incr(_counter_key(session_key)))
+    return _sync_rotate_session_script(
+        keys=_rotate_keys(session_key, old_session_id, session_id),
+        args=[session_id, SESSION_TTL]
+    )
+
+
+async def async_rotate_session(session_key: str, old_session_id: str) -> str:
+    """Async variant of rotate_session."""
+    counter = await async_redis_client.incr(_counter_key(session_key))
+    session_id = _format_session_id(session_key, counter)
+    return await _rotate_session_script(
+        keys=_rotate_keys(session_key, old_session_id, session_id),
+        args=[session_id, SESSION_TTL]
+    )
+
+
+# ─── Unit of work: buffer a turn's writes, flush them in one MULTI/EXEC ───
+
+class SessionUnitOfWork:
+    """
+    Collects every session mutation made during one handle_message turn
+    (appends, slot merges, pending-document changes, resets) and flushes
+    them atomically with commit(). Writes are mirrored onto the TurnContext
+    so reads later in the same turn see them.
+    """
+
+    def __init__(self, turn_ctx: TurnContext):
+        self.ctx = turn_ctx
+        self._ops: List[Callable] = []
+
+    @property
+    def session_id(self) -> str:
+        return self.ctx.session_id
+
+    def append(self, role: str, content: str | dict):
+        session_id = self.session_id
+        self._ops.append(lambda pipe: _queue_append(pipe, session_id, role, content))
+        self.ctx.record(role, content)
+
+    def merge_slots(self, new_slots: dict) -> dict:
+        """
+        Merge new slot values into the session's slots hash (changed fields
+        only). Slots loaded from a legacy history snapshot aren't in the hash
+        yet, so the first write after such a load stores the full merge.
+        """
+        session_id = self.session_id
+        merged = {**self.ctx.slots, **new_slots}
+        changed = merged if self.ctx.slots_from_legacy else _changed_slots(self.ctx.slots, new_slots)
+        if changed:
+            self._ops.append(lambda pipe: _queue_set_slots(pipe, session_id, changed))
+            self.ctx.slots_from_legacy = False
+        self.ctx.slots = merged
+        return self.ctx.slots
+
+    def delete_slots(self, *fields: str):
+        """Forget slot values (HDEL) — e.g. an assignee that didn't resolve."""
+        session_id = self.session_id
+        present = [f for f in fields if f in self.ctx.slots]
+        if present:
+            self._ops.append(lambda pipe: pipe.hdel(_slots_key(session_id), *present))
+        self.ctx.slots = {k: v for k, v in self.ctx.slots.items() if k not in fields}
+
+    def set_pending_document(self, document_data: dict, ttl: int = 600):
+        key = _pending_doc_key(self.session_id)
+        payload = json.dumps(document_data)
+        self._ops.append(lambda pipe: pipe.setex(key, ttl, payload))
+        self.ctx.pending_document = document_data
+
+    def set_pending_document_state(self, is_first_message: bool, ttl: int = 600):
+        key = _pending_doc_state_key(self.session_id)
+        payload = _encode_doc_state(is_first_message)
+        self._ops.append(lambda pipe: pipe.setex(key, ttl, payload))
+        self.ctx.pending_document_state = json.loads(payload)
+
+    def clear_pending_document_state(self):
+        key = _pending_doc_state_key(self.session_id)
+        self._ops.append(lambda pipe: pipe.delete(key))
+        self.ctx.pending_document_state = None
+
+    def end_session(self):
+        """Queue a complete wipe of the session (same keys as end_session_complete)."""
+        session_key, session_id = self.ctx.session_key, self.session_id
+        self._ops.append(lambda pipe: _queue_end_session(pipe, session_key, session_id))
+
+    def rebind(self, turn_ctx: TurnContext):
+        """Switch to a new session; writes queued for the old one are dropped."""
+        self.ctx = turn_ctx
+        self._ops.clear()
+
+    def discard(self):
+        self._ops.clear()
+
+    async def commit(self):
+        """Flush all queued writes in a single MULTI/EXEC round-trip."""
+        if not self._ops:
+            return
+        ops, self._ops = self._ops, []
+        pipe = async_redis_client.pipeline(transaction=True)
+        for op in ops:
+            op(pipe)
+        await pipe.execute()
+        logger.info(f"[SESSION_COMMIT] {len(ops)} writes flushed for {self.session_id}")
+
+
+# ─── Async API (redis.asyncio, same key layout) ───
+# Used from the event loop by handle_message / agent3 so a Redis round-trip
+# never blocks other in-flight conversations.
+
+async def async_create_session(session_key: str) -> str:
+    counter = await async_redis_client.incr(_counter_key(session_key))
+    session_id = _format_session_id(session_key, counter)
+    await async_redis_client.setex(_active_key(session_key), SESSION_TTL, session_id)
+    return session_id
+
+async def async_get_or_create_session(session_key: str) -> str:
+    session_id = await async_redis_client.get(_active_key(session_key))
+    if session_id:
+        pipe = async_redis_client.pipeline()
+        _queue_refresh_ttl(pipe, session_key, session_id)
+        await pipe.execute()
+        return session_id
+    return await async_create_session(session_key)
+
+async def async_get_or_create_session_with_history(session_key: str) -> tuple:
+    """Async variant of get_or_create_session_with_history."""
+    session_id = await async_redis_client.get(_active_key(session_key))
+    if session_id:
+        pipe = async_redis_client.pipeline()
+        _queue_refresh_ttl(pipe, session_key, session_id)
+        pipe.lrange(_history_key(session_id), 0, -1)
+        pipe.get(_summary_key(session_id))
+        results = await pipe.execute()
+        return session_id, _compose_history(results[-2], results[-1])
+    session_id = await async_create_session(session_key)
+    return session_id, []
+
+async def async_append_message(session_id: str, role: str, content: str | dict):
+    pipe = async_redis_client.pipeline()
+    _queue_append(pipe, session_id, role, content)
+    await pipe.execute()
+
+async def async_set_pending_document(session_id: str, document_data: dict, ttl: int = 600):
+    await async_redis_client.setex(_pending_doc_key(session_id), ttl, json.dumps(document_data))
+
+async def async_get_pending_document(session_id: str) -> Optional[dict]:
+    return _decode_json(await async_redis_client.get(_pending_doc_key(session_id)))
+
+async def async_clear_pending_document(session_id: str):
+    await async_redis_client.delete(_pending_doc_key(session_id))
+
+async def async_set_pending_document_state(session_id: str, is_first_message: bool, ttl: int = 600):
+    await async_redis_client.setex(
+        _pending_doc_state_key(session_id),
+        ttl,
+        _encode_doc_state(is_first_message)
+    )
+
+async def async_get_pending_document_state(session_id: str) -> Optional[dict]:
+    return _decode_json(await async_redis_client.get(_pending_doc_state_key(session_id)))
+
+async def async_clear_pending_document_state(session_id: str):
+    await async_redis_client.delete(_pending_doc_state_key(session_id))
+
+async def async_get_session_history(session_id: str) -> List[Dict]:
+    pipe = async_redis_client.pipeline()
+    pipe.lrange(_history_key(session_id), 0, -1)
+    pipe.get(_summary_key(session_id))
+    raw, raw_summary = await pipe.execute()
+    return _compose_history(raw, raw_summary)
+
+async def async_get_session_slots(session_id: str) -> dict:
+    return _decode_slots(await async_redis_client.hgetall(_slots_key(session_id)))
+
+async def async_merge_session_slots(session_id: str, new_slots: dict) -> dict:
+    current = await async_get_session_slots(session_id)
+    pipe = async_redis_client.pipeline()
+    _queue_set_slots(pipe, session_id, _changed_slots(current, new_slots))
+    await pipe.execute()
+    return {**current, **new_slots}
+
+async def async_set_pending_task(session_id: str, data: dict, ttl: int = 300):
+    await async_redis_client.setex(_pending_task_key(session_id), ttl, json.dumps(data))
+
+async def async_get_pending_task(session_id: str) -> Optional[dict]:
+    return _decode_json(await async_redis_client.get(_pending_task_key(session_id)))
+
+async def async_clear_pending_task(session_id: str):
+    await async_redis_client.delete(_pending_task_key(session_id))
+
+async def async_is_performance_locked(key: str) -> bool:
+    return bool(await async_redis_client.exists(key))
+
+async def async_lock_performance(key: str, ttl: int = 120):
+    await async_redis_client.setex(key, ttl, "1")
+
+async def async_get_agent2_state(session_id: str) -> dict:
+    raw = await async_redis_client.get(_agent2_key(session_id))
+    return _decode_json(raw) or _empty_agent2_state()
+
+async def async_update_agent2_state(
+    session_id: str,
+    intent: Optional[str] = None,
+    parameters: Optional[dict] = None,
+    ready: Optional[bool] = None
+) -> dict:
+    state = _apply_agent2_update(await async_get_agent2_state(session_id), intent, parameters, ready)
+    await async_redis_client.set(_agent2_key(session_id), json.dumps(state))
+    return state
+
+async def async_get_last_message_timestamp(session_id: str) -> Optional[datetime]:
+    raw = await async_redis_client.lrange(_history_key(session_id), -1, -1)
+    return _last_entry_timestamp(raw)
+
+async def async_get_inactivity_seconds(session_id: str) -> Optional[float]:
+    return _seconds_since(await async_get_last_message_timestamp(session_id))
+
+async def async_reset_session_after_api(session_key: str, session_id: str):
+    pipe = async_redis_client.pipeline()
+    _queue_end_session(pipe, session_key, session_id)
+    pipe.delete(f"performance_lock:{session_id}")
+    await pipe.execute()
+
+async def async_end_session_complete(login_code: str, session_id: str) -> bool:
+    try:
+        pipe = async_redis_client.pipeline()
+        _queue_end_session(pipe, login_code, session_id)
+        await pipe.execute()
+        logger.info(f"Redis cache cleared for user {login_code} (Session: {session_id})")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to clear Redis cache for {login_code}: {e}")
+        return False
@@ -0,0 +1,241 @@
+"""
+Deterministic parsers for one-word second-turn replies.
+
+Two follow-up questions used to cost a full Gemini call each:
+  - "[TASK_CONFIRM] ... shall I assign it?"          → YES / NO
+  - "your own pending tasks or your team's?"          → OWN / TEAM
+
+Most replies are one of a small set of words ("haan", "ok 👍", "nahi",
+"mat karo", "team", "mere wale"), so they are scored locally against the
+same English / Hinglish lexicons the prompts list:
+  - repeated letters are collapsed before lookup ("yesss", "okkk", "haan")
+  - multi-word phrases are matched longest-first ("theek hai", "kar do",
+    "no problem", "my team")
+  - a negator flips the next phrase ("not correct", "don't assign"),
+    except certainty words: "not sure" is left to Gemini
+  - an unknown word after the answer ("theek hai but ...") always
+    drops the reply below the confidence threshold
+  - a question ("sure?", "is it correct", "kya ye sahi hai") is never
+    read as an answer to [TASK_CONFIRM]
+  - emoji count as words (👍 ✅ 👎 ❌), skin tones are ignored
+  - common misspellings are listed, and anything else within edit
+    distance 1 of a long lexicon word matches at a lower confidence
+
+parse_confirmation / parse_pending_scope return (label, confidence) when
+the reply is unambiguous and confidence >= REPLY_PARSER_MIN_CONFIDENCE,
+else None — the caller then falls back to Gemini.
+"""
+
+import os
+import re
+from itertools import product
+from typing import Dict, List, Optional, Tuple
+
+from fuzzy_match import bounded_levenshtein
+
+REPLY_PARSER_ENABLED = os.getenv("REPLY_PARSER", "1") != "0"
+REPLY_PARSER_MIN_CONFIDENCE = float(os.getenv("REPLY_PARSER_MIN_CONFIDENCE", 0.85))
+
+_WORD_RE = re.compile(r"[^\W_]+|[\U0001F100-\U0001FAFF\u2600-\u27BF]")
+_EMOJI_NOISE_RE = re.compile(r"[\uFE0F\u200D\U0001F3FB-\U0001F3FF]")  # variation selector, ZWJ, skin tones
+
+# Words that never change the meaning of a reply
+_FILLERS = {
+    "please", "pls", "plz", "sir", "mam", "maam", "madam", "bhai", "boss", "ji", "jee",
+    "hai", "he", "h", "it", "that", "this", "the", "a", "now", "abhi", "then", "to",
+    "toh", "so", "just", "go", "de", "dena", "kar", "karo", "do", "na", "ye", "yeh",
+    "wo", "woh", "wale", "wala", "wali", "vale", "vala", "ke", "ki", "ka", "tasks",
+    "task", "show", "dikhao", "see", "want", "i", "list", "pending",
+}
+
+# A reply that asks something ("sure?", "is it correct", "kya ye sahi hai")
+# is not an answer — it goes to Gemini
+_QUESTION_RE = re.compile(
+    r"\?\s*$|\b(is it|is this|is that|are you|should (i|we)|what|why|who|which|how|when"
+    r"|kya|kyu|kyun|kaun|kaise|kab)\b"
+)
+
+# English negators flip the phrase after them; Hindi "mat" / "nahi" follow the verb
+# and are lexicon phrases of their own
+_NEGATORS = {"not", "dont", "never"}
+
+
+def _collapse(token: str) -> str:
+    """Fold repeated letters so 'yesss' / 'okk' / 'haan' share one key."""
+    return re.sub(r"(.)\1+", r"\1", token)
+
+
+def _tokens(text: str) -> List[str]:
+    text = _EMOJI_NOISE_RE.sub("", (text or "").lower().replace("’", "").replace("'", ""))
+    return [_collapse(tok) for tok in _WORD_RE.findall(text)]
+
+
+class ReplyLexicon:
+    """Phrase → label table for a two-way question, with negation and typo tolerance."""
+
+    def __init__(self, labels: Tuple[str, str], phrases: Dict[str, List[str]],
+                 exact: Dict[str, List[str]] = None, unflippable: List[str] = None):
+        self.labels = labels
+        # Certainty words: "not sure" is doubt, not the opposite answer
+        self._unflippable = {tuple(_tokens(entry)) for entry in (unflippable or [])}
+        self._phrases: Dict[Tuple[str, ...], str] = {}
+        for label, entries in phrases.items():
+            for entry in entries:
+                self._phrases[tuple(_tokens(entry))] = label
+        # Short tokens only trusted when they are the whole reply ("k", "ha", "na")
+        self._exact: Dict[Tuple[str, ...], str] = {
+            tuple(_tokens(entry)): label
+            for label, entries in (exact or {}).items()
+            for entry in entries
+        }
+        self._max_len = max(len(p) for p in self._phrases)
+        self._fuzzy_words = [
+            (p[0], label) for p, label in self._phrases.items()
+            if len(p) == 1 and len(p[0]) >= 5
+        ]
+
+    def _other(self, label: str) -> str:
+        return self.labels[1] if label == self.labels[0] else self.labels[0]
+
+    def _match_at(self, tokens: List[str], i: int) -> Tuple[Optional[str], int]:
+        """Longest lexicon phrase starting at tokens[i] as (label, length)."""
+        for n in range(min(self._max_len, len(tokens) - i), 0, -1):
+            label = self._phrases.get(tuple(tokens[i:i + n]))
+            if label:
+                return label, n
+        return None, 0
+
+    def _fuzzy(self, token: str) -> Optional[str]:
+        if len(token) < 5:
+            return None
+        found = {label for word, label in self._fuzzy_words
+                 if bounded_levenshtein(token, word, 1) is not None}
+        return found.pop() if len(found) == 1 else None
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        """(label, confidence); label is None when the reply is unknown or mixed."""
+        tokens = _tokens(text)
+        if not tokens:
+            return None, 0.0
+        exact = self._exact.get(tuple(tokens)) or self._phrases.get(tuple(tokens))
+        if exact:
+            return exact, 0.99
+
+        votes: List[str] = []
+        unknown = fuzzy = 0
+        trailing = False  # an unknown word after a matched phrase ("theek hai but ...")
+        negate = False
+        i = 0
+        while i < len(tokens):
+            label, size = self._match_at(tokens, i)
+            if tokens[i] in _NEGATORS and size <= 1 and self._match_at(tokens, i + 1)[0]:
+                negate = not negate
+                i += 1
+                continue
+            if label is None:
+                label = self._fuzzy(tokens[i])
+                if label:
+                    fuzzy += 1
+                    size = 1
+            if label:
+                if negate and tuple(tokens[i:i + size]) in self._unflippable:
+                    return None, 0.0
+                votes.append(self._other(label) if negate else label)
+                negate = False
+                i += size
+                continue
+            if tokens[i] not in _FILLERS:
+                unknown += 1
+                trailing = trailing or bool(votes)
+            i += 1
+
+        if not votes or len(set(votes)) > 1:
+            return None, 0.0
+        confidence = 0.95 - 0.25 * unknown / len(tokens)
+        if fuzzy:
+            confidence -= 0.05
+        if trailing:
+            # The reply goes on after the answer — a qualifier Gemini should read
+            confidence = min(confidence, REPLY_PARSER_MIN_CONFIDENCE - 0.05)
+        return votes[0], round(confidence, 3)
+
+
+# ─── Lexicons ────────────────────────────────────────────────────────
+
+_CONFIRM = ReplyLexicon(
+    ("YES", "NO"),
+    {
+        "YES": [
+            "yes", "yeah", "yea", "yep", "yup", "ya", "yah", "yas", "ys", "yse",
+            "haan", "han", "hanji", "haanji", "hn",
+            "ok", "okay", "okey", "oky", "okie", "okies", "oki",
+            "sure", "correct", "right", "perfect", "fine", "alright", "done", "good",
+            "great", "absolutely", "definitely", "confirm", "confirmed", "conform",
+            "confrim", "proceed", "procede", "go ahead", "do it", "go for it",
+            "yes please", "sounds good", "looks good", "all good", "no problem",
+            "no issues", "sahi", "sahi hai", "shi hai", "theek", "thik", "theek hai",
+            "thik hai", "tik hai", "bilkul", "chalo", "chalega", "kar do", "kardo",
+            "kr do", "krdo", "bana do", "banado", "bhej do", "assign", "assign karo",
+            "assign kar do", "assign it", "koi problem nahi", "koi baat nahi",
+            "👍", "👌", "✅", "✔", "☑", "🆗", "🙌", "💯", "🤝",
+        ],
+        "NO": [
+            "no", "nope", "nah", "nahi", "nahin", "nhi", "nai", "nahee",
+            "cancel", "cancle", "cancelled", "canceled", "stop", "wrong", "galat",
+            "abort", "reject", "discard", "dont", "never", "not now", "ruk", "ruko",
+            "ruk jao", "mat", "mat karo", "mat kar", "mat kro", "rehne do", "rahne do",
+            "rehne de", "chhodo", "chodo", "leave it", "not correct", "incorrect",
+            "👎", "❌", "✖", "🚫", "⛔", "🙅",
+        ],
+    },
+    exact={
+        "YES": ["y", "k", "kk", "ha", "haa", "ji", "jee", "ji haan", "ji sir"],
+        "NO": ["n", "na", "naa", "ji nahi"],
+    },
+    unflippable=["sure", "definitely", "absolutely", "bilkul", "perfect", "💯"],
+)
+
+_POSSESSIVES = ["my", "mera", "mere", "meri", "our", "hamare", "humare", "apne", "apni"]
+_TEAM_NOUNS = [
+    "team", "teams", "employee", "employees", "staff", "subordinate", "subordinates",
+    "member", "members", "team members", "reportee", "reportees", "juniors", "people",
+]
+
+_SCOPE = ReplyLexicon(
+    ("OWN", "TEAM"),
+    {
+        "OWN": [
+            "own", "my own", "mine", "my", "for me", "only me", "just me", "myself", "self", "personal", "mera",
+            "mere", "meri", "mujhe", "mujhko", "apna", "apne", "apni", "khud", "khud ka",
+            "khud ke", "first", "first one", "pehla", "pehle wala",
+        ],
+        "TEAM": _TEAM_NOUNS + [" ".join(p) for p in product(_POSSESSIVES, _TEAM_NOUNS)] + [
+            "their", "theirs", "them", "others", "everyone", "all", "sab", "sabka",
+            "sabke", "sabki", "unka", "unke", "unki", "under me", "second",
+            "second one", "dusra", "doosra", "dusre wala", "👥",
+        ],
+    },
+)
+
+
+# ─── Public API ──────────────────────────────────────────────────────
+
+def _parse(lexicon: ReplyLexicon, text: str) -> Optional[Tuple[str, float]]:
+    if not REPLY_PARSER_ENABLED:
+        return None
+    label, confidence = lexicon.classify(text)
+    if label is None or confidence < REPLY_PARSER_MIN_CONFIDENCE:
+        return None
+    return label, confidence
+
+
+def parse_confirmation(text: str) -> Optional[Tuple[str, float]]:
+    """("YES" | "NO", confidence) for a reply to [TASK_CONFIRM], or None."""
+    if _QUESTION_RE.search((text or "").lower().strip()):
+        return None
+    return _parse(_CONFIRM, text)
+
+
+def parse_pending_scope(text: str) -> Optional[Tuple[str, float]]:
+    """("OWN" | "TEAM", confidence) for a reply to the own-vs-team question, or None."""
+    return _parse(_SCOPE, text)
@@ -0,0 +1,73 @@
+"""
+Request coalescing for concurrent identical async lookups.
+
+When a manager's whole team replies at once, many coroutines ask for the
+same user / org data at the same moment. With single-flight the first
+caller for a key starts the work and every caller that arrives while it
+is still running awaits the same future, so the backend sees one query.
+
+Nothing is cached: once the call finishes the key is released and the
+next caller starts a fresh one. Results are shared objects, so callers
+must treat them as read-only.
+"""
+
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one in-flight future."""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0     # calls that actually ran
+        self.coalesced = 0   # callers that joined an in-flight call
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        fut = self._calls.get(key)
+        if fut is None or fut.done():
+            fut = asyncio.ensure_future(fn())
+            self._calls[key] = fut
+            fut.add_done_callback(functools.partial(self._release, key))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        # shield: one caller being cancelled must not cancel the shared call
+        return await asyncio.shield(fut)
+
+    def _release(self, key: Hashable, fut: asyncio.Future):
+        if self._calls.get(key) is fut:
+            del self._calls[key]
+        # Mark the exception retrieved even if every waiter was cancelled
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.debug(f"[SINGLEFLIGHT] {self.name}:{key!r} failed: {fut.exception()}")
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+def singleflight(key: Optional[Callable[..., Hashable]] = None):
+    """
+    Decorator form: concurrent calls with equal keys share one execution.
+    `key` maps the call arguments to the coalescing key (default: the
+    positional and keyword arguments themselves).
+    """
+    def decorator(fn: Callable[..., Awaitable[Any]]):
+        group = SingleFlight(fn.__qualname__)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return await group.do(k, lambda: fn(*args, **kwargs))
+
+        wrapper.flight = group
+        return wrapper
+
+    return decorator
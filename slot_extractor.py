@@ -0,0 +1,200 @@
+"""
+Rule-based slot pre-pass that runs before Agent 2.
+
+Many slot values can be read straight off the message: "task 1042 done",
+"add Rahul 98765 43210", "remove user 9876543210",
+"rahul@acme.com". pre_extract_slots() collects only the values it is sure
+of, without calling Gemini:
+  - task_id   — "task 12", "task id 12", "task #12"
+  - status    — one of the four statuses Appsavy accepts (never on negations
+                or mixed updates: "not done yet", "close task 12, reopen
+                task 13" are left to Gemini)
+  - remark    — only when marked ("remark: ...", "because ...") or set off
+                after a separator ("task 12 done - client approved")
+  - mobile    — a single Indian mobile number, as 10 digits
+  - email
+  - name      — "add user Rahul Sharma ...", "name: Rahul"
+  - deadline  — via deadline_parser, anchored "by ..." / "... tak" only (TASK_ASSIGNMENT)
+
+The caller merges the result into the session slots and calls Agent 2
+only when a required field is still missing. record_agent2() counts, per
+intent, how often Agent 2 was skipped (and why) vs called;
+slot_prefill_stats() reports it.
+"""
+
+import re
+import datetime
+import logging
+from collections import defaultdict
+from typing import Dict, Optional
+
+from user_resolver import normalize_phone
+from deadline_parser import extract_deadline
+
+logger = logging.getLogger(__name__)
+
+# ─── Task id / status / remark ──────────────────────────────────────
+
+_TASK_ID_RE = re.compile(r"\btask\s*(?:id|no\.?|number)?\s*[:#]?\s*(\d+)\b|(?<![\w#])#(\d+)\b")
+
+_NEGATION_RE = re.compile(r"\b(not|nahi|nahin|nhi|yet to|never)\b|n't\b")
+_STATUS_PATTERNS = [
+    ("Reopened", re.compile(r"\bre-?open(ed|ing)?\b|\bdobara (khol|open)")),
+    ("Work In Progress", re.compile(
+        r"\b(in progress|wip|working on( it)?|work in progress|started|start(ed)? working|ongoing|pending"
+        r"|will be (done|completed?|finished)|chal raha|kar raha|kar rahi)\b"
+    )),
+    ("Closed", re.compile(
+        r"(?<!will be )\b(done|completed?|finished|closed?|fixed|resolved|ho gaya|ho gya|khatam)\b"
+    )),
+    ("Open", re.compile(r"\b(keep|mark|set|still)\b[^.]{0,20}?\bopen\b")),
+]
+
+_REMARK_RE = re.compile(r"\b(?:remarks?|notes?|comments?|reason)\s*[:\-]\s*(.+)|\bbecause\b\s+(.+)", re.I)
+_SEPARATOR_RE = re.compile(r"\s*[,;:–—]\s*|\s+-\s+")
+
+
+def _task_ids(text: str) -> set:
+    return {a or b for a, b in _TASK_ID_RE.findall((text or "").lower())}
+
+
+def extract_task_id(text: str) -> Optional[str]:
+    """The task number mentioned in `text`, or None if there is none or several."""
+    ids = _task_ids(text)
+    return ids.pop() if len(ids) == 1 else None
+
+
+def resolve_status(text: str) -> Optional[str]:
+    """
+    Open / Work In Progress / Closed / Reopened when the wording is
+    unambiguous — one status word, for at most one task.
+    """
+    t = (text or "").lower()
+    if _NEGATION_RE.search(t) or len(_task_ids(t)) > 1:
+        return None  # "close task 12, reopen task 13" — which status goes with which?
+    found = [status for status, pattern in _STATUS_PATTERNS if pattern.search(t)]
+    return found[0] if len(found) == 1 else None
+
+
+def extract_remark(text: str, task_id: str) -> str:
+    """A remark the user explicitly set apart from the status update, else ""."""
+    marked = _REMARK_RE.search(text or "")
+    if marked:
+        return (marked.group(1) or marked.group(2)).strip(" .,").capitalize()
+
+    for part in _SEPARATOR_RE.split(text or "")[1:]:
+        part = part.strip(" .,")
+        lowered = part.lower()
+        if (len(part.split()) >= 2
+                and not re.search(rf"\btask\s*{re.escape(task_id or '')}\b", lowered)
+                and not any(pattern.search(lowered) for _, pattern in _STATUS_PATTERNS)):
+            return part.capitalize()
+    return ""
+
+
+# ─── People ─────────────────────────────────────────────────────────
+
+_PHONE_RE = re.compile(r"(?<![\d+])(?:\+?91[\s-]?|0)?([6-9]\d{2}[\s-]?\d{3}[\s-]?\d{4}|[6-9]\d{4}[\s-]?\d{5})(?!\d)")
+_EMAIL_RE = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+
+# Where a name ends: a separator, a digit, or the start of the role / contact
+# part ("add priya as hr", "add rahul to my team", "... for sales")
+_NAME_END = (
+    r"(?=\s*(?:,|\+|\d|$|\b(?:and|with|as|to|for|from|in|under|mobile|phone|number|num|no|email|role"
+    r"|manager|hr|admin|employee|lead|supervisor|intern|head)\b))"
+)
+_NAME_RES = [
+    re.compile(r"\bname\s*(?:is|:|-)\s*([A-Za-z][A-Za-z.' ]{0,40}?)" + _NAME_END, re.I),
+    re.compile(
+        r"\b(?:add|register|create|onboard|delete|remove|deactivate)\s+(?:a\s+)?(?:new\s+)?"
+        r"(?:user|employee|member|team member|staff)?\s*(?:named|called)?\s*"
+        r"([A-Za-z][A-Za-z.' ]{0,40}?)" + _NAME_END,
+        re.I,
+    ),
+]
+_NOT_NAMES = {
+    "user", "users", "employee", "member", "staff", "new", "a", "the", "please", "pls", "him",
+    "her", "them", "this", "that", "someone", "person", "team", "my", "from", "to", "and",
+    "as", "for", "in", "under", "role", "manager", "hr", "admin", "lead", "supervisor",
+    "intern", "head",
+}
+
+
+def extract_mobile(text: str) -> Optional[str]:
+    """The single mobile number in `text` as 10 digits, or None."""
+    phones = {normalize_phone(m)[-10:] for m in _PHONE_RE.findall(text or "")}
+    return phones.pop() if len(phones) == 1 else None
+
+
+def extract_email(text: str) -> Optional[str]:
+    emails = set(_EMAIL_RE.findall(text or ""))
+    return emails.pop() if len(emails) == 1 else None
+
+
+def extract_person_name(text: str) -> Optional[str]:
+    """The name in "add user Rahul Sharma 98..." / "name: Rahul", as written."""
+    for pattern in _NAME_RES:
+        match = pattern.search(text or "")
+        if not match:
+            continue
+        name = match.group(1).strip(" .'")
+        words = name.split()
+        if 1 <= len(words) <= 4 and not any(w.lower() in _NOT_NAMES for w in words):
+            return name
+    return None
+
+
+# ─── Pre-pass ───────────────────────────────────────────────────────
+
+def pre_extract_slots(intent: str, text: str, now: Optional[datetime.datetime] = None) -> Dict:
+    """Slots for `intent` that can be read from `text` without Gemini."""
+    slots: Dict = {}
+    if intent == "UPDATE_TASK_STATUS":
+        task_id = extract_task_id(text)
+        status = resolve_status(text)
+        if task_id:
+            slots["task_id"] = task_id
+        if status:
+            slots["status"] = status
+        remark = extract_remark(text, task_id) if task_id and status else ""
+        if remark:
+            slots["remark"] = remark
+
+    elif intent in ("ADD_USER", "DELETE_USER"):
+        mobile = extract_mobile(text)
+        name = extract_person_name(text)
+        if mobile:
+            slots["mobile"] = mobile
+        if name:
+            slots["name"] = name
+        if intent == "ADD_USER":
+            email = extract_email(text)
+            if email:
+                slots["email"] = email
+
+    elif intent == "TASK_ASSIGNMENT":
+        deadline = extract_deadline(text, now)
+        if deadline:
+            slots["deadline"] = deadline
+
+    return slots
+
+
+# ─── Agent-2 call accounting ────────────────────────────────────────
+
+_agent2_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def record_agent2(intent: str, source: str):
+    """source: "llm" when Agent 2 was called, else why it was skipped ("pre_extract", "combined")."""
+    _agent2_stats[intent][source] += 1
+
+
+def slot_prefill_stats() -> Dict[str, Dict]:
+    """Per intent: Agent-2 calls made / avoided (by reason) and the avoided share."""
+    report = {}
+    for intent, counts in _agent2_stats.items():
+        total = sum(counts.values())
+        avoided = total - counts.get("llm", 0)
+        report[intent] = {**counts, "avoided": avoided, "avoided_rate": avoided / total if total else 0.0}
+    return report
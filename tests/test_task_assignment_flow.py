@@ -0,0 +1,112 @@
+"""
+End-to-end TASK_ASSIGNMENT turns through engine.handle_message, with
+Redis replaced by fakeredis and Gemini / WhatsApp / Appsavy by fakes.
+
+Run:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+from redis.commands.core import AsyncScript
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import redis_session as rs
+
+_server = fakeredis.FakeServer()
+rs.redis_client = fakeredis.FakeRedis(server=_server, decode_responses=True)
+rs.async_redis_client = fakeredis.FakeAsyncRedis(server=_server, decode_responses=True)
+for _name, _script in list(vars(rs).items()):
+    if _name.endswith("_script") and hasattr(_script, "script"):
+        client = rs.async_redis_client if isinstance(_script, AsyncScript) else rs.redis_client
+        setattr(rs, _name, client.register_script(_script.script))
+
+import engine
+from name_index import NameIndex
+
+MANAGER = "9999999999"
+TEAM = NameIndex([
+    {"name": "Rahul Sharma", "phone": "919876543210", "login_code": "R1"},
+    {"name": "Rahul Verma", "phone": "919876543211", "login_code": "R2"},
+    {"name": "Priya Singh", "phone": "919876543212", "login_code": "P1"},
+])
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    """Fakes every external call; returns (sent messages, Agent-2 prompts, tool calls)."""
+    sent, prompts, tool_calls = [], [], []
+
+    async def send(to, text, pid=None):
+        sent.append(text)
+        return {}
+
+    async def find_user(phone):
+        return {"name": "Boss", "phone": phone, "login_code": "B1"}
+
+    async def role(phone):
+        return "manager"
+
+    async def name_index(phone):
+        return TEAM
+
+    async def classify(message, now):
+        return True, "TASK_ASSIGNMENT", 0.95, "test", {}
+
+    async def agent2(prompt, message, priority=None, static=None, schema=None):
+        prompts.append(prompt)
+        query = prompt.split("USER QUERY (verbatim):", 1)[-1].split("\n\n", 1)[0]
+        digits = "".join(ch for ch in query if ch.isdigit())
+        if len(digits) == 10:
+            return {"slots": {"assignee": digits}, "question": None}
+        return {
+            "slots": {"assignee": "Rahul", "task_name": "report", "deadline": "2099-01-01T19:00:00"},
+            "question": None,
+        }
+
+    async def assign(ctx, **slots):
+        tool_calls.append(slots)
+
+    monkeypatch.setattr(engine, "send_whatsapp_message", send)
+    monkeypatch.setattr(engine.user_repository, "find_user_by_phone", find_user)
+    monkeypatch.setattr(engine, "resolve_role", role)
+    monkeypatch.setattr(engine, "get_name_index", name_index)
+    monkeypatch.setattr(engine, "async_classify_and_extract", classify)
+    monkeypatch.setattr(engine, "run_gemini_extractor", agent2)
+    monkeypatch.setattr(engine, "assign_new_task_tool", assign)
+    asyncio.run(rs.async_redis_client.flushall())
+    return sent, prompts, tool_calls
+
+
+def _turn(text):
+    asyncio.run(engine.handle_message(text, MANAGER, "pid"))
+
+
+def _slots():
+    session_id = rs.redis_client.get(f"user_active_session:91{MANAGER}")
+    return rs.get_session_slots(session_id)
+
+
+def test_duplicate_name_resolved_by_phone_reply(chat):
+    sent, prompts, tool_calls = chat
+
+    _turn("Assign report to Rahul by 7pm")
+    assert "RAHUL SHARMA" in sent[-1] and "RAHUL VERMA" in sent[-1]
+    # The ambiguous name must not be carried over as known information
+    assert "assignee" not in _slots()
+
+    _turn("9876543211")
+    known = prompts[-1].split("USER QUERY")[0]
+    assert '"assignee"' not in known and '"task_name"' in known
+    assert "*Assigned to:* Rahul Verma" in sent[-1]
+    assert _slots()["assignee"] == "919876543211"
+
+    _turn("yes")
+    assert tool_calls == [{"assignee": "919876543211", "task_name": "report", "deadline": "2099-01-01T19:00:00"}]
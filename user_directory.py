@@ -0,0 +1,393 @@
+"""
+Cached view of the users collection for the request path.
+
+Holds one OrgGraph built from a single users scan; team, role and
+hierarchy questions are answered from it without further MongoDB
+queries.
+
+Two cache tiers:
+  - in-process: the OrgGraph itself (subtrees and roles are derived
+    from it, so they need no entries of their own)
+  - shared: the raw user list in Redis under a key versioned by the
+    users_version document, so N uvicorn workers warming up cost one
+    MongoDB scan per version, not N. A SET NX lock per version keeps an
+    expiry under load from turning into a stampede of scans, and a scan
+    is only published if users_version did not move while it ran.
+
+Consistency across workers comes from watch_user_changes(): it tails a
+MongoDB change stream on `users` and patches the cached user set in
+place, and bumps users_version once per event so the next reload can't
+come from the pre-change shared copy (falling back to polling the
+users_version document when change streams are unavailable, e.g. on a
+standalone server). Only while the change stream is live does the cache
+live for USER_CACHE_MAX_AGE; otherwise — including version polling,
+which can't see writes that skip bump_users_version (register.py,
+migrate_users.py, seed scripts) — it expires after the short _CACHE_TTL.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pymongo.errors import OperationFailure
+
+import user_repository
+from org_graph import OrgGraph
+from name_index import NameIndex
+from redis_session import async_redis_client
+from singleflight import SingleFlight
+from user_resolver import normalize_phone, get_top_manager_phone
+
+logger = logging.getLogger(__name__)
+
+_CACHE_TTL = 120  # seconds — used unless a change stream is running
+USER_CACHE_MAX_AGE = int(os.getenv("USER_CACHE_MAX_AGE", 3600))  # safety net with a change stream
+USERS_VERSION_POLL_SECONDS = int(os.getenv("USERS_VERSION_POLL_SECONDS", 5))
+WATCH_RETRY_SECONDS = 5
+
+# Shared (Redis) tier. Writes that bypass user_repository don't bump
+# users_version, so keep the shared copy short-lived.
+USER_CACHE_REDIS_TTL = int(os.getenv("USER_CACHE_REDIS_TTL", 60))
+_LOAD_LOCK_MS = 10000        # max time one worker may hold the scan lock
+_LOAD_WAIT_SECONDS = 5       # how long others wait for it to publish
+_LOAD_POLL_SECONDS = 0.1
+_CHANGE_CLAIM_TTL = 300      # dedupes the per-event users_version bump across workers
+
+# Server error codes meaning "change streams are not supported here"
+_CHANGE_STREAM_UNSUPPORTED = {40573}
+
+_cache_lock = threading.Lock()
+_graph_cache: tuple = (None, 0.0)  # (OrgGraph, expiry_time)
+_users_by_id: Dict[str, Dict] = {}  # str(_id) -> user doc (without _id)
+_generation = 0                     # bumped on every change / invalidation
+_change_stream_active = False
+_rebuild_flight = SingleFlight("org_graph")  # one rebuild per process at a time
+
+# Per-manager name indexes, valid for one OrgGraph instance
+_NAME_INDEX_MAX = int(os.getenv("NAME_INDEX_CACHE_SIZE", 256))
+_name_indexes: "OrderedDict[str, NameIndex]" = OrderedDict()
+_name_index_graph: Optional[OrgGraph] = None
+
+
+def _now_ts() -> float:
+    return time.time()
+
+
+def _cache_ttl() -> float:
+    return USER_CACHE_MAX_AGE if _change_stream_active else _CACHE_TTL
+
+
+def invalidate_user_caches():
+    """Drop the cached org graph (call after add/delete user)."""
+    global _graph_cache, _generation
+    with _cache_lock:
+        _graph_cache = (None, 0.0)
+        _generation += 1
+
+
+async def get_org_graph() -> OrgGraph:
+    """Return the cached OrgGraph, rebuilding it when stale (one rebuild per process at a time)."""
+    with _cache_lock:
+        graph, expiry = _graph_cache
+        if graph is not None and _now_ts() < expiry:
+            return graph
+
+    if user_repository.async_users_collection is None:
+        logger.error("MongoDB connection cant be initialized")
+        return OrgGraph([])
+
+    return await _rebuild_flight.do("graph", lambda: _rebuild_org_graph(graph))
+
+
+async def _rebuild_org_graph(stale: Optional[OrgGraph]) -> OrgGraph:
+    global _graph_cache, _users_by_id
+    with _cache_lock:
+        generation = _generation
+
+    try:
+        docs = await _load_users()
+    except Exception as e:
+        logger.error(f"Failed to fetch users from MongoDB: {e}")
+        return stale if stale is not None else OrgGraph([])
+
+    users_by_id = {str(doc.pop("_id")): doc for doc in docs}
+    graph = OrgGraph(list(users_by_id.values()))
+    logger.info(f"Org graph rebuilt from {len(users_by_id)} users.")
+    with _cache_lock:
+        # A change that landed mid-scan may be missing from this snapshot;
+        # serve it for this call but don't cache it.
+        if generation == _generation:
+            _users_by_id = users_by_id
+            _graph_cache = (graph, _now_ts() + _cache_ttl())
+    return graph
+
+
+# ─── Shared tier ─────────────────────────────────────────────────────
+
+def _shared_users_key(version: int) -> str:
+    return f"user_directory:users:v{version}"
+
+
+def _shared_lock_key(version: int) -> str:
+    return f"user_directory:lock:v{version}"
+
+
+async def _read_shared(key: str) -> Optional[List[Dict]]:
+    try:
+        raw = await async_redis_client.get(key)
+    except Exception as e:
+        logger.warning(f"[USER_CACHE] Redis read failed: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+
+async def _load_users() -> List[Dict]:
+    """
+    The full user list (with _id as str), taken from the shared tier when
+    another worker already published it for the current users_version.
+    Only the holder of the per-version lock scans MongoDB; the rest wait
+    briefly for it to publish, then fall back to their own scan.
+    """
+    try:
+        version = await user_repository.get_users_version()
+    except Exception as e:
+        logger.warning(f"[USER_CACHE] users_version read failed, scanning directly: {e}")
+        version = None
+
+    if version is not None:
+        key = _shared_users_key(version)
+        cached = await _read_shared(key)
+        if cached is not None:
+            logger.info(f"[USER_CACHE] Shared tier hit (v{version}, {len(cached)} users)")
+            return cached
+
+        lock_key = _shared_lock_key(version)
+        token = uuid.uuid4().hex
+        try:
+            owns_lock = bool(await async_redis_client.set(lock_key, token, nx=True, px=_LOAD_LOCK_MS))
+        except Exception as e:
+            logger.warning(f"[USER_CACHE] Redis lock failed: {e}")
+            owns_lock, version = False, None  # Redis unusable — skip the shared tier
+
+        if version is not None and not owns_lock:
+            deadline = time.monotonic() + _LOAD_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(_LOAD_POLL_SECONDS)
+                cached = await _read_shared(key)
+                if cached is not None:
+                    return cached
+            logger.warning(f"[USER_CACHE] v{version} not published in time; scanning MongoDB")
+
+    docs = await user_repository.list_users(include_ids=True)
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+
+    if version is not None:
+        # Publish only a snapshot that no write overtook: if users_version
+        # moved during the scan, this list may predate the change
+        try:
+            # Bypass the single-flight: a shared read may have started before the scan
+            unchanged = await user_repository.get_users_version.__wrapped__() == version
+        except Exception as e:
+            logger.warning(f"[USER_CACHE] users_version re-read failed: {e}")
+            unchanged = False
+        try:
+            async with async_redis_client.pipeline(transaction=True) as pipe:
+                if unchanged:
+                    pipe.set(key, json.dumps(docs, default=str), ex=USER_CACHE_REDIS_TTL)
+                if owns_lock:
+                    pipe.delete(lock_key)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[USER_CACHE] Redis publish failed: {e}")
+        if not unchanged:
+            logger.info(f"[USER_CACHE] users_version moved during the v{version} scan; not published")
+    return docs
+
+
+# ─── Change propagation ──────────────────────────────────────────────
+
+def _apply_change(change: Dict):
+    """Patch the cached user set from one change-stream event."""
+    global _graph_cache, _generation
+    op = change.get("operationType")
+
+    with _cache_lock:
+        _generation += 1
+        graph, _ = _graph_cache
+        if graph is None:
+            return  # nothing cached — next access loads fresh
+
+        if op in ("insert", "update", "replace") and change.get("fullDocument"):
+            doc = dict(change["fullDocument"])
+            _users_by_id[str(doc.pop("_id"))] = doc
+        elif op == "delete":
+            _users_by_id.pop(str(change["documentKey"]["_id"]), None)
+        else:
+            # drop / rename / invalidate or update without a post-image
+            _graph_cache = (None, 0.0)
+            return
+
+        # In-memory rebuild only — no MongoDB round-trip
+        _graph_cache = (OrgGraph(list(_users_by_id.values())), _now_ts() + _cache_ttl())
+
+    logger.info(f"[USER_CACHE] Applied {op} from change stream")
+
+
+async def _retire_shared_tier(change: Dict):
+    """
+    Move users_version past a change the stream delivered, so no worker
+    reloads the pre-change list from the shared tier. One bump per event
+    across all workers: the first to claim the event's resume token does it.
+    """
+    token = (change.get("_id") or {}).get("_data")
+    if not token:
+        return
+    try:
+        claimed = await async_redis_client.set(f"user_directory:change:{token}", 1, nx=True, ex=_CHANGE_CLAIM_TTL)
+    except Exception as e:
+        logger.warning(f"[USER_CACHE] Change claim failed, bumping users_version anyway: {e}")
+        claimed = True
+    if claimed:
+        try:
+            await user_repository.bump_users_version()
+        except Exception as e:
+            logger.warning(f"[USER_CACHE] users_version bump failed: {e}")
+
+
+async def _poll_users_version():
+    """
+    Fallback: invalidate whenever the users_version document moves. The
+    short _CACHE_TTL stays in force — writes that don't bump the version
+    are only picked up on expiry.
+    """
+    last_version = None
+    while True:
+        try:
+            version = await user_repository.get_users_version()
+            if last_version is not None and version != last_version:
+                logger.info(f"[USER_CACHE] users_version {last_version} → {version}; invalidating")
+                invalidate_user_caches()
+            last_version = version
+        except Exception as e:
+            logger.warning(f"[USER_CACHE] users_version poll failed: {e}")
+        await asyncio.sleep(USERS_VERSION_POLL_SECONDS)
+
+
+async def watch_user_changes():
+    """
+    Long-running task: keep the cache consistent with the users collection.
+    Resumes the change stream after transient errors; switches to version
+    polling if the deployment does not support change streams.
+    """
+    global _change_stream_active
+    collection = user_repository.async_users_collection
+    if collection is None:
+        return
+
+    resume_token = None
+    while True:
+        try:
+            async with await collection.watch(
+                full_document="updateLookup",
+                resume_after=resume_token
+            ) as stream:
+                _change_stream_active = True
+                logger.info("[USER_CACHE] Subscribed to users change stream")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    _apply_change(change)
+                    await _retire_shared_tier(change)
+        except asyncio.CancelledError:
+            _change_stream_active = False
+            raise
+        except OperationFailure as e:
+            _change_stream_active = False
+            if e.code in _CHANGE_STREAM_UNSUPPORTED:
+                logger.warning("[USER_CACHE] Change streams unavailable — polling users_version instead")
+                await _poll_users_version()
+                return
+            logger.warning(f"[USER_CACHE] Change stream failed ({e.code}): {e}")
+            resume_token = None
+            invalidate_user_caches()
+        except Exception as e:
+            _change_stream_active = False
+            logger.warning(f"[USER_CACHE] Change stream interrupted: {e}")
+            invalidate_user_caches()
+        await asyncio.sleep(WATCH_RETRY_SECONDS)
+
+
+def start_user_change_watcher() -> Optional[asyncio.Task]:
+    """Schedule watch_user_changes() on the running loop (call at startup)."""
+    if user_repository.async_users_collection is None:
+        return None
+    return asyncio.create_task(watch_user_changes())
+
+
+# ─── Request-path helpers ────────────────────────────────────────────
+
+async def load_team() -> List[Dict]:
+    """ALL users (global list)."""
+    return (await get_org_graph()).users
+
+
+async def get_team_for_user(user_phone: str) -> List[Dict]:
+    """ALL users below this phone in the hierarchy."""
+    return (await get_org_graph()).subordinates(user_phone)
+
+
+async def resolve_role(user_phone: str) -> str:
+    """'manager' if anyone reports to this user (or they are the top manager), else 'employee'."""
+    phone = normalize_phone(user_phone)
+    if phone == get_top_manager_phone():
+        return "manager"
+    return "manager" if (await get_org_graph()).has_reports(phone) else "employee"
+
+
+async def is_subordinate(superior_phone: str, target_phone: str) -> bool:
+    """True if `target_phone` sits anywhere below `superior_phone`."""
+    sup = normalize_phone(superior_phone)
+    tgt = normalize_phone(target_phone)
+    if sup == tgt:
+        return False
+    # Top-manager shortcut — they are above everyone
+    if sup == get_top_manager_phone():
+        return True
+    return (await get_org_graph()).is_subordinate(sup, tgt)
+
+
+async def get_name_index(user_phone: str) -> NameIndex:
+    """
+    Name index over the user's subordinates plus the user themselves
+    (self-assignment). Rebuilt lazily whenever the org graph changes.
+    """
+    global _name_index_graph
+    graph = await get_org_graph()
+    phone = normalize_phone(user_phone)
+    with _cache_lock:
+        if _name_index_graph is not graph:
+            _name_indexes.clear()
+            _name_index_graph = graph
+        index = _name_indexes.get(phone)
+        if index is not None:
+            _name_indexes.move_to_end(phone)
+            return index
+
+    members = graph.subordinates(phone)
+    me = graph.get(phone)
+    if me is not None:
+        members = members + [me]
+    index = NameIndex(members)
+
+    with _cache_lock:
+        if _name_index_graph is graph:
+            _name_indexes[phone] = index
+            while len(_name_indexes) > _NAME_INDEX_MAX:
+                _name_indexes.popitem(last=False)
+    return index
@@ -0,0 +1,116 @@
+"""
+Async data-access layer for the `users` collection.
+
+Built on PyMongo's native async client (AsyncMongoClient), so user lookups
+run on the event loop instead of occupying the default thread pool via
+asyncio.to_thread. Every user lookup goes through here (single-flighted
+where concurrent callers ask the same thing); user_resolver.py only holds
+the phone helpers.
+"""
+
+import os
+import logging
+from typing import Optional, Dict, List
+
+import certifi
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+from user_resolver import normalize_phone
+from singleflight import singleflight
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+
+async_client = (
+    AsyncMongoClient(MONGO_URI, tlsCAFile=certifi.where(), maxPoolSize=MONGO_MAX_POOL_SIZE)
+    if MONGO_URI else None
+)
+async_db = async_client["ai_task_manager"] if async_client is not None else None
+async_users_collection = async_db["users"] if async_db is not None else None
+# Holds {"_id": "users_version", "version": n}; bumped on every user write so
+# replicas without change streams can detect changes by polling.
+async_meta_collection = async_db["meta"] if async_db is not None else None
+USERS_VERSION_ID = "users_version"
+
+_NO_ID = {"_id": 0}
+
+
+# ─── Lookups ─────────────────────────────────────────────────────────
+# Concurrent identical lookups share one query (see singleflight.py);
+# returned documents are shared between those callers — don't mutate them.
+
+@singleflight(key=lambda phone: normalize_phone(phone))
+async def find_user_by_phone(phone: str) -> Optional[Dict]:
+    if async_users_collection is None:
+        return None
+    return await async_users_collection.find_one({"phone": normalize_phone(phone)}, _NO_ID)
+
+
+@singleflight()
+async def find_user_by_login_code(login_code: str) -> Optional[Dict]:
+    if async_users_collection is None:
+        return None
+    return await async_users_collection.find_one({"login_code": login_code}, _NO_ID)
+
+
+async def find_users_by_login_codes(login_codes: List[str]) -> Dict[str, Dict]:
+    """login_code -> user for every code found, in one $in query."""
+    codes = [c for c in dict.fromkeys(login_codes) if c]
+    if async_users_collection is None or not codes:
+        return {}
+    docs = await async_users_collection.find({"login_code": {"$in": codes}}, _NO_ID).to_list(None)
+    return {doc["login_code"]: doc for doc in docs}
+
+
+async def list_users(include_ids: bool = False) -> List[Dict]:
+    """Every user document (without _id unless include_ids)."""
+    if async_users_collection is None:
+        return []
+    projection = None if include_ids else _NO_ID
+    return await async_users_collection.find({}, projection).to_list(None)
+
+
+@singleflight()
+async def get_users_version() -> int:
+    if async_meta_collection is None:
+        return 0
+    doc = await async_meta_collection.find_one({"_id": USERS_VERSION_ID})
+    return int(doc.get("version", 0)) if doc else 0
+
+
+async def bump_users_version() -> None:
+    if async_meta_collection is None:
+        return
+    await async_meta_collection.update_one(
+        {"_id": USERS_VERSION_ID},
+        {"$inc": {"version": 1}},
+        upsert=True
+    )
+
+
+# ─── Writes ──────────────────────────────────────────────────────────
+
+async def upsert_user(user: Dict) -> None:
+    """Insert or update a user keyed by phone."""
+    if async_users_collection is None:
+        return
+    await async_users_collection.update_one(
+        {"phone": user["phone"]},
+        {"$set": user},
+        upsert=True
+    )
+    await bump_users_version()
+
+
+async def delete_user_by_phone(phone: str) -> bool:
+    if async_users_collection is None:
+        return False
+    res = await async_users_collection.delete_one({"phone": normalize_phone(phone)})
+    if res.deleted_count:
+        await bump_users_version()
+    return res.deleted_count > 0
@@ -5,7 +5,8 @@ import logging
 from dotenv import load_dotenv
 from google_auth_oauthlib.flow import Flow
 from engine import handle_message, SCOPES, REDIRECT_URI
-from redis_session import redis_client  # Leverage existing Redis connection
+from redis_session import async_redis_client  # Shared asyncio Redis pool
+from user_directory import start_user_change_watcher
 
 
 async def _safe_handle(command, sender, pid, message_data, full_message):
@@ -54,6 +55,13 @@ PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 DEDUPLICATION_TTL = 86400 
 
 
+@app.on_event("startup")
+async def start_background_watchers():
+    # Keeps the in-process user/org cache in sync with MongoDB writes
+    # made by other workers (change stream, or users_version polling).
+    start_user_change_watcher()
+
+
 @app.get("/")
 async def home():
     return {"message": "WhatsApp Task Bot is running"}
@@ -99,7 +107,7 @@ async def handle_webhook(request: Request):
                 # --- ATOMIC DEDUPLICATION CHECK USING REDIS ---
                 # setnx (Set if Not Exists) returns 1 if key is new, 0 if it already exists
                 dedup_key = f"processed_msg:{msg_id}"
-                is_new = redis_client.set(dedup_key, "1", ex=DEDUPLICATION_TTL, nx=True)
+                is_new = await async_redis_client.set(dedup_key, "1", ex=DEDUPLICATION_TTL, nx=True)
                 
                 if not is_new:
                     logger.info(f"Duplicate message ignored: {msg_id}")